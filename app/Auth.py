@@ -1,21 +1,39 @@
 from typing import Annotated
+import asyncio
 import jwt
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from datetime import datetime, timedelta, timezone
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-from sqlmodel import select
-from models import Usuario
+from models.types import UserType
 from passlib.context import CryptContext
-from app.db import SessionDep
+from pydantic import BaseModel, ConfigDict
+from app.db import AsyncSessionDep
+from app.cache import TTLCache
+from uuid import UUID, uuid4
 import os
 
 SECRET_KEY = os.getenv("JWT_SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Caché de usuarios autenticados por subject del token
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "1024"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Costo de bcrypt; al cambiarlo los hashes antiguos se actualizan en el siguiente login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+# bcrypt es CPU intensivo: se ejecuta en un pool acotado para no bloquear el event loop
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "4"))
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", "64"))
+hash_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_pending = 0
 
 def verify_password(plain_password: str, hashed_password: str):
     return pwd_context.verify(plain_password, hashed_password)
@@ -23,13 +41,39 @@ def verify_password(plain_password: str, hashed_password: str):
 def get_password_hash(password: str):
     return pwd_context.hash(password)
 
+async def run_hash_task(func, *args):
+    """
+    Ejecuta una operación de bcrypt en el pool dedicado.
+    Si la cola supera HASH_MAX_PENDING responde 429 en lugar de acumular más espera.
+    """
+    global _hash_pending
+    if _hash_pending >= HASH_MAX_PENDING:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Demasiadas solicitudes de autenticación. Intente nuevamente en unos segundos.",
+            headers={"Retry-After": "1"},
+        )
+    _hash_pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(hash_executor, partial(func, *args))
+    finally:
+        _hash_pending -= 1
+
+async def get_password_hash_async(password: str) -> str:
+    return await run_hash_task(pwd_context.hash, password)
+
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """Verifica la contraseña y devuelve un nuevo hash si el actual usa un costo distinto al configurado"""
+    return await run_hash_task(pwd_context.verify_and_update, plain_password, hashed_password)
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.now(timezone.utc) + expires_delta
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)  # Short-lived access token
-    to_encode.update({"exp": expire, "type": "access"})
+    to_encode.update({"exp": expire, "type": "access", "jti": uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -59,7 +103,7 @@ def decode_token(token: str):
 def create_refresh_token(data: dict):
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(days=7)  # Refresh token expires in 7 days
-    to_encode.update({"exp": expire, "type": "refresh"})
+    to_encode.update({"exp": expire, "type": "refresh", "jti": uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -85,12 +129,29 @@ def decode_refresh_token(token: str):
             detail="Refresh token inválido",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+class Principal(BaseModel):
+    """
+    Usuario autenticado que devuelve get_current_user. Es una copia inmutable de los datos que usan
+    los endpoints (no un objeto ORM), por lo que se puede compartir entre requests desde la caché.
+    """
+    model_config = ConfigDict(frozen=True)
+
+    id: UUID
+    email: str
+    tipo: UserType
+    bloqueado: bool = False
+
+def invalidate_principal(user_id: UUID):
+    """Descarta el usuario de la caché para que el próximo request vuelva a validarlo en la base de datos"""
+    principal_cache.discard_if(lambda principal: principal.id == user_id)
         
 async def get_current_user(
-    session: SessionDep,
+    session: AsyncSessionDep,
     token: Annotated[str, Depends(oauth2_scheme)]
 ):
     from services.UsuarioService import UsuarioService
+    from services.TokenBlacklistService import TokenBlacklistService
     
     cretendials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -103,16 +164,32 @@ async def get_current_user(
     if not email:
         raise cretendials_exception
     
-    user = session.exec(select(Usuario).where(Usuario.email == email)).first()
-    if not user:
-        raise cretendials_exception
+    # Tokens revocados por logout; el filtro en memoria evita la consulta en el caso común
+    if await TokenBlacklistService.esta_revocado(session, payload):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token revocado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    principal = principal_cache.get(email)
+    if not principal:
+        user = await UsuarioService.get_by_email(session, email)
+        if not user:
+            raise cretendials_exception
+        bloqueo = await UsuarioService.get_active_block(session, user.id)
+        principal = Principal(id=user.id, email=user.email, tipo=user.tipo, bloqueado=bloqueo is not None)
+        # Un bloqueo temporal no queda en caché más allá de su fecha de desbloqueo
+        ttl = None
+        if bloqueo and bloqueo.fecha_desbloqueo:
+            ttl = min(principal_cache.ttl, (bloqueo.fecha_desbloqueo - datetime.now()).total_seconds())
+        principal_cache.set(email, principal, ttl=ttl)
     
     # Validar que el usuario no esté bloqueado
-    if not UsuarioService.isActive(session, user.id):
+    if principal.bloqueado:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Usuario bloqueado. Contacte al administrador.",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
-    return user
\ No newline at end of file
+    return principal
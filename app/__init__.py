@@ -1,10 +1,15 @@
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from controllers.Media import MEDIA_DIR
-from .db import create_db_and_tables
+from controllers.Media import media_app
+from .db import create_db_and_tables, engine
+from .Auth import hash_executor
+from controllers.Imagenes import shutdown_executor as shutdown_image_executor
+from controllers.MercadoPago import cerrar_mp_client
+from controllers.Broadcast import cerrar_broadcast, iniciar_broadcast
 from views import routers
+from services.WebhookService import WebhookService
+from services.TokenBlacklistService import TokenBlacklistService
 
 origins = [
     "http://www.reservio.space",
@@ -19,14 +24,24 @@ origins = [
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Code to run at startup
-    create_db_and_tables()
+    await create_db_and_tables()
+    await iniciar_broadcast()
+    await TokenBlacklistService.iniciar()
+    WebhookService.iniciar_workers()
     yield
     # Code to run at shutdown
+    await WebhookService.detener_workers()
+    await TokenBlacklistService.detener()
+    await engine.dispose()
+    hash_executor.shutdown(wait=False)
+    shutdown_image_executor()
+    await cerrar_mp_client()
+    await cerrar_broadcast()
 
 def create_app() -> FastAPI:
     app = FastAPI(lifespan=lifespan)
     # Register routers
-    app.mount("/media", StaticFiles(directory=MEDIA_DIR), name="media")
+    app.mount("/media", media_app(), name="media")
     for router in routers:
         app.include_router(router)
     app.add_middleware(
@@ -35,5 +50,6 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "ETag", "Accept-Ranges", "Content-Range"],
     )
     return app
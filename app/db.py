@@ -1,17 +1,124 @@
 import os
+import time
+import threading
 from typing import Annotated
 from fastapi import Depends
-from sqlmodel import SQLModel, Session, create_engine
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 db_url = os.getenv("DATABASE_URL")
 
-engine = create_engine(db_url, echo=True) # Desactivar el echo para producción
+# Configuración del pool de conexiones (dimensionar contra max_connections de MySQL)
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # Menor que wait_timeout de MySQL
 
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+# Drivers asíncronos equivalentes a los drivers síncronos del DATABASE_URL
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
 
-def get_session():
-    with Session(engine) as session:
+def get_async_url(url: str) -> str:
+    """Convierte un DATABASE_URL síncrono (p. ej. mysql+pymysql) a su driver asíncrono"""
+    parsed = make_url(url)
+    drivername = ASYNC_DRIVERS.get(parsed.drivername, parsed.drivername)
+    return parsed.set(drivername=drivername).render_as_string(hide_password=False)
+
+class PoolMetrics:
+    """Contadores de uso del pool: checkouts, timeouts y tiempo de espera por conexión"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, wait: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            atendidas = self.checkouts + self.timeouts
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(self.wait_total / atendidas * 1000, 3) if atendidas else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+            }
+
+pool_metrics = PoolMetrics()
+
+class MeteredPool(AsyncAdaptedQueuePool):
+    """Pool que mide el tiempo que cada petición espera por una conexión"""
+
+    def connect(self):
+        inicio = time.perf_counter()
+        try:
+            conexion = super().connect()
+        except exc.TimeoutError:
+            pool_metrics.record(time.perf_counter() - inicio, timed_out=True)
+            raise
+        pool_metrics.record(time.perf_counter() - inicio)
+        return conexion
+
+def get_engine_options(url: str) -> dict:
+    """Opciones del engine según el backend; SQLite en memoria usa su propio pool estático"""
+    opciones = {"echo": DB_ECHO, "pool_pre_ping": True}
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        return opciones
+    opciones.update(
+        poolclass=MeteredPool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+    return opciones
+
+engine = create_async_engine(get_async_url(db_url), **get_engine_options(db_url))
+
+def get_pool_status() -> dict:
+    """Estado actual del pool y contadores acumulados"""
+    pool = engine.pool
+    estado = {"pool": type(pool).__name__, **pool_metrics.snapshot()}
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        estado.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "max_overflow": DB_MAX_OVERFLOW,
+            "timeout": DB_POOL_TIMEOUT,
+            "recycle": DB_POOL_RECYCLE,
+        })
+    return estado
+
+# expire_on_commit=False: en modo asíncrono no se puede recargar un atributo de forma implícita
+async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+async def create_db_and_tables():
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+async def get_async_session():
+    async with async_session() as session:
         yield session
 
-SessionDep = Annotated[Session, Depends(get_session)]
\ No newline at end of file
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_session)]
@@ -0,0 +1,47 @@
+"""
+Broker pub/sub mínimo para compartir mensajes entre workers (por ejemplo, uvicorn --workers 4)
+Protocolo: una línea JSON por mensaje sobre TCP
+  {"op": "sub" | "unsub", "canal": "..."}
+  {"op": "pub", "canal": "...", "mensaje": {...}}  → se reenvía como {"canal", "mensaje"}
+Ejecutar con: python broker_local.py [puerto]
+y configurar BROADCAST_URL="tcp://127.0.0.1:8765"
+"""
+
+import asyncio
+import json
+import sys
+from collections import defaultdict
+
+async def iniciar_broker(host: str = "127.0.0.1", puerto: int = 8765) -> asyncio.Server:
+    canales: dict[str, set[asyncio.StreamWriter]] = defaultdict(set)
+
+    async def atender(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while linea := await reader.readline():
+                datos = json.loads(linea)
+                canal = datos["canal"]
+                if datos["op"] == "sub":
+                    canales[canal].add(writer)
+                elif datos["op"] == "unsub":
+                    canales[canal].discard(writer)
+                elif datos["op"] == "pub":
+                    salida = json.dumps({"canal": canal, "mensaje": datos["mensaje"]}).encode() + b"\n"
+                    for destino in list(canales.get(canal, ())):
+                        destino.write(salida)
+        except (ConnectionError, ValueError, KeyError):
+            pass
+        finally:
+            for suscritos in canales.values():
+                suscritos.discard(writer)
+            writer.close()
+
+    return await asyncio.start_server(atender, host, puerto)
+
+async def main(puerto: int):
+    server = await iniciar_broker(puerto=puerto)
+    print(f"Broker escuchando en 127.0.0.1:{puerto}")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 8765))
@@ -0,0 +1,83 @@
+"""
+Fixtures compartidas por los tests: base SQLite en memoria con contador de consultas SQL
+y cliente de la API apuntando a esa base.
+"""
+
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+# Agregar el directorio del proyecto al path
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("JWT_SECRET_KEY", "clave-de-pruebas-con-al-menos-32-bytes")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")  # Costo mínimo de bcrypt: los tests no miden el hash
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import create_app  # Importa views y servicios en el orden que evita importaciones circulares
+from app.db import get_async_session
+
+
+class BaseDePrueba:
+    """Base SQLite en memoria con las tablas creadas; guarda en consultas cada sentencia ejecutada"""
+
+    def __init__(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        self.session_maker = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        self.consultas: list[str] = []
+        event.listen(self.engine.sync_engine, "before_cursor_execute", self._registrar)
+        self.ejecutar(self._crear_tablas)
+
+    def _registrar(self, conn, cursor, statement, parameters, context, executemany):
+        self.consultas.append(statement)
+
+    async def _crear_tablas(self, session_maker):
+        async with self.engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+
+    def ejecutar(self, prueba):
+        """Ejecuta la corrutina prueba(session_maker) y devuelve su resultado"""
+        return asyncio.run(prueba(self.session_maker))
+
+    def cerrar(self):
+        asyncio.run(self.engine.dispose())
+
+
+@pytest.fixture
+def base_datos():
+    base = BaseDePrueba()
+    yield base
+    base.cerrar()
+
+
+@pytest.fixture
+def cliente(base_datos):
+    """Cliente de la API (sin lifespan) cuyas sesiones usan base_datos"""
+    async def get_session_test():
+        async with base_datos.session_maker() as session:
+            yield session
+
+    aplicacion = create_app()
+    aplicacion.dependency_overrides[get_async_session] = get_session_test
+    return TestClient(aplicacion)
+
+
+@pytest.fixture
+def autenticado(cliente):
+    """Cabeceras de un usuario registrado y con sesión iniciada en cliente"""
+    usuario = dict(
+        email="usuario@reservio.cl", rut="9-9", nombres="Nombre", appaterno="Paterno",
+        apmaterno="Materno", fecha_nacimiento="1990-01-01", password="clave-segura"
+    )
+    assert cliente.post("/auth/register", json=usuario).status_code == 200
+    response = cliente.post("/auth/login", data={"username": usuario["email"], "password": usuario["password"]})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
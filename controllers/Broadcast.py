@@ -0,0 +1,154 @@
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+import asyncio
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# memory:// = solo dentro del proceso; tcp://host:puerto = broker_local.py, compartido entre workers
+BROADCAST_URL = os.getenv("BROADCAST_URL", "memory://")
+BROADCAST_COLA = int(os.getenv("BROADCAST_COLA", "100"))  # Mensajes pendientes por suscriptor
+
+class Broadcast:
+    """
+    Pub/sub de mensajes JSON por canal. Cada suscripción es una cola local; si un suscriptor
+    lento llena su cola se descartan sus mensajes más antiguos.
+    Esta implementación solo entrega dentro del proceso.
+    """
+
+    def __init__(self):
+        self._suscriptores: dict[str, set[asyncio.Queue]] = defaultdict(set)
+
+    async def conectar(self):
+        pass
+
+    async def desconectar(self):
+        pass
+
+    async def publicar(self, canal: str, mensaje: dict):
+        self._entregar(canal, mensaje)
+
+    @asynccontextmanager
+    async def suscribir(self, canal: str):
+        cola: asyncio.Queue = asyncio.Queue(maxsize=BROADCAST_COLA)
+        primera = not self._suscriptores[canal]
+        self._suscriptores[canal].add(cola)
+        try:
+            if primera:
+                await self._al_suscribir(canal)
+            yield cola
+        finally:
+            self._suscriptores[canal].discard(cola)
+            if not self._suscriptores[canal]:
+                del self._suscriptores[canal]
+                await self._al_desuscribir(canal)
+
+    def _entregar(self, canal: str, mensaje: dict):
+        for cola in list(self._suscriptores.get(canal, ())):
+            if cola.full():
+                cola.get_nowait()
+            cola.put_nowait(mensaje)
+
+    async def _al_suscribir(self, canal: str):
+        pass
+
+    async def _al_desuscribir(self, canal: str):
+        pass
+
+class BrokerBroadcast(Broadcast):
+    """
+    Pub/sub entre procesos a través de broker_local.py (una línea JSON por mensaje sobre TCP).
+    Lo publicado vuelve desde el broker a todos los procesos suscritos al canal, incluido este.
+    Si se pierde la conexión se reconecta y renueva las suscripciones; lo publicado mientras
+    tanto se entrega solo localmente.
+    """
+
+    def __init__(self, host: str, puerto: int):
+        super().__init__()
+        self.host = host
+        self.puerto = puerto
+        self._writer: asyncio.StreamWriter | None = None
+        self._lector: asyncio.Task | None = None
+        self._conectado = asyncio.Event()
+
+    async def conectar(self):
+        self._lector = asyncio.create_task(self._leer())
+        try:
+            await asyncio.wait_for(self._conectado.wait(), 5)
+        except asyncio.TimeoutError:
+            logger.warning("No se pudo conectar al broker %s:%s; se reintentará", self.host, self.puerto)
+
+    async def desconectar(self):
+        if self._lector:
+            self._lector.cancel()
+            await asyncio.gather(self._lector, return_exceptions=True)
+        if self._writer:
+            self._writer.close()
+
+    async def _enviar(self, datos: dict) -> bool:
+        if self._writer is None:
+            return False
+        try:
+            self._writer.write(json.dumps(datos).encode() + b"\n")
+            await self._writer.drain()
+            return True
+        except (ConnectionError, OSError):
+            return False
+
+    async def publicar(self, canal, mensaje):
+        if not await self._enviar({"op": "pub", "canal": canal, "mensaje": mensaje}):
+            logger.warning("Broker no disponible: el mensaje de %s se entrega solo en este proceso", canal)
+            self._entregar(canal, mensaje)
+
+    async def _al_suscribir(self, canal):
+        await self._enviar({"op": "sub", "canal": canal})
+
+    async def _al_desuscribir(self, canal):
+        await self._enviar({"op": "unsub", "canal": canal})
+
+    async def _leer(self):
+        espera = 0.5
+        while True:
+            try:
+                reader, self._writer = await asyncio.open_connection(self.host, self.puerto)
+                for canal in list(self._suscriptores):
+                    await self._enviar({"op": "sub", "canal": canal})
+                self._conectado.set()
+                espera = 0.5
+                while linea := await reader.readline():
+                    datos = json.loads(linea)
+                    self._entregar(datos["canal"], datos["mensaje"])
+            except (ConnectionError, OSError, ValueError) as e:
+                logger.warning("Conexión con el broker %s:%s perdida: %s", self.host, self.puerto, e)
+            self._conectado.clear()
+            self._writer = None
+            await asyncio.sleep(espera)
+            espera = min(espera * 2, 10)
+
+_broadcast: Broadcast | None = None
+
+def crear_broadcast(url: str) -> Broadcast:
+    partes = urlparse(url)
+    if partes.scheme == "memory":
+        return Broadcast()
+    if partes.scheme == "tcp":
+        return BrokerBroadcast(partes.hostname or "127.0.0.1", partes.port or 8765)
+    raise RuntimeError(f"BROADCAST_URL desconocida: {url}")
+
+def get_broadcast() -> Broadcast:
+    global _broadcast
+    if _broadcast is None:
+        _broadcast = crear_broadcast(BROADCAST_URL)
+    return _broadcast
+
+async def iniciar_broadcast():
+    await get_broadcast().conectar()
+
+async def cerrar_broadcast():
+    global _broadcast
+    if _broadcast is not None:
+        await _broadcast.desconectar()
+        _broadcast = None
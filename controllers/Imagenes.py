@@ -0,0 +1,116 @@
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import logging
+import mimetypes
+import multiprocessing
+import os
+import uuid
+
+from controllers.Storage import clave_media, get_storage, ruta_media_clave
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow es opcional: sin él solo se guardan los originales
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Ancho máximo de cada variante; se generan en JPEG y WebP
+VARIANTES = {
+    "thumb": 320,
+    "medium": 800,
+    "large": 1600,
+}
+CALIDAD_JPEG = 82
+CALIDAD_WEBP = 80
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+_executor: ProcessPoolExecutor | None = None
+
+def get_executor() -> ProcessPoolExecutor:
+    """Pool de procesos para el redimensionado (CPU intensivo), creado al primer uso"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def nombres_derivados(base: str) -> dict[str, str]:
+    """Nombres de las variantes de una imagen (<base>.webp, <base>_<variante>.jpg / .webp)"""
+    derivados = {"original_webp": f"{base}.webp"}
+    for nombre in VARIANTES:
+        derivados[nombre] = f"{base}_{nombre}.jpg"
+        derivados[f"{nombre}_webp"] = f"{base}_{nombre}.webp"
+    return derivados
+
+def guardar_imagen(imagen, destino: str, formato: str, **opciones):
+    """
+    Guarda la imagen en un temporal junto al destino y lo renombra: el archivo puede estar
+    en el directorio servido y nunca debe verse a medio escribir.
+    """
+    temporal = f"{destino}.{uuid.uuid4().hex}.tmp"
+    try:
+        imagen.save(temporal, formato, **opciones)
+        os.replace(temporal, destino)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+def generar_derivados(ruta: str) -> dict[str, str]:
+    """
+    Genera las variantes de una imagen local junto al archivo (ver nombres_derivados).
+    Se ejecuta en un proceso del pool. Devuelve {"<variante>": ruta local}.
+    """
+    base, _ = os.path.splitext(ruta)
+    derivados = nombres_derivados(base)
+    with Image.open(ruta) as original:
+        imagen = ImageOps.exif_transpose(original).convert("RGB")
+        if ruta != derivados["original_webp"]:
+            guardar_imagen(imagen, derivados["original_webp"], "WEBP", quality=CALIDAD_WEBP)
+        for nombre, ancho in VARIANTES.items():
+            variante = imagen.copy()
+            variante.thumbnail((ancho, ancho * 4))
+            guardar_imagen(variante, derivados[nombre], "JPEG", quality=CALIDAD_JPEG, optimize=True)
+            guardar_imagen(variante, derivados[f"{nombre}_webp"], "WEBP", quality=CALIDAD_WEBP)
+    return derivados
+
+async def derivar(ruta: str) -> dict[str, str]:
+    """
+    Genera y guarda en el almacenamiento las variantes de una imagen ("media/<clave>").
+    Los originales se guardan por contenido: si otra propiedad ya subió la misma imagen,
+    sus variantes existen y se reutilizan.
+    """
+    storage = get_storage()
+    clave = clave_media(ruta)
+    if clave is None:
+        raise ValueError(f"Ruta fuera del almacenamiento de media: {ruta}")
+    claves = nombres_derivados(os.path.splitext(clave)[0])
+    existentes = await asyncio.gather(*(storage.existe(c) for c in claves.values()))
+    if not all(existentes):
+        async with storage.archivo_local(clave) as local:
+            loop = asyncio.get_running_loop()
+            locales = await loop.run_in_executor(get_executor(), generar_derivados, local)
+            for nombre, archivo in locales.items():
+                if archivo != local:
+                    await storage.guardar(claves[nombre], archivo, content_type=mimetypes.guess_type(archivo)[0])
+    return {nombre: ruta_media_clave(c) for nombre, c in claves.items()}
+
+async def procesar_derivados(rutas: list[str]) -> dict[str, dict[str, str]]:
+    """Genera las variantes de varias imágenes en paralelo; las que fallan se omiten"""
+    if Image is None:
+        logger.warning("Pillow no está instalado: no se generan variantes de imágenes")
+        return {}
+    resultados = await asyncio.gather(*(derivar(ruta) for ruta in rutas), return_exceptions=True)
+    variantes = {}
+    for ruta, resultado in zip(rutas, resultados):
+        if isinstance(resultado, Exception):
+            logger.warning("No se pudieron generar variantes de %s: %s", ruta, resultado)
+        else:
+            variantes[ruta] = resultado
+    return variantes
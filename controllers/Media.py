@@ -1,16 +1,262 @@
 from fastapi import UploadFile, File
-import shutil
+from fastapi.staticfiles import StaticFiles
+from starlette.staticfiles import NotModifiedResponse
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.responses import FileResponse, RedirectResponse, Response
+from starlette.routing import Route, Router
+from starlette.types import Scope
+import asyncio
+import gzip
+import hashlib
+import mimetypes
 import os
+import re
+import uuid
+
+from controllers.Imagenes import nombres_derivados
+from controllers.Storage import MEDIA_DIR, S3_PRESIGN_EXPIRES, FileSystemStorage, clave_media, get_storage, ruta_media_clave
 
-MEDIA_DIR = "media"
 if not os.path.exists(MEDIA_DIR):
     os.makedirs(MEDIA_DIR)
-    
-def upload_image(folder: str, file: UploadFile = File(...)):
-    folder_path = os.path.join(MEDIA_DIR, folder)
-    if not os.path.exists(folder_path):
-        os.makedirs(folder_path)
-    file_location = os.path.join(folder_path, file.filename)
-    with open(file_location, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    return {"filename": file.filename, "folder": folder}
\ No newline at end of file
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se generan copias .gz
+    brotli = None
+
+# Los archivos se guardan por su contenido: media/<colección>/<2 primeros caracteres>/<sha256>.<ext>
+BLOBS_DIR = "blobs"  # Fotos de propiedades y sus variantes
+DOCS_DIR = "docs"    # Documentos de propiedades
+CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(20 * 1024 * 1024)))  # Bytes por archivo
+
+# Cache-Control por prefijo de ruta dentro de media/. Las colecciones por contenido nunca cambian;
+# los documentos son privados. Las rutas antiguas (media/<propiedad>/...) se podían sobrescribir.
+CACHE_POLICIES = {
+    BLOBS_DIR: os.getenv("MEDIA_CACHE_IMAGENES", "public, max-age=31536000, immutable"),
+    DOCS_DIR: os.getenv("MEDIA_CACHE_DOCUMENTOS", "private, max-age=31536000, immutable"),
+}
+CACHE_DEFAULT = os.getenv("MEDIA_CACHE_DEFAULT", "public, max-age=3600")
+
+# Documentos de texto que se guardan también precomprimidos (<archivo>.br / <archivo>.gz)
+EXTENSIONES_COMPRIMIBLES = {".txt", ".csv", ".json", ".xml", ".html", ".svg", ".md"}
+
+class ArchivoDemasiadoGrande(ValueError):
+    """El archivo supera MAX_UPLOAD_SIZE"""
+
+def extension_segura(filename: str | None) -> str:
+    ext = os.path.splitext(filename or "")[1].lower()
+    return ext if re.fullmatch(r"\.[a-z0-9]{1,10}", ext) else ""
+
+def clave_blob(folder: str, digest: str, extension: str) -> str:
+    return f"{folder}/{digest[:2]}/{digest}{extension}"
+
+class ArchivoRecibido:
+    """
+    Archivo subido que ya está en un temporal local, con su hash y tamaño, pero todavía no en el
+    almacenamiento. Quien lo recibe registra primero la referencia (MediaService.retener) y lo
+    coloca después: así borrar_huerfanas no puede eliminarlo entre la copia y el commit.
+    """
+
+    def __init__(self, clave: str, temporal: str, content_type: str | None, copias: list[tuple[str, str]], digest: str, size: int):
+        self.clave = clave
+        self.temporal = temporal
+        self.content_type = content_type
+        self.copias = copias
+        folder, filename = clave.rsplit("/", 1)
+        self.resultado = {"filename": filename, "folder": folder, "hash": digest, "size": size}
+
+    @property
+    def ruta(self) -> str:
+        return ruta_media_clave(self.clave)
+
+    async def colocar(self):
+        """Entrega el archivo (y sus copias precomprimidas) al almacenamiento configurado"""
+        storage = get_storage()
+        for sufijo, codificacion in self.copias:
+            await storage.guardar(f"{self.clave}{sufijo}", f"{self.temporal}{sufijo}", self.content_type, codificacion)
+        await storage.guardar(self.clave, self.temporal, self.content_type)
+
+    def descartar(self):
+        """Elimina los temporales que queden (no toca el almacenamiento)"""
+        descartar_temporales(self.temporal)
+
+def descartar_temporales(temporal: str):
+    for ruta in (temporal, f"{temporal}.gz", f"{temporal}.br"):
+        if os.path.exists(ruta):
+            os.remove(ruta)
+
+async def recibir_archivo(folder: str = BLOBS_DIR, file: UploadFile = File(...)) -> ArchivoRecibido:
+    """
+    Guarda el archivo por bloques en un temporal sin bloquear el event loop (la escritura se delega
+    a un hilo). La clave final es el hash SHA-256 del contenido: subir dos veces la misma foto
+    produce un único archivo, y un archivo nunca cambia de contenido.
+    """
+    storage = get_storage()
+    temp_location = os.path.join(MEDIA_DIR, f".upload-{uuid.uuid4().hex}.tmp")
+    buffer = await asyncio.to_thread(open, temp_location, "wb")
+    try:
+        total = 0
+        sha256 = hashlib.sha256()
+        while chunk := await file.read(CHUNK_SIZE):
+            total += len(chunk)
+            if total > MAX_UPLOAD_SIZE:
+                raise ArchivoDemasiadoGrande(f"El archivo {file.filename} supera el máximo de {MAX_UPLOAD_SIZE // (1024 * 1024)} MB")
+            sha256.update(chunk)
+            await asyncio.to_thread(buffer.write, chunk)
+        await asyncio.to_thread(buffer.close)
+        digest = sha256.hexdigest()
+        extension = extension_segura(file.filename)
+        clave = clave_blob(folder, digest, extension)
+        content_type = mimetypes.guess_type(clave)[0] or file.content_type
+        copias = []
+        if storage.sirve_precomprimidos and extension in EXTENSIONES_COMPRIMIBLES:
+            copias = await asyncio.to_thread(precomprimir, temp_location)
+    except BaseException:
+        buffer.close()
+        descartar_temporales(temp_location)
+        raise
+    return ArchivoRecibido(clave, temp_location, content_type, copias, digest, total)
+
+async def recibir_archivos(archivos: list[tuple[str, UploadFile]]) -> list[ArchivoRecibido]:
+    """Recibe varios archivos [(folder, file)] en paralelo: si alguno falla no queda ninguno"""
+    resultados = await asyncio.gather(*(recibir_archivo(folder, file) for folder, file in archivos), return_exceptions=True)
+    errores = [r for r in resultados if isinstance(r, BaseException)]
+    if errores:
+        for resultado in resultados:
+            if isinstance(resultado, ArchivoRecibido):
+                resultado.descartar()
+        raise errores[0]
+    return resultados
+
+async def colocar_archivos(recibidos: list[ArchivoRecibido]):
+    """Coloca en el almacenamiento archivos cuya referencia ya está registrada"""
+    try:
+        await asyncio.gather(*(recibido.colocar() for recibido in recibidos))
+    finally:
+        for recibido in recibidos:
+            recibido.descartar()
+
+async def upload_image(folder: str = BLOBS_DIR, file: UploadFile = File(...)):
+    """
+    Recibe el archivo y lo coloca de inmediato en el almacenamiento (disco o S3).
+    Las subidas que quedan referenciadas en la base de datos deben usar recibir_archivo
+    y colocarlo después de MediaService.retener.
+    """
+    recibido = await recibir_archivo(folder, file)
+    try:
+        await recibido.colocar()
+    finally:
+        recibido.descartar()
+    return recibido.resultado
+
+async def preparar_subida_directa(folder: str, sha256: str, tamano: int, content_type: str, extension: str = "") -> dict:
+    """
+    Clave por contenido y URL firmada para que el cliente suba el archivo directo al almacenamiento.
+    Si el contenido ya está guardado no hace falta subirlo ("existe": True).
+    """
+    if folder not in (BLOBS_DIR, DOCS_DIR):
+        raise ValueError(f"Colección desconocida '{folder}'")
+    if not re.fullmatch(r"[0-9a-f]{64}", sha256 or ""):
+        raise ValueError("sha256 debe ser el hash hexadecimal del contenido")
+    if tamano <= 0 or tamano > MAX_UPLOAD_SIZE:
+        raise ArchivoDemasiadoGrande(f"El archivo supera el máximo de {MAX_UPLOAD_SIZE // (1024 * 1024)} MB")
+    clave = clave_blob(folder, sha256, extension_segura(f"x{extension}"))
+    storage = get_storage()
+    if await storage.tamano(clave) == tamano:
+        return {"clave": clave, "ruta": ruta_media_clave(clave), "existe": True}
+    return {"clave": clave, "ruta": ruta_media_clave(clave), "existe": False, **storage.url_subida(clave, content_type, sha256, tamano)}
+
+async def subida_directa(clave: str) -> dict:
+    """Resultado equivalente al de upload_image para un archivo que el cliente ya subió con la URL firmada"""
+    coincidencia = re.fullmatch(r"(blobs|docs)/([0-9a-f]{2})/(\2[0-9a-f]{62})(\.[a-z0-9]{1,10})?", clave or "")
+    if not coincidencia:
+        raise ValueError(f"Clave de media inválida '{clave}'")
+    tamano = await get_storage().tamano(clave)
+    if tamano is None:
+        raise ValueError(f"El archivo '{clave}' no se ha subido")
+    folder, filename = clave.rsplit("/", 1)
+    return {"filename": filename, "folder": folder, "hash": coincidencia.group(3), "size": tamano}
+
+def precomprimir(ruta: str) -> list[tuple[str, str]]:
+    """Guarda copias .gz (y .br si brotli está instalado) para servirlas sin comprimir en cada petición"""
+    with open(ruta, "rb") as original:
+        contenido = original.read()
+    copias = [(".gz", "gzip")]
+    with open(f"{ruta}.gz", "wb") as destino:
+        destino.write(gzip.compress(contenido, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(f"{ruta}.br", "wb") as destino:
+            destino.write(brotli.compress(contenido))
+        copias.append((".br", "br"))
+    return copias
+
+def ruta_media(subida: dict) -> str:
+    """Ruta guardada en la base de datos para un resultado de upload_image"""
+    return ruta_media_clave(f"{subida['folder']}/{subida['filename']}")
+
+def claves_asociadas(clave: str) -> list[str]:
+    """La clave, sus copias precomprimidas y sus variantes derivadas"""
+    base, _ = os.path.splitext(clave)
+    return [clave, f"{clave}.br", f"{clave}.gz", *nombres_derivados(base).values()]
+
+async def delete_blobs(rutas: list[str]):
+    """Elimina del almacenamiento los archivos guardados y todo lo derivado de ellos"""
+    claves = [c for ruta in rutas if (clave := clave_media(ruta)) for c in claves_asociadas(clave)]
+    if claves:
+        await get_storage().eliminar(claves)
+
+class MediaStaticFiles(StaticFiles):
+    """
+    StaticFiles para /media con Cache-Control por prefijo, ETag fuerte para los archivos
+    guardados por contenido (el hash del nombre) y copias precomprimidas según Accept-Encoding.
+    Range e If-Range los resuelve FileResponse; las peticiones con Range reciben siempre el original.
+    """
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        ruta = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+        coleccion = ruta.split("/", 1)[0]
+        headers = {"cache-control": CACHE_POLICIES.get(coleccion, CACHE_DEFAULT)}
+        etag = None
+        if coleccion in CACHE_POLICIES:
+            # El nombre es el hash del contenido (o de su original, para las variantes)
+            etag = os.path.splitext(os.path.basename(ruta))[0]
+            headers["etag"] = f'"{etag}"'
+
+        archivo, media_type = full_path, None
+        if status_code == 200 and "range" not in request_headers and os.path.splitext(ruta)[1] in EXTENSIONES_COMPRIMIBLES:
+            headers["vary"] = "Accept-Encoding"
+            aceptadas = {c.split(";")[0].strip() for c in request_headers.get("accept-encoding", "").split(",")}
+            for codificacion, sufijo in (("br", ".br"), ("gzip", ".gz")):
+                if codificacion in aceptadas and os.path.isfile(f"{full_path}{sufijo}"):
+                    archivo = f"{full_path}{sufijo}"
+                    media_type = mimetypes.guess_type(full_path)[0]
+                    stat_result = os.stat(archivo)
+                    headers["content-encoding"] = codificacion
+                    if etag:
+                        headers["etag"] = f'"{etag}-{codificacion}"'
+                    break
+
+        response = FileResponse(archivo, status_code=status_code, stat_result=stat_result, headers=headers, media_type=media_type)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+async def redirigir_media(request: Request) -> Response:
+    """/media con almacenamiento remoto: redirige a una URL firmada, válida S3_PRESIGN_EXPIRES segundos"""
+    clave = clave_media(f"{MEDIA_DIR}/{request.path_params['clave']}")
+    if not clave:
+        return Response(status_code=404)
+    return RedirectResponse(
+        get_storage().url_descarga(clave),
+        status_code=307,
+        headers={"cache-control": f"private, max-age={S3_PRESIGN_EXPIRES // 2}"},
+    )
+
+def media_app():
+    """Aplicación montada en /media según el almacenamiento configurado"""
+    if isinstance(get_storage(), FileSystemStorage):
+        return MediaStaticFiles(directory=MEDIA_DIR)
+    return Router(routes=[Route("/{clave:path}", redirigir_media, methods=["GET", "HEAD"])])
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import os
+import time
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# API REST de MercadoPago; MERCADOPAGO_API_URL permite apuntar a fake_mercadopago.py en pruebas
+MP_API_URL = os.getenv("MERCADOPAGO_API_URL", "https://api.mercadopago.com")
+MP_ACCESS_TOKEN = os.getenv("MERCADOPAGO_ACCESS_TOKEN", "")
+MP_TIMEOUT = float(os.getenv("MERCADOPAGO_TIMEOUT", "10"))                  # Segundos por petición
+MP_CONNECT_TIMEOUT = float(os.getenv("MERCADOPAGO_CONNECT_TIMEOUT", "3"))
+MP_MAX_CONNECTIONS = int(os.getenv("MERCADOPAGO_MAX_CONNECTIONS", "20"))
+MP_MAX_REINTENTOS = int(os.getenv("MERCADOPAGO_MAX_REINTENTOS", "2"))       # Solo para peticiones idempotentes
+MP_FALLAS_CIRCUITO = int(os.getenv("MERCADOPAGO_FALLAS_CIRCUITO", "5"))     # Fallas seguidas que abren el circuito
+MP_ESPERA_CIRCUITO = float(os.getenv("MERCADOPAGO_ESPERA_CIRCUITO", "30"))  # Segundos abierto antes de reintentar
+
+class PasarelaNoDisponible(RuntimeError):
+    """MercadoPago no responde (timeout, error de red o 5xx) o el circuito está abierto"""
+
+class CircuitBreaker:
+    """
+    Tras `umbral` fallas seguidas deja de llamar a la pasarela durante `espera` segundos
+    (las peticiones fallan al instante). Luego deja pasar una petición de prueba:
+    si funciona se cierra, si falla vuelve a abrirse.
+    """
+
+    def __init__(self, umbral: int, espera: float):
+        self.umbral = umbral
+        self.espera = espera
+        self.fallas = 0
+        self.abierto_hasta = 0.0
+        self.probando = False
+
+    @property
+    def estado(self) -> str:
+        if self.fallas < self.umbral:
+            return "cerrado"
+        return "abierto" if time.monotonic() < self.abierto_hasta else "semiabierto"
+
+    def permitir(self):
+        estado = self.estado
+        if estado == "abierto" or (estado == "semiabierto" and self.probando):
+            raise PasarelaNoDisponible("MercadoPago no está disponible, intente nuevamente en unos segundos")
+        if estado == "semiabierto":
+            self.probando = True
+
+    def exito(self):
+        self.fallas = 0
+        self.probando = False
+
+    def falla(self):
+        self.fallas += 1
+        self.probando = False
+        if self.fallas >= self.umbral:
+            self.abierto_hasta = time.monotonic() + self.espera
+            logger.warning("Circuito de MercadoPago abierto por %s segundos tras %s fallas", self.espera, self.fallas)
+
+class MercadoPagoClient:
+    """
+    Cliente asíncrono de la API de MercadoPago con un pool de conexiones persistentes (keep-alive),
+    timeouts y circuit breaker. Las respuestas tienen la forma del SDK: {"status": int, "response": dict}.
+    """
+
+    def __init__(self, access_token: str, base_url: str = MP_API_URL, timeout: float = MP_TIMEOUT, transport: httpx.AsyncBaseTransport | None = None):
+        self.http = httpx.AsyncClient(
+            base_url=base_url,
+            headers={"Authorization": f"Bearer {access_token}"},
+            timeout=httpx.Timeout(timeout, connect=min(timeout, MP_CONNECT_TIMEOUT)),
+            limits=httpx.Limits(max_connections=MP_MAX_CONNECTIONS, max_keepalive_connections=MP_MAX_CONNECTIONS),
+            transport=transport,
+        )
+        self.circuito = CircuitBreaker(MP_FALLAS_CIRCUITO, MP_ESPERA_CIRCUITO)
+
+    async def request(self, method: str, url: str, reintentos: int = 0, **kwargs) -> dict:
+        for intento in range(reintentos + 1):
+            self.circuito.permitir()
+            try:
+                respuesta = await self.http.request(method, url, **kwargs)
+            except httpx.TransportError as e:  # Timeouts y errores de conexión
+                self.circuito.falla()
+                error = PasarelaNoDisponible(f"Error de comunicación con MercadoPago: {e!r}")
+            else:
+                if respuesta.status_code < 500:
+                    self.circuito.exito()
+                    return {"status": respuesta.status_code, "response": respuesta.json() if respuesta.content else {}}
+                self.circuito.falla()
+                error = PasarelaNoDisponible(f"MercadoPago respondió {respuesta.status_code}")
+            if intento < reintentos:
+                await asyncio.sleep(0.2 * 2 ** intento)
+        raise error
+
+    async def crear_preferencia(self, preference_data: dict, idempotency_key: str | None = None) -> dict:
+        # Con la llave de idempotencia MercadoPago no duplica la preferencia si se reintenta
+        headers = {"X-Idempotency-Key": idempotency_key} if idempotency_key else {}
+        reintentos = MP_MAX_REINTENTOS if idempotency_key else 0
+        return await self.request("POST", "/checkout/preferences", reintentos=reintentos, json=preference_data, headers=headers)
+
+    async def obtener_pago(self, payment_id: str) -> dict:
+        return await self.request("GET", f"/v1/payments/{payment_id}", reintentos=MP_MAX_REINTENTOS)
+
+    async def close(self):
+        await self.http.aclose()
+
+_client: MercadoPagoClient | None = None
+
+def get_mp_client() -> MercadoPagoClient:
+    """Cliente compartido por todas las peticiones, creado al primer uso"""
+    global _client
+    if _client is None:
+        if not MP_ACCESS_TOKEN:
+            raise RuntimeError("MercadoPago no está configurado. Verificar MERCADOPAGO_ACCESS_TOKEN en .env")
+        _client = MercadoPagoClient(MP_ACCESS_TOKEN)
+    return _client
+
+async def cerrar_mp_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
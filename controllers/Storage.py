@@ -0,0 +1,208 @@
+from abc import ABC, abstractmethod
+from contextlib import AbstractAsyncContextManager, asynccontextmanager
+import asyncio
+import base64
+import os
+import shutil
+import tempfile
+
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # boto3 es opcional: solo lo necesita MEDIA_STORAGE=s3
+    boto3 = None
+
+MEDIA_DIR = "media"
+MEDIA_PREFIX = f"{MEDIA_DIR}/"
+
+# Dónde se guardan los archivos de media: "filesystem" (disco local) o "s3" (S3, MinIO, ...)
+MEDIA_STORAGE = os.getenv("MEDIA_STORAGE", "filesystem")
+S3_BUCKET = os.getenv("S3_BUCKET", "reservio-media")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None  # Para MinIO u otro servicio compatible
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_PRESIGN_EXPIRES = int(os.getenv("S3_PRESIGN_EXPIRES", "900"))  # Segundos de validez de las URLs firmadas
+
+class SubidaDirectaNoDisponible(RuntimeError):
+    """El backend de almacenamiento no admite subidas directas con URL firmada"""
+
+class StorageBackend(ABC):
+    """
+    Almacenamiento de media. Las claves son rutas relativas ("blobs/ab/<hash>.jpg");
+    en la base de datos se guardan como "media/<clave>" y se sirven bajo /media.
+    """
+
+    @abstractmethod
+    async def guardar(self, clave: str, origen: str, content_type: str | None = None, content_encoding: str | None = None):
+        """Mueve el archivo local origen a la clave (el origen deja de existir)"""
+
+    @abstractmethod
+    async def tamano(self, clave: str) -> int | None:
+        """Tamaño en bytes de la clave, o None si no existe"""
+
+    async def existe(self, clave: str) -> bool:
+        return await self.tamano(clave) is not None
+
+    @abstractmethod
+    async def eliminar(self, claves: list[str]):
+        """Elimina las claves indicadas; las que no existen se ignoran"""
+
+    @abstractmethod
+    def archivo_local(self, clave: str) -> AbstractAsyncContextManager[str]:
+        """Ruta local con el contenido de la clave mientras dure el contexto (async with)"""
+
+    # Si se guardan copias .gz/.br de los documentos de texto (las sirve MediaStaticFiles)
+    sirve_precomprimidos = False
+
+    def url_subida(self, clave: str, content_type: str, sha256: str, tamano: int) -> dict:
+        """URL firmada para que el cliente suba el archivo directamente, sin pasar por la API"""
+        raise SubidaDirectaNoDisponible("El almacenamiento configurado no admite subidas directas")
+
+    @abstractmethod
+    def url_descarga(self, clave: str) -> str:
+        """URL desde la que el cliente descarga la clave"""
+
+class FileSystemStorage(StorageBackend):
+    sirve_precomprimidos = True
+
+    def __init__(self, directorio: str):
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+
+    def ruta(self, clave: str) -> str:
+        return os.path.join(self.directorio, *clave.split("/"))
+
+    async def guardar(self, clave, origen, content_type=None, content_encoding=None):
+        destino = self.ruta(clave)
+        await asyncio.to_thread(os.makedirs, os.path.dirname(destino), exist_ok=True)
+        # Rename atómico: nunca se sirve un archivo a medias
+        await asyncio.to_thread(os.replace, origen, destino)
+
+    async def tamano(self, clave):
+        try:
+            return (await asyncio.to_thread(os.stat, self.ruta(clave))).st_size
+        except FileNotFoundError:
+            return None
+
+    async def eliminar(self, claves):
+        def eliminar_archivos():
+            for clave in claves:
+                if os.path.exists(self.ruta(clave)):
+                    os.remove(self.ruta(clave))
+        await asyncio.to_thread(eliminar_archivos)
+
+    @asynccontextmanager
+    async def archivo_local(self, clave):
+        yield self.ruta(clave)
+
+    def url_descarga(self, clave):
+        return f"/media/{clave}"
+
+class S3Storage(StorageBackend):
+    """
+    Almacenamiento en un bucket S3 (o compatible, con S3_ENDPOINT_URL). boto3 es síncrono,
+    por lo que cada llamada se ejecuta en un hilo. Las descargas se sirven con URLs firmadas.
+    """
+
+    def __init__(self, bucket: str, endpoint_url: str | None = None, region: str | None = None):
+        if boto3 is None:
+            raise RuntimeError("MEDIA_STORAGE=s3 requiere el paquete boto3")
+        self.bucket = bucket
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            config=BotoConfig(signature_version="s3v4", max_pool_connections=20),
+        )
+
+    async def guardar(self, clave, origen, content_type=None, content_encoding=None):
+        extra = {}
+        if content_type:
+            extra["ContentType"] = content_type
+        if content_encoding:
+            extra["ContentEncoding"] = content_encoding
+        try:
+            await asyncio.to_thread(self.client.upload_file, origen, self.bucket, clave, ExtraArgs=extra)
+        finally:
+            await asyncio.to_thread(os.remove, origen)
+
+    async def tamano(self, clave):
+        try:
+            respuesta = await asyncio.to_thread(self.client.head_object, Bucket=self.bucket, Key=clave)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return respuesta["ContentLength"]
+
+    async def eliminar(self, claves):
+        # delete_objects admite hasta 1000 claves por llamada
+        for i in range(0, len(claves), 1000):
+            objetos = [{"Key": clave} for clave in claves[i:i + 1000]]
+            await asyncio.to_thread(self.client.delete_objects, Bucket=self.bucket, Delete={"Objects": objetos, "Quiet": True})
+
+    @asynccontextmanager
+    async def archivo_local(self, clave):
+        directorio = await asyncio.to_thread(tempfile.mkdtemp, prefix="media-")
+        try:
+            destino = os.path.join(directorio, os.path.basename(clave))
+            await asyncio.to_thread(self.client.download_file, self.bucket, clave, destino)
+            yield destino
+        finally:
+            await asyncio.to_thread(shutil.rmtree, directorio, ignore_errors=True)
+
+    def url_subida(self, clave, content_type, sha256, tamano):
+        # S3 rechaza el PUT si el contenido no coincide con el SHA-256 firmado,
+        # así la clave por contenido queda garantizada aunque el archivo no pase por la API
+        checksum = base64.b64encode(bytes.fromhex(sha256)).decode()
+        url = self.client.generate_presigned_url(
+            "put_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": clave,
+                "ContentType": content_type,
+                "ContentLength": tamano,
+                "ChecksumSHA256": checksum,
+            },
+            ExpiresIn=S3_PRESIGN_EXPIRES,
+        )
+        return {
+            "url": url,
+            "method": "PUT",
+            "headers": {"Content-Type": content_type, "x-amz-checksum-sha256": checksum},
+            "expires_in": S3_PRESIGN_EXPIRES,
+        }
+
+    def url_descarga(self, clave):
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": clave}, ExpiresIn=S3_PRESIGN_EXPIRES
+        )
+
+def clave_media(ruta: str | None) -> str | None:
+    """Clave de almacenamiento de una ruta guardada en la base de datos ("media/<clave>")"""
+    if not ruta or not ruta.startswith(MEDIA_PREFIX):
+        return None
+    clave = ruta[len(MEDIA_PREFIX):]
+    return None if ".." in clave.split("/") else clave
+
+def ruta_media_clave(clave: str) -> str:
+    return f"{MEDIA_PREFIX}{clave}"
+
+_storage: StorageBackend | None = None
+
+def get_storage() -> StorageBackend:
+    """Backend de almacenamiento configurado con MEDIA_STORAGE, creado al primer uso"""
+    global _storage
+    if _storage is None:
+        if MEDIA_STORAGE == "s3":
+            _storage = S3Storage(S3_BUCKET, endpoint_url=S3_ENDPOINT_URL, region=S3_REGION)
+        elif MEDIA_STORAGE == "filesystem":
+            _storage = FileSystemStorage(MEDIA_DIR)
+        else:
+            raise RuntimeError(f"MEDIA_STORAGE desconocido: {MEDIA_STORAGE}")
+    return _storage
+
+def set_storage(storage: StorageBackend | None):
+    """Reemplaza el backend (tests o configuración explícita); None vuelve a leer MEDIA_STORAGE"""
+    global _storage
+    _storage = storage
@@ -0,0 +1,79 @@
+"""
+Servidor falso de la API de MercadoPago para pruebas locales
+Implementa solo lo que usa Reservio: crear preferencias y consultar pagos.
+Ejecutar con: uvicorn fake_mercadopago:app --port 8089
+y configurar MERCADOPAGO_API_URL="http://localhost:8089"
+"""
+
+import asyncio
+import uuid
+
+from fastapi import FastAPI, Header, HTTPException, Request
+
+app = FastAPI(title="MercadoPago falso")
+
+# Estado en memoria (se puede manipular desde los tests)
+preferencias: dict[str, dict] = {}
+pagos: dict[str, dict] = {}
+idempotencia: dict[str, dict] = {}
+config = {
+    "fallas": 0,    # Cantidad de próximas peticiones que responden 500
+    "demora": 0.0,  # Segundos de espera antes de responder (para probar timeouts)
+}
+peticiones: list[str] = []
+
+async def simular_condiciones():
+    if config["demora"]:
+        await asyncio.sleep(config["demora"])
+    if config["fallas"] > 0:
+        config["fallas"] -= 1
+        raise HTTPException(status_code=500, detail="Error interno simulado")
+
+def reiniciar():
+    preferencias.clear()
+    pagos.clear()
+    idempotencia.clear()
+    peticiones.clear()
+    config.update(fallas=0, demora=0.0)
+
+def registrar_pago(external_reference: str, status: str = "approved", payment_id: str | None = None) -> str:
+    """Simula que un comprador pagó una preferencia; devuelve el payment_id"""
+    payment_id = payment_id or str(uuid.uuid4().int)[:10]
+    pagos[payment_id] = {
+        "id": int(payment_id),
+        "status": status,
+        "external_reference": external_reference,
+        "currency_id": "CLP",
+    }
+    return payment_id
+
+@app.post("/checkout/preferences", status_code=201)
+async def crear_preferencia(request: Request, authorization: str = Header(None), x_idempotency_key: str | None = Header(None)):
+    peticiones.append("POST /checkout/preferences")
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="unauthorized")
+    datos = await request.json()
+    await simular_condiciones()
+    if x_idempotency_key and x_idempotency_key in idempotencia:
+        return idempotencia[x_idempotency_key]
+    preference_id = f"pref-{uuid.uuid4().hex[:12]}"
+    preferencia = {
+        **datos,
+        "id": preference_id,
+        "init_point": f"https://www.mercadopago.cl/checkout/v1/redirect?pref_id={preference_id}",
+        "sandbox_init_point": f"https://sandbox.mercadopago.cl/checkout/v1/redirect?pref_id={preference_id}",
+    }
+    preferencias[preference_id] = preferencia
+    if x_idempotency_key:
+        idempotencia[x_idempotency_key] = preferencia
+    return preferencia
+
+@app.get("/v1/payments/{payment_id}")
+async def obtener_pago(payment_id: str, authorization: str = Header(None)):
+    peticiones.append(f"GET /v1/payments/{payment_id}")
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="unauthorized")
+    await simular_condiciones()
+    if payment_id not in pagos:
+        raise HTTPException(status_code=404, detail="Payment not found")
+    return pagos[payment_id]
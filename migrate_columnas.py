@@ -0,0 +1,58 @@
+"""
+Script de migración para agregar a tablas existentes las columnas nuevas de los modelos
+create_all no modifica tablas ya creadas; este script agrega solo las columnas que falten
+"""
+
+from sqlmodel import SQLModel, create_engine
+from sqlalchemy import inspect
+from dotenv import load_dotenv
+import os
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Importar todos los modelos para que SQLModel los reconozca
+import models  # noqa: F401
+
+def migrate_columns():
+    """
+    Agrega las columnas faltantes: con DEFAULT si el campo del modelo tiene un valor escalar por defecto, si no nulas
+    """
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        raise ValueError("DATABASE_URL no encontrada en las variables de entorno")
+    
+    engine = create_engine(database_url)
+    
+    print("Buscando columnas faltantes...")
+    
+    # Clase del modelo por tabla, para tomar los valores por defecto de sus campos
+    modelos = {mapper.class_.__tablename__: mapper.class_ for mapper in SQLModel._sa_registry.mappers}
+    
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        tablas_existentes = set(inspector.get_table_names())
+        for table in SQLModel.metadata.sorted_tables:
+            if table.name not in tablas_existentes:
+                continue  # La crea create_all al iniciar la app
+            existentes = {c["name"] for c in inspector.get_columns(table.name)}
+            for columna in table.columns:
+                if columna.name in existentes:
+                    continue
+                tipo = columna.type.compile(dialect=conn.dialect)
+                field = modelos[table.name].model_fields.get(columna.name)
+                default = field.default if field is not None else None
+                if not isinstance(default, (bool, int, float, str)):
+                    default = None
+                if default is not None:
+                    valor = int(default) if isinstance(default, bool) else default
+                    definicion = f"{tipo} NOT NULL DEFAULT {valor!r}"
+                else:
+                    definicion = f"{tipo} NULL"
+                conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {columna.name} {definicion}")
+                print(f"- {table.name}.{columna.name}")
+    
+    print("Migración completada exitosamente!")
+
+if __name__ == "__main__":
+    migrate_columns()
@@ -0,0 +1,46 @@
+"""
+Script de migración para crear los índices de rendimiento en tablas existentes
+create_all solo crea índices al crear la tabla, por lo que en bases ya creadas hay que ejecutarlo manualmente
+"""
+
+from sqlmodel import SQLModel, create_engine
+from dotenv import load_dotenv
+import os
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Importar todos los modelos para que SQLModel los reconozca
+import models  # noqa: F401
+
+# Índices agregados después de la creación inicial de las tablas
+INDICES = {
+    "propiedad": ["ix_propiedad_busqueda", "ix_propiedad_rating"],
+    "reserva": ["ix_reserva_propiedad_rango"],
+    "pago": ["ix_pago_fecha_estado"],
+    "comision": ["ix_comision_fecha_estado", "ix_comision_estado_propietario"],
+}
+
+def migrate_indexes():
+    """
+    Crea los índices que aún no existen
+    """
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        raise ValueError("DATABASE_URL no encontrada en las variables de entorno")
+    
+    engine = create_engine(database_url)
+    
+    print("Creando índices...")
+    
+    for tabla, nombres in INDICES.items():
+        table = SQLModel.metadata.tables[tabla]
+        for index in table.indexes:
+            if index.name in nombres:
+                index.create(engine, checkfirst=True)
+                print(f"- {tabla}.{index.name}")
+    
+    print("Migración completada exitosamente!")
+
+if __name__ == "__main__":
+    migrate_indexes()
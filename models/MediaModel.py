@@ -0,0 +1,13 @@
+from typing import List, Optional
+from sqlmodel import Field, SQLModel
+
+class SubidaDirectaRequest(SQLModel):
+    coleccion: str = Field(default="blobs")  # "blobs" (imágenes) o "docs" (documentos)
+    sha256: str                              # Hash hexadecimal del contenido, calculado por el cliente
+    tamano: int                              # Bytes
+    content_type: str
+    extension: str = Field(default="")       # ".jpg", ".pdf", ...
+
+class AsignarSubidasRequest(SQLModel):
+    imagenes: Optional[List[str]] = None     # Claves devueltas por /media/subidas; reemplazan las imágenes
+    documento: Optional[str] = None
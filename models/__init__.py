@@ -1,10 +1,10 @@
 from datetime import datetime, date, time
-from typing import List, Optional
+from typing import Dict, List, Optional
 from uuid import UUID
 import uuid
-from sqlmodel import JSON, Column, Field, Relationship, TIMESTAMP, SQLModel, TEXT
+from sqlmodel import JSON, Column, Enum, Field, Index, Relationship, TIMESTAMP, SQLModel, TEXT
 
-from models.types import UserType, PagoStatus, ComisionStatus
+from models.types import UserType, PagoStatus, ComisionStatus, WebhookStatus
 from .UsuarioModel import UsuarioBase
 from .ComunaModel import ComunaBase
 from .RegionModel import RegionBase
@@ -15,6 +15,7 @@ from .ValoracionModel import ValoracionBase
 from .PagoModel import PagoBase
 from .ComisionModel import ComisionBase
 from .manyToMany import UsuarioPropiedad
+from .TokenBlacklistModel import TokenBlacklist
 
 # Clases tabla (heredan de su base)
 class Usuario(UsuarioBase, table=True):
@@ -37,16 +38,31 @@ class Comuna(ComunaBase, table=True):
 
 class Propiedad(PropiedadBase, table=True):
     __tablename__ = "propiedad"
+    __table_args__ = (
+        # Índice de la búsqueda del catálogo: igualdades primero, rango de precio al final
+        Index("ix_propiedad_busqueda", "activo", "validada", "comuna_id", "tipo", "precio_hora"),
+        Index("ix_propiedad_rating", "rating_avg"),
+    )
     id: Optional[UUID] = Field(default_factory=uuid.uuid4, primary_key=True)
     activo: bool = Field(default=True)
     imagenes: Optional[List[str]] = Field(default_factory=list, sa_column=Column(JSON))
+    # Variantes generadas por imagen: {ruta_original: {"thumb": ruta, "thumb_webp": ruta, ...}}
+    imagenes_variantes: Optional[Dict[str, Dict[str, str]]] = Field(default_factory=dict, sa_column=Column(JSON))
     documento: Optional[str] = Field(default=None, sa_type=TEXT, nullable=True)
+    # Agregados de valoraciones, mantenidos por ValoracionService
+    rating_avg: float = Field(default=0, nullable=False)
+    rating_count: int = Field(default=0, nullable=False)
+    rating_sum: int = Field(default=0, nullable=False)
     comuna: Optional[Comuna] = Relationship(back_populates="propiedades")
     propietarios: list["Usuario"] = Relationship(link_model=UsuarioPropiedad, back_populates="propiedades")
     valoraciones: list["Valoracion"] = Relationship(back_populates="propiedad")
 
 class Reserva(ReservaBase, table=True):
     __tablename__ = "reserva"
+    __table_args__ = (
+        # Detección de solapamientos: reservas de una propiedad por rango de tiempo
+        Index("ix_reserva_propiedad_rango", "propiedad_id", "inicio", "fin"),
+    )
     id: Optional[UUID] = Field(default_factory=uuid.uuid4, primary_key=True)
     fecha_creacion: datetime = Field(default=datetime.now(), sa_type=TIMESTAMP)
     boleta: Optional["Boleta"] = Relationship(back_populates="reserva")
@@ -65,12 +81,22 @@ class Valoracion(ValoracionBase, table=True):
 
 class Pago(PagoBase, table=True):
     __tablename__ = "pago"
+    __table_args__ = (
+        # Exportación contable por rango de fechas
+        Index("ix_pago_fecha_estado", "fecha_creacion", "estado"),
+    )
     id: Optional[UUID] = Field(default_factory=uuid.uuid4, primary_key=True)
     reserva: Optional[Reserva] = Relationship(back_populates="pagos")
     comisiones: list["Comision"] = Relationship(back_populates="pago")
 
 class Comision(ComisionBase, table=True):
     __tablename__ = "comision"
+    __table_args__ = (
+        # Resumen por período: rango de fechas agrupado por estado
+        Index("ix_comision_fecha_estado", "fecha_creacion", "estado"),
+        # Comisiones a pagar: totales por propietario y su detalle ordenado por fecha
+        Index("ix_comision_estado_propietario", "estado", "propietario_id", "fecha_creacion"),
+    )
     id: Optional[UUID] = Field(default_factory=uuid.uuid4, primary_key=True)
     pago: Optional[Pago] = Relationship(back_populates="comisiones")
     propietario: Optional[Usuario] = Relationship()
@@ -85,6 +111,47 @@ class BloqueoUsuario(SQLModel, table=True):
     usuario: Optional["Usuario"] = Relationship(back_populates="bloqueos", sa_relationship_kwargs={"foreign_keys": "BloqueoUsuario.usuario_id"})
     administrador: Optional["Usuario"] = Relationship(sa_relationship_kwargs={"foreign_keys": "BloqueoUsuario.administrador_id"})
     
+class SaldoPropietario(SQLModel, table=True):
+    """
+    Saldo de las comisiones de un propietario por estado (montos en CLP). Se actualiza en la misma
+    transacción que crea o cambia de estado las comisiones; reconciliar_saldos.py lo verifica.
+    """
+    __tablename__ = "saldo_propietario"
+    propietario_id: UUID = Field(foreign_key="usuario.id", primary_key=True)
+    pendiente: int = Field(default=0, nullable=False)
+    procesada: int = Field(default=0, nullable=False)
+    completada: int = Field(default=0, nullable=False)
+    fecha_actualizacion: datetime = Field(default_factory=datetime.now, sa_type=TIMESTAMP)
+
+class MediaBlob(SQLModel, table=True):
+    """Archivo guardado por contenido (media/blobs/..) y cuántas referencias lo usan"""
+    ruta: str = Field(primary_key=True, max_length=255)
+    referencias: int = Field(default=0, nullable=False)
+    tamano: int = Field(default=0, nullable=False)
+    fecha_creacion: datetime = Field(default_factory=datetime.now, sa_type=TIMESTAMP)
+
+class WebhookEvento(SQLModel, table=True):
+    """
+    Notificación de MercadoPago pendiente de procesar. Hay una fila por pago (mp_payment_id único):
+    las notificaciones repetidas solo la vuelven a marcar como pendiente.
+    """
+    __tablename__ = "webhook_evento"
+    __table_args__ = (
+        # Los workers buscan las notificaciones pendientes cuyo próximo intento ya venció
+        Index("ix_webhook_evento_cola", "estado", "proximo_intento"),
+    )
+    id: Optional[UUID] = Field(default_factory=uuid.uuid4, primary_key=True)
+    mp_payment_id: str = Field(max_length=100, unique=True, nullable=False)
+    tipo: str = Field(default="payment", max_length=50)
+    payload: Optional[Dict] = Field(default=None, sa_column=Column(JSON))  # Cuerpo recibido, sin procesar
+    estado: WebhookStatus = Field(default=WebhookStatus.pendiente, sa_type=Enum(WebhookStatus))
+    recibidos: int = Field(default=1, nullable=False)  # Notificaciones recibidas para este pago
+    intentos: int = Field(default=0, nullable=False)
+    proximo_intento: datetime = Field(default_factory=datetime.now, sa_type=TIMESTAMP)
+    ultimo_error: Optional[str] = Field(default=None, sa_type=TEXT)
+    fecha_recepcion: datetime = Field(default_factory=datetime.now, sa_type=TIMESTAMP)
+    fecha_procesamiento: Optional[datetime] = Field(default=None, sa_type=TIMESTAMP)
+
 ## Clases de lectura (heredan de su base)
 class UsuarioRead(SQLModel):
     id: UUID
@@ -114,7 +181,10 @@ class PropiedadRead(SQLModel):
     validada: bool
     activo: bool
     imagenes: Optional[List[str]]
+    imagenes_variantes: Optional[Dict[str, Dict[str, str]]] = None
     documento: Optional[str]
+    rating_avg: float
+    rating_count: int
     comuna: Optional["Comuna"]
     propietarios: list["Usuario"]
     valoraciones: list["Valoracion"]
\ No newline at end of file
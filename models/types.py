@@ -24,3 +24,10 @@ class ComisionStatus(enum.Enum):
     pendiente = "pendiente"
     procesada = "procesada"
     completada = "completada"
+
+class WebhookStatus(enum.Enum):
+    """ Enumerador para el estado de una notificación de MercadoPago en la cola """
+    pendiente = "pendiente"
+    procesando = "procesando"
+    procesado = "procesado"
+    error = "error"
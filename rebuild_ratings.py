@@ -0,0 +1,46 @@
+"""
+Script de backfill de los agregados de valoraciones (rating_avg, rating_count) de cada propiedad
+Agrega las columnas si la tabla propiedad ya existía y recalcula los valores desde la tabla valoracion
+"""
+
+import asyncio
+from dotenv import load_dotenv
+from sqlalchemy import inspect
+
+# Cargar variables de entorno
+load_dotenv()
+
+from app.db import engine, async_session
+from models import Propiedad
+from services.PropiedadService import PropiedadService
+
+COLUMNAS = ["rating_avg", "rating_count", "rating_sum"]
+
+def agregar_columnas(conn):
+    """Agrega las columnas de agregados que falten en la tabla propiedad"""
+    existentes = {c["name"] for c in inspect(conn).get_columns("propiedad")}
+    for nombre in COLUMNAS:
+        if nombre in existentes:
+            continue
+        columna = Propiedad.__table__.columns[nombre]
+        tipo = columna.type.compile(dialect=conn.dialect)
+        conn.exec_driver_sql(f"ALTER TABLE propiedad ADD COLUMN {nombre} {tipo} NOT NULL DEFAULT 0")
+        print(f"- Columna agregada: propiedad.{nombre}")
+    for index in Propiedad.__table__.indexes:
+        if index.name == "ix_propiedad_rating":
+            index.create(conn, checkfirst=True)
+
+async def rebuild_ratings():
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(agregar_columnas)
+        
+        print("Recalculando valoraciones...")
+        async with async_session() as session:
+            await PropiedadService.recalcular_ratings(session)
+        print("Backfill completado exitosamente!")
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(rebuild_ratings())
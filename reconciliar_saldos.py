@@ -0,0 +1,42 @@
+"""
+Script de reconciliación de los saldos de propietarios (tabla saldo_propietario)
+Compara cada saldo con la suma de las comisiones del propietario por estado e informa las diferencias.
+Con --corregir reemplaza los saldos distintos por los calculados; sirve también para el backfill
+inicial en bases que ya tenían comisiones.
+Ejecutar con: python reconciliar_saldos.py [--corregir]
+"""
+
+import asyncio
+import sys
+from dotenv import load_dotenv
+
+# Cargar variables de entorno
+load_dotenv()
+
+from sqlmodel import SQLModel
+from app.db import engine, async_session
+from models import SaldoPropietario
+from services.SaldoService import SaldoService
+
+async def reconciliar_saldos(corregir: bool) -> int:
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all, tables=[SaldoPropietario.__table__])
+        
+        print("Reconciliando saldos...")
+        async with async_session() as session:
+            diferencias = await SaldoService.reconciliar(session, corregir=corregir)
+        for diferencia in diferencias:
+            print(f"- {diferencia['propietario_id']}: guardado {diferencia['guardado']}, calculado {diferencia['calculado']}")
+        if not diferencias:
+            print("Los saldos coinciden con las comisiones")
+        elif corregir:
+            print(f"{len(diferencias)} saldos corregidos")
+        return len(diferencias)
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    corregir = "--corregir" in sys.argv
+    diferencias = asyncio.run(reconciliar_saldos(corregir))
+    sys.exit(1 if diferencias and not corregir else 0)
@@ -48,6 +48,10 @@ class ResumenComisionesResponse(BaseModel):
     cantidad_total: int
     por_estado: dict
 
+class LoteComisionesRequest(BaseModel):
+    comision_ids: Optional[List[UUID]] = None  # Comisiones a cambiar de estado...
+    propietario_id: Optional[UUID] = None      # ...o todas las del propietario en el estado de origen
+
 class ApiResponse(BaseModel):
     success: bool
     message: Optional[str] = None
@@ -2,4 +2,5 @@ from services import BaseService
 from models import Boleta
 
 class BoletaService(BaseService):
-    model = Boleta
\ No newline at end of file
+    model = Boleta
+    sortable_fields = ("id", "emision", "total")
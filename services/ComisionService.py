@@ -1,18 +1,27 @@
 from typing import List, Optional, Dict, Any
+from collections import defaultdict
 from uuid import UUID
 from datetime import datetime
-from sqlmodel import Session, select
+from sqlmodel import select, update, func, or_, and_
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from models import Comision, Pago, Usuario
 from models.types import ComisionStatus
+from services import encode_cursor, decode_cursor
+from services.SaldoService import SaldoService
+
+# Agrupaciones admitidas en el resumen por período
+PERIODOS = ("dia", "semana", "mes")
+# Cantidad máxima de IDs por sentencia IN en los cambios de estado por lote
+TAMANO_LOTE = 1000
 
 
 class ComisionService:
     
     @staticmethod
-    def obtener_comisiones_propietario(
+    async def obtener_comisiones_propietario(
         propietario_id: UUID, 
-        session: Session,
+        session: AsyncSession,
         estado: Optional[ComisionStatus] = None
     ) -> List[Comision]:
         """
@@ -31,10 +40,10 @@ class ComisionService:
         if estado:
             query = query.where(Comision.estado == estado)
             
-        return session.exec(query).all()
+        return (await session.exec(query)).all()
     
     @staticmethod
-    def procesar_comision(comision_id: UUID, session: Session) -> bool:
+    async def procesar_comision(comision_id: UUID, session: AsyncSession) -> bool:
         """
         Marca una comisión como procesada (lista para pago)
         
@@ -45,21 +54,13 @@ class ComisionService:
         Returns:
             True si se procesó correctamente
         """
-        comision = session.get(Comision, comision_id)
-        if not comision:
-            raise ValueError("Comisión no encontrada")
-        
-        if comision.estado != ComisionStatus.pendiente:
-            raise ValueError("La comisión no está en estado pendiente")
-        
-        comision.estado = ComisionStatus.procesada
-        comision.fecha_procesamiento = datetime.now()
-        session.commit()
-        
-        return True
+        return await ComisionService.transicionar_comision(
+            session, comision_id, ComisionStatus.pendiente, ComisionStatus.procesada,
+            "La comisión no está en estado pendiente"
+        )
     
     @staticmethod
-    def completar_comision(comision_id: UUID, session: Session) -> bool:
+    async def completar_comision(comision_id: UUID, session: AsyncSession) -> bool:
         """
         Marca una comisión como completada (pago realizado)
         
@@ -70,101 +71,290 @@ class ComisionService:
         Returns:
             True si se completó correctamente
         """
-        comision = session.get(Comision, comision_id)
-        if not comision:
-            raise ValueError("Comisión no encontrada")
+        return await ComisionService.transicionar_comision(
+            session, comision_id, ComisionStatus.procesada, ComisionStatus.completada,
+            "La comisión debe estar procesada primero"
+        )
+    
+    @staticmethod
+    async def transicionar_comision(
+        session: AsyncSession,
+        comision_id: UUID,
+        origen: ComisionStatus,
+        destino: ComisionStatus,
+        error: str
+    ) -> bool:
+        """
+        Cambia el estado de una comisión con el mismo UPDATE ... WHERE estado = origen que el cambio
+        por lote: dos peticiones simultáneas no pueden mover el saldo dos veces.
+        
+        Args:
+            session: Sesión de base de datos
+            comision_id: ID de la comisión
+            origen: Estado en el que debe estar la comisión
+            destino: Estado al que pasa
+            error: Mensaje si la comisión no está en el estado de origen
+            
+        Returns:
+            True si se cambió el estado
+        """
+        resultado = await ComisionService.transicionar_comisiones(session, origen, destino, comision_ids=[comision_id])
+        if resultado["fallidas"]:
+            motivo = resultado["fallidas"][str(comision_id)]
+            raise ValueError(motivo if motivo == "Comisión no encontrada" else error)
+        return True
+    
+    @staticmethod
+    async def transicionar_comisiones(
+        session: AsyncSession,
+        origen: ComisionStatus,
+        destino: ComisionStatus,
+        comision_ids: Optional[List[UUID]] = None,
+        propietario_id: Optional[UUID] = None
+    ) -> Dict[str, Any]:
+        """
+        Cambia de estado un lote de comisiones con UPDATE ... WHERE estado = origen, en una transacción.
         
-        if comision.estado != ComisionStatus.procesada:
-            raise ValueError("La comisión debe estar procesada primero")
+        Args:
+            session: Sesión de base de datos
+            origen: Estado en el que deben estar las comisiones
+            destino: Estado al que pasan
+            comision_ids: IDs de las comisiones (o bien propietario_id)
+            propietario_id: Pasa todas las comisiones del propietario que estén en el estado de origen
+            
+        Returns:
+            Diccionario con los IDs actualizados y los que no cumplían la condición con su motivo
+        """
+        if (comision_ids is None) == (propietario_id is None):
+            raise ValueError("Indique comision_ids o propietario_id")
         
-        comision.estado = ComisionStatus.completada
-        session.commit()
+        # Se bloquean las filas candidatas para que nadie cambie su estado entre la lectura y el UPDATE
+        columnas = (Comision.id, Comision.estado, Comision.propietario_id, Comision.monto)
+        if comision_ids is not None:
+            solicitados = list(dict.fromkeys(comision_ids))
+            filas = {}
+            for i in range(0, len(solicitados), TAMANO_LOTE):
+                filas.update((fila[0], fila) for fila in (await session.exec(
+                    select(*columnas)
+                    .where(Comision.id.in_(solicitados[i:i + TAMANO_LOTE]))
+                    .with_for_update()
+                )).all())
+            fallidas = {}
+            for comision_id in solicitados:
+                fila = filas.get(comision_id)
+                if fila is None:
+                    fallidas[str(comision_id)] = "Comisión no encontrada"
+                elif fila.estado != origen:
+                    fallidas[str(comision_id)] = f"La comisión está en estado {fila.estado.value}, no {origen.value}"
+            candidatas = [filas[c] for c in solicitados if str(c) not in fallidas]
+        else:
+            candidatas = (await session.exec(
+                select(*columnas)
+                .where(Comision.propietario_id == propietario_id, Comision.estado == origen)
+                .with_for_update()
+            )).all()
+            fallidas = {}
+        elegibles = [fila.id for fila in candidatas]
+        montos = defaultdict(int)
+        for fila in candidatas:
+            montos[fila.propietario_id] += fila.monto
         
-        return True
+        valores = {"estado": destino}
+        if destino == ComisionStatus.procesada:
+            valores["fecha_procesamiento"] = datetime.now()
+        actualizadas = 0
+        try:
+            for i in range(0, len(elegibles), TAMANO_LOTE):
+                resultado = await session.exec(
+                    update(Comision)
+                    .where(Comision.id.in_(elegibles[i:i + TAMANO_LOTE]), Comision.estado == origen)
+                    .values(**valores)
+                    .execution_options(synchronize_session=False)
+                )
+                actualizadas += resultado.rowcount
+            if actualizadas != len(elegibles):
+                raise ValueError("Otra operación cambió el estado de algunas comisiones; no se aplicó ningún cambio")
+            await SaldoService.mover(session, montos, destino, origen)
+            await session.commit()
+        except BaseException:
+            await session.rollback()
+            raise
+        
+        return {
+            "actualizadas": [str(c) for c in elegibles],
+            "fallidas": fallidas
+        }
+    
+    @staticmethod
+    def expresion_periodo(columna, agrupar: str, dialecto: str):
+        """
+        Expresión SQL con la clave del período de una fecha: "AAAA-MM-DD" para dia,
+        el lunes de la semana ("AAAA-MM-DD") para semana y "AAAA-MM" para mes
+        """
+        if agrupar not in PERIODOS:
+            raise ValueError(f"Agrupación desconocida '{agrupar}'. Valores permitidos: {', '.join(PERIODOS)}")
+        if dialecto == "sqlite":
+            if agrupar == "semana":
+                # 'weekday 0' avanza al domingo (o se queda en él); 6 días antes es el lunes
+                return func.date(columna, "weekday 0", "-6 days")
+            return func.strftime("%Y-%m-%d" if agrupar == "dia" else "%Y-%m", columna)
+        if dialecto == "mysql":
+            if agrupar == "semana":
+                return func.date_format(func.subdate(columna, func.weekday(columna)), "%Y-%m-%d")
+            return func.date_format(columna, "%Y-%m-%d" if agrupar == "dia" else "%Y-%m")
+        if dialecto == "postgresql":
+            formato = "YYYY-MM" if agrupar == "mes" else "YYYY-MM-DD"
+            truncar = {"dia": "day", "semana": "week", "mes": "month"}[agrupar]
+            return func.to_char(func.date_trunc(truncar, columna), formato)
+        raise ValueError(f"Agrupación por período no disponible para {dialecto}")
     
     @staticmethod
-    def obtener_resumen_comisiones_periodo(
+    async def obtener_resumen_comisiones_periodo(
         fecha_inicio: datetime,
         fecha_fin: datetime,
-        session: Session
+        session: AsyncSession,
+        agrupar: Optional[str] = None
     ) -> Dict[str, Any]:
         """
-        Obtiene un resumen de las comisiones en un período
+        Obtiene un resumen de las comisiones en un período.
+        Los totales se calculan en la base de datos (SUM/COUNT ... GROUP BY estado) usando
+        el índice ix_comision_fecha_estado; no se cargan las comisiones.
         
         Args:
             fecha_inicio: Fecha de inicio del período
             fecha_fin: Fecha de fin del período
             session: Sesión de base de datos
+            agrupar: Opcional, "dia", "semana" o "mes" para desglosar el período en la misma consulta
             
         Returns:
-            Diccionario con el resumen
+            Diccionario con el resumen (y "por_periodo" si se pidió agrupar)
         """
-        query = select(Comision).where(
+        columnas = [Comision.estado, func.count(Comision.id), func.coalesce(func.sum(Comision.monto), 0)]
+        if agrupar:
+            periodo = ComisionService.expresion_periodo(
+                Comision.fecha_creacion, agrupar, session.get_bind().dialect.name
+            ).label("periodo")
+            columnas.insert(0, periodo)
+        query = select(*columnas).where(
             Comision.fecha_creacion >= fecha_inicio,
             Comision.fecha_creacion <= fecha_fin
         )
+        if agrupar:
+            query = query.group_by(periodo, Comision.estado).order_by(periodo)
+        else:
+            query = query.group_by(Comision.estado)
+        filas = (await session.exec(query)).all()
         
-        comisiones = session.exec(query).all()
-        
-        total_comisiones = sum(c.monto for c in comisiones)
-        comisiones_por_estado = {}
+        def vacio() -> Dict[str, Any]:
+            return {estado.value: {"cantidad": 0, "monto_total": 0} for estado in ComisionStatus}
         
-        for estado in ComisionStatus:
-            comisiones_estado = [c for c in comisiones if c.estado == estado]
-            comisiones_por_estado[estado.value] = {
-                "cantidad": len(comisiones_estado),
-                "monto_total": sum(c.monto for c in comisiones_estado)
-            }
+        comisiones_por_estado = vacio()
+        por_periodo: Dict[str, Dict[str, Any]] = {}
+        for fila in filas:
+            *clave, estado, cantidad, monto = fila
+            comisiones_por_estado[estado.value]["cantidad"] += cantidad
+            comisiones_por_estado[estado.value]["monto_total"] += int(monto)
+            if agrupar:
+                bucket = por_periodo.setdefault(str(clave[0]), {"cantidad": 0, "monto_total": 0, "por_estado": vacio()})
+                bucket["cantidad"] += cantidad
+                bucket["monto_total"] += int(monto)
+                bucket["por_estado"][estado.value] = {"cantidad": cantidad, "monto_total": int(monto)}
         
-        return {
+        resumen = {
             "periodo": {
                 "inicio": fecha_inicio.isoformat(),
                 "fin": fecha_fin.isoformat()
             },
-            "total_comisiones": total_comisiones,
-            "cantidad_total": len(comisiones),
+            "total_comisiones": sum(e["monto_total"] for e in comisiones_por_estado.values()),
+            "cantidad_total": sum(e["cantidad"] for e in comisiones_por_estado.values()),
             "por_estado": comisiones_por_estado
         }
+        if agrupar:
+            resumen["agrupacion"] = agrupar
+            resumen["por_periodo"] = [{"periodo": clave, **datos} for clave, datos in por_periodo.items()]
+        return resumen
     
     @staticmethod
-    def obtener_comisiones_a_pagar(session: Session) -> List[Dict[str, Any]]:
+    async def obtener_comisiones_a_pagar(session: AsyncSession) -> List[Dict[str, Any]]:
         """
-        Obtiene todas las comisiones que están listas para ser pagadas a los propietarios
+        Obtiene los totales a pagar por propietario (comisiones procesadas) en una sola consulta
+        agrupada. El detalle de cada propietario se pide aparte con obtener_detalle_a_pagar.
         
         Args:
             session: Sesión de base de datos
             
         Returns:
-            Lista de comisiones agrupadas por propietario
+            Lista con el propietario, la cantidad de comisiones y el monto total, de mayor a menor monto
         """
-        query = select(Comision).where(Comision.estado == ComisionStatus.procesada)
-        comisiones = session.exec(query).all()
-        
-        # Agrupar por propietario
-        comisiones_por_propietario = {}
+        monto_total = func.sum(Comision.monto)
+        query = (
+            select(
+                Comision.propietario_id, Usuario.nombres, Usuario.appaterno, Usuario.email,
+                func.count(Comision.id), monto_total
+            )
+            .outerjoin(Usuario, Usuario.id == Comision.propietario_id)
+            .where(Comision.estado == ComisionStatus.procesada)
+            .group_by(Comision.propietario_id, Usuario.nombres, Usuario.appaterno, Usuario.email)
+            .order_by(monto_total.desc())
+        )
+        filas = (await session.exec(query)).all()
+        return [
+            {
+                "propietario": {
+                    "id": str(propietario_id),
+                    "nombre": f"{nombres} {appaterno}" if email else "N/A",
+                    "email": email or "N/A"
+                },
+                "cantidad": cantidad,
+                "monto_total": int(monto)
+            }
+            for propietario_id, nombres, appaterno, email, cantidad, monto in filas
+        ]
+    
+    @staticmethod
+    async def obtener_detalle_a_pagar(
+        propietario_id: UUID,
+        session: AsyncSession,
+        limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Comisiones procesadas de un propietario, paginadas por cursor (fecha_creacion, id)
         
-        for comision in comisiones:
-            propietario_id = str(comision.propietario_id)
-            
-            if propietario_id not in comisiones_por_propietario:
-                propietario = session.get(Usuario, comision.propietario_id)
-                comisiones_por_propietario[propietario_id] = {
-                    "propietario": {
-                        "id": propietario_id,
-                        "nombre": f"{propietario.nombres} {propietario.appaterno}" if propietario else "N/A",
-                        "email": propietario.email if propietario else "N/A"
-                    },
-                    "comisiones": [],
-                    "monto_total": 0
-                }
+        Args:
+            propietario_id: ID del propietario
+            session: Sesión de base de datos
+            limit: Cantidad máxima de comisiones por página
+            cursor: Cursor devuelto por la página anterior (None para la primera)
             
-            comisiones_por_propietario[propietario_id]["comisiones"].append({
+        Returns:
+            La página de comisiones y el cursor de la siguiente (None si no hay más)
+        """
+        query = select(Comision).where(
+            Comision.estado == ComisionStatus.procesada,
+            Comision.propietario_id == propietario_id
+        )
+        if cursor:
+            campo, valor, ultimo_id = decode_cursor(cursor)
+            if campo != "fecha_creacion":
+                raise ValueError("El cursor no corresponde a este listado")
+            fecha = datetime.fromisoformat(valor)
+            query = query.where(or_(
+                Comision.fecha_creacion > fecha,
+                and_(Comision.fecha_creacion == fecha, Comision.id > ultimo_id)
+            ))
+        query = query.order_by(Comision.fecha_creacion, Comision.id).limit(limit + 1)
+        comisiones = (await session.exec(query)).all()
+        pagina = comisiones[:limit]
+        next_cursor = None
+        if len(comisiones) > limit:
+            next_cursor = encode_cursor("fecha_creacion", pagina[-1].fecha_creacion, pagina[-1].id)
+        return [
+            {
                 "id": str(comision.id),
                 "monto": comision.monto,
                 "fecha_creacion": comision.fecha_creacion.isoformat(),
                 "descripcion": comision.descripcion
-            })
-            
-            comisiones_por_propietario[propietario_id]["monto_total"] += comision.monto
-        
-        return list(comisiones_por_propietario.values())
+            }
+            for comision in pagina
+        ], next_cursor
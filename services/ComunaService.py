@@ -2,4 +2,5 @@ from services import BaseService
 from models import Comuna
 
 class ComunaService(BaseService):
-    model = Comuna
\ No newline at end of file
+    model = Comuna
+    sortable_fields = ("id", "nombre")
@@ -0,0 +1,120 @@
+from typing import AsyncIterator, Optional
+from uuid import UUID
+from datetime import datetime
+from sqlmodel import select
+import csv
+import enum
+import io
+import json
+import os
+
+from models import Comision, Pago, Reserva
+from models.manyToMany import UsuarioPropiedad
+from models.types import ComisionStatus, PagoStatus
+from app.db import async_session
+
+# Formatos de exportación y su tipo de contenido
+FORMATOS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+# Filas que se leen del cursor del servidor y se envían juntas en cada bloque de la respuesta
+FILAS_POR_BLOQUE = int(os.getenv("EXPORTACION_FILAS_POR_BLOQUE", "500"))
+
+COLUMNAS_PAGO = (
+    Pago.id, Pago.fecha_creacion, Pago.fecha_procesamiento, Pago.estado, Pago.monto_total,
+    Pago.monto_propietario, Pago.monto_comision, Pago.moneda, Pago.reserva_id,
+    Pago.mp_payment_id, Pago.mp_status,
+)
+COLUMNAS_COMISION = (
+    Comision.id, Comision.fecha_creacion, Comision.fecha_procesamiento, Comision.estado, Comision.monto,
+    Comision.porcentaje, Comision.pago_id, Comision.propietario_id, Comision.descripcion,
+)
+
+def valor_exportable(valor):
+    """Valor de una columna tal como se escribe en el archivo"""
+    if isinstance(valor, enum.Enum):
+        return valor.value
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    if isinstance(valor, UUID):
+        return str(valor)
+    return valor
+
+
+class ExportacionService:
+
+    @staticmethod
+    def consulta_pagos(
+        desde: Optional[datetime] = None,
+        hasta: Optional[datetime] = None,
+        estado: Optional[PagoStatus] = None,
+        propietario_id: Optional[UUID] = None
+    ):
+        """Pagos por fecha de creación, estado y propietario de la propiedad reservada"""
+        query = select(*COLUMNAS_PAGO)
+        if desde:
+            query = query.where(Pago.fecha_creacion >= desde)
+        if hasta:
+            query = query.where(Pago.fecha_creacion <= hasta)
+        if estado:
+            query = query.where(Pago.estado == estado)
+        if propietario_id:
+            propiedades = select(UsuarioPropiedad.propiedad_id).where(UsuarioPropiedad.usuario_id == propietario_id)
+            query = query.join(Reserva, Reserva.id == Pago.reserva_id).where(Reserva.propiedad_id.in_(propiedades))
+        return query.order_by(Pago.fecha_creacion, Pago.id)
+
+    @staticmethod
+    def consulta_comisiones(
+        desde: Optional[datetime] = None,
+        hasta: Optional[datetime] = None,
+        estado: Optional[ComisionStatus] = None,
+        propietario_id: Optional[UUID] = None
+    ):
+        """Comisiones por fecha de creación, estado y propietario"""
+        query = select(*COLUMNAS_COMISION)
+        if desde:
+            query = query.where(Comision.fecha_creacion >= desde)
+        if hasta:
+            query = query.where(Comision.fecha_creacion <= hasta)
+        if estado:
+            query = query.where(Comision.estado == estado)
+        if propietario_id:
+            query = query.where(Comision.propietario_id == propietario_id)
+        return query.order_by(Comision.fecha_creacion, Comision.id)
+
+    @staticmethod
+    def exportar(query, formato: str, session_factory=async_session) -> AsyncIterator[bytes]:
+        """
+        Genera el archivo por bloques a medida que se leen las filas con un cursor del servidor
+        (stream + yield_per): la memoria no depende de la cantidad de filas y el primer bloque
+        sale en cuanto llega la primera página de resultados.
+        El formato se valida antes de empezar, para poder responder con un error normal.
+        """
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato desconocido '{formato}'. Formatos permitidos: {', '.join(FORMATOS)}")
+        columnas = [c.name for c in query.selected_columns]
+
+        async def generar() -> AsyncIterator[bytes]:
+            buffer = io.StringIO()
+            escritor = csv.writer(buffer, lineterminator="\n")
+            if formato == "csv":
+                escritor.writerow(columnas)
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+            async with session_factory() as session:
+                resultado = await session.stream(query.execution_options(yield_per=FILAS_POR_BLOQUE))
+                async for filas in resultado.partitions():
+                    for fila in filas:
+                        valores = [valor_exportable(v) for v in fila]
+                        if formato == "csv":
+                            escritor.writerow(valores)
+                        else:
+                            buffer.write(json.dumps(dict(zip(columnas, valores)), ensure_ascii=False))
+                            buffer.write("\n")
+                    yield buffer.getvalue().encode()
+                    buffer.seek(0)
+                    buffer.truncate()
+
+        return generar()
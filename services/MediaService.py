@@ -0,0 +1,82 @@
+from services import BaseService
+from models import MediaBlob
+from controllers.Media import delete_blobs, ruta_media
+from sqlalchemy import update, delete
+from sqlmodel import select
+from app.db import AsyncSessionDep
+from collections import Counter
+
+class MediaService(BaseService):
+    model = MediaBlob
+
+    # Los archivos se guardan por contenido y pueden compartirse entre propiedades:
+    # cada ruta lleva un contador de referencias y el archivo se borra cuando llega a cero.
+    # retener/liberar no hacen commit, corren dentro de la transacción del llamador.
+
+    @classmethod
+    async def retener(cls, session: AsyncSessionDep, subidas: list[dict]):
+        """Suma una referencia por cada archivo devuelto por upload_image, creando el registro si no existe"""
+        if not subidas:
+            return
+        conteo = Counter(ruta_media(subida) for subida in subidas)
+        tamanos = {ruta_media(subida): subida["size"] for subida in subidas}
+        filas = [{"ruta": ruta, "referencias": n, "tamano": tamanos[ruta]} for ruta, n in conteo.items()]
+        dialecto = session.get_bind().dialect.name
+        if dialecto == "mysql":
+            from sqlalchemy.dialects.mysql import insert
+            query = insert(MediaBlob).values(filas)
+            await session.exec(query.on_duplicate_key_update(referencias=MediaBlob.referencias + query.inserted.referencias))
+        elif dialecto == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+            query = insert(MediaBlob).values(filas)
+            await session.exec(query.on_conflict_do_update(
+                index_elements=[MediaBlob.ruta],
+                set_={"referencias": MediaBlob.referencias + query.excluded.referencias},
+            ))
+        else:
+            for fila in filas:
+                resultado = await session.exec(
+                    update(MediaBlob).where(MediaBlob.ruta == fila["ruta"]).values(referencias=MediaBlob.referencias + fila["referencias"])
+                )
+                if resultado.rowcount == 0:
+                    session.add(MediaBlob(**fila))
+
+    @classmethod
+    async def liberar(cls, session: AsyncSessionDep, rutas: list[str]) -> list[str]:
+        """
+        Resta una referencia por aparición de cada ruta y elimina los registros que quedan en cero.
+        Devuelve las rutas huérfanas, que deben borrarse del disco después del commit (borrar_huerfanas).
+        Las rutas sin registro (archivos anteriores al almacenamiento por contenido) se ignoran.
+        """
+        conteo = Counter(ruta for ruta in rutas if ruta)
+        if not conteo:
+            return []
+        for cantidad in set(conteo.values()):
+            grupo = [ruta for ruta, n in conteo.items() if n == cantidad]
+            await session.exec(
+                update(MediaBlob)
+                .where(MediaBlob.ruta.in_(grupo))
+                .values(referencias=MediaBlob.referencias - cantidad)
+            )
+        huerfanas = list((await session.exec(
+            select(MediaBlob.ruta).where(MediaBlob.ruta.in_(conteo), MediaBlob.referencias <= 0)
+        )).all())
+        if huerfanas:
+            await session.exec(delete(MediaBlob).where(MediaBlob.ruta.in_(huerfanas)))
+        return huerfanas
+
+    @classmethod
+    async def borrar_huerfanas(cls, session: AsyncSessionDep, rutas: list[str]):
+        """Borra del disco las rutas liberadas, salvo las que otra subida volvió a registrar entretanto"""
+        if not rutas:
+            return
+        registradas = set((await session.exec(select(MediaBlob.ruta).where(MediaBlob.ruta.in_(rutas)))).all())
+        await delete_blobs([ruta for ruta in rutas if ruta not in registradas])
+
+    @classmethod
+    async def descartar(cls, session: AsyncSessionDep, rutas: list[str]):
+        """Libera rutas retenidas por una operación que falló, confirma y borra las que quedan huérfanas"""
+        await session.rollback()
+        huerfanas = await cls.liberar(session, rutas)
+        await session.commit()
+        await cls.borrar_huerfanas(session, huerfanas)
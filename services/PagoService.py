@@ -1,12 +1,18 @@
-import mercadopago
 from typing import Dict, Any, Optional
 from uuid import UUID
 from datetime import datetime
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.orm import selectinload
 import os
-from app.db import get_session
-from models import Pago, Comision, Reserva, Usuario
+from models import Pago, Comision, Reserva, Usuario, Propiedad
 from models.types import PagoStatus, ComisionStatus
+from controllers.MercadoPago import MercadoPagoClient
+from app.cache import TTLCache
+from app.db import async_session
+from controllers.Broadcast import get_broadcast
+from services.SaldoService import SaldoService
+import asyncio
 
 NOTIF_URL = os.getenv("MERCADOPAGO_WEBHOOK_URL")
 
@@ -14,18 +20,44 @@ SUCCESS_URL = os.getenv("FRONTEND_SUCCESS_URL")
 ERROR_URL = os.getenv("FRONTEND_ERROR_URL")
 PENDING_URL = os.getenv("FRONTEND_PENDING_URL")
 
+# Caché de la información de pagos de MercadoPago por mp_payment_id, para el polling de /pagos/estado.
+# El procesador de notificaciones la actualiza con la respuesta que acaba de consultar.
+MP_PAGO_CACHE_SIZE = int(os.getenv("MP_PAGO_CACHE_SIZE", "2048"))
+MP_PAGO_CACHE_TTL = float(os.getenv("MP_PAGO_CACHE_TTL", "10"))
+pagos_mp_cache = TTLCache(maxsize=MP_PAGO_CACHE_SIZE, ttl=MP_PAGO_CACHE_TTL)
+# Consultas en curso por mp_payment_id: los polls simultáneos de un mismo pago esperan la misma respuesta
+_consultas_en_curso: dict[str, asyncio.Future] = {}
+
+# Estados de Pago que ya no cambian: no se vuelve a consultar a MercadoPago
+ESTADOS_FINALES = {PagoStatus.aprobado, PagoStatus.rechazado, PagoStatus.cancelado}
+
+# Segundos sin cambios tras los que el seguimiento de un pago envía un latido y revisa la base de datos
+SEGUIMIENTO_LATIDO = float(os.getenv("PAGO_SEGUIMIENTO_LATIDO", "15"))
+
+def canal_pago(pago_id: UUID) -> str:
+    """Canal de broadcast en el que se publican los cambios de estado de un pago"""
+    return f"pago:{pago_id}"
+
+def estado_pago(pago: Pago) -> Dict[str, Any]:
+    return {
+        "id": str(pago.id),
+        "estado": pago.estado.value,
+        "mp_status": pago.mp_status,
+        "fecha_procesamiento": pago.fecha_procesamiento.isoformat() if pago.fecha_procesamiento else None,
+    }
+
 
 class MercadoPagoService:
-    def __init__(self, access_token: str):
+    def __init__(self, client: MercadoPagoClient):
         """
         Inicializa el servicio de MercadoPago
         
         Args:
-            access_token: Token de acceso de MercadoPago
+            client: Cliente compartido de la API de MercadoPago (get_mp_client)
         """
-        self.sdk = mercadopago.SDK(access_token)
+        self.client = client
         
-    def crear_preferencia_pago(self, reserva_id: UUID, session: Session) -> Dict[str, Any]:
+    async def crear_preferencia_pago(self, reserva_id: UUID, session: AsyncSession) -> Dict[str, Any]:
         """
         Crea una preferencia de pago en MercadoPago
         
@@ -37,7 +69,7 @@ class MercadoPagoService:
             Diccionario con la información de la preferencia creada
         """
         # Obtener la reserva
-        reserva = session.get(Reserva, reserva_id)
+        reserva = await session.get(Reserva, reserva_id)
         if not reserva:
             raise ValueError("Reserva no encontrada")
             
@@ -55,8 +87,8 @@ class MercadoPagoService:
             mp_external_reference=str(reserva_id)
         )
         session.add(pago)
-        session.commit()
-        session.refresh(pago)
+        await session.commit()
+        await session.refresh(pago)
         
         # Configurar la preferencia de MercadoPago
         preference_data = {
@@ -79,12 +111,12 @@ class MercadoPagoService:
         }
         
         # Crear la preferencia en MercadoPago
-        preference_response = self.sdk.preference().create(preference_data)
+        preference_response = await self.client.crear_preferencia(preference_data, idempotency_key=str(pago.id))
         
         if preference_response["status"] == 201:
             # Actualizar el pago con el ID de la preferencia
             pago.mp_preference_id = preference_response["response"]["id"]
-            session.commit()
+            await session.commit()
             
             return {
                 "pago_id": str(pago.id),
@@ -95,9 +127,10 @@ class MercadoPagoService:
         else:
             raise Exception(f"Error al crear preferencia: {preference_response}")
     
-    def procesar_webhook(self, payment_id: str, session: Session) -> bool:
+    async def procesar_webhook(self, payment_id: str, session: AsyncSession) -> bool:
         """
-        Procesa el webhook de MercadoPago cuando se completa un pago
+        Procesa el webhook de MercadoPago cuando se completa un pago.
+        Es idempotente: lo ejecutan los workers de WebhookService y puede repetirse para un mismo pago.
         
         Args:
             payment_id: ID del pago en MercadoPago
@@ -107,26 +140,28 @@ class MercadoPagoService:
             True si el procesamiento fue exitoso
         """
         # Obtener información del pago desde MercadoPago
-        payment_info = self.sdk.payment().get(payment_id)
+        payment_info = await self.client.obtener_pago(payment_id)
         
         if payment_info["status"] != 200:
             raise Exception(f"Error al obtener información del pago: {payment_info}")
         
         payment_data = payment_info["response"]
+        pagos_mp_cache.set(payment_id, payment_data)
         external_reference = payment_data.get("external_reference")
         
         if not external_reference:
             raise ValueError("No se encontró referencia externa en el pago")
         
         # Buscar el pago en la base de datos
-        pago = session.exec(
+        pago = (await session.exec(
             select(Pago).where(Pago.id == UUID(external_reference))
-        ).first()
+        )).first()
         
         if not pago:
             raise ValueError("Pago no encontrado en la base de datos")
         
         # Actualizar el estado del pago
+        estado_anterior = (pago.estado, pago.mp_status)
         pago.mp_payment_id = payment_id
         pago.mp_status = payment_data["status"]
         pago.fecha_procesamiento = datetime.now()
@@ -134,12 +169,18 @@ class MercadoPagoService:
         if payment_data["status"] == "approved":
             pago.estado = PagoStatus.aprobado
             
-            # Crear la comisión para el propietario
-            reserva = session.get(Reserva, pago.reserva_id)
+            # Crear la comisión para el propietario (una sola vez: la notificación puede repetirse)
+            comision_existente = (await session.exec(
+                select(Comision.id).where(Comision.pago_id == pago.id)
+            )).first()
+            reserva = await session.get(Reserva, pago.reserva_id) if not comision_existente else None
             if reserva and reserva.propiedad_id:
                 # Obtener el propietario de la propiedad
-                from models import Propiedad
-                propiedad = session.get(Propiedad, reserva.propiedad_id)
+                propiedad = await session.get(
+                    Propiedad, reserva.propiedad_id,
+                    options=[selectinload(Propiedad.propietarios)],
+                    populate_existing=True
+                )
                 if propiedad and propiedad.propietarios:
                     propietario = propiedad.propietarios[0]  # Asumimos un propietario principal
                     
@@ -150,16 +191,20 @@ class MercadoPagoService:
                         descripcion=f"Pago por reserva {reserva.id}"
                     )
                     session.add(comision)
+                    await SaldoService.mover(session, {propietario.id: comision.monto}, ComisionStatus.pendiente)
                     
         elif payment_data["status"] == "rejected":
             pago.estado = PagoStatus.rechazado
         elif payment_data["status"] == "cancelled":
             pago.estado = PagoStatus.cancelado
         
-        session.commit()
+        await session.commit()
+        # Avisar a quienes siguen el pago (SSE/WebSocket), también en otros workers
+        if (pago.estado, pago.mp_status) != estado_anterior:
+            await get_broadcast().publicar(canal_pago(pago.id), estado_pago(pago))
         return True
     
-    def obtener_estado_pago(self, pago_id: UUID, session: Session) -> Dict[str, Any]:
+    async def obtener_estado_pago(self, pago_id: UUID, session: AsyncSession) -> Dict[str, Any]:
         """
         Obtiene el estado actual de un pago
         
@@ -170,7 +215,7 @@ class MercadoPagoService:
         Returns:
             Diccionario con el estado del pago
         """
-        pago = session.get(Pago, pago_id)
+        pago = await session.get(Pago, pago_id)
         if not pago:
             raise ValueError("Pago no encontrado")
         
@@ -185,13 +230,70 @@ class MercadoPagoService:
             "mp_status": pago.mp_status
         }
         
-        # Si hay un payment_id de MercadoPago, obtener información actualizada
+        # Si hay un payment_id de MercadoPago, obtener información actualizada.
+        # En un estado final basta con lo guardado (y lo que haya en caché)
         if pago.mp_payment_id:
-            try:
-                payment_info = self.sdk.payment().get(pago.mp_payment_id)
-                if payment_info["status"] == 200:
-                    resultado["mp_info"] = payment_info["response"]
-            except Exception:
-                pass  # Continuar sin la información de MP si hay error
+            mp_info = pagos_mp_cache.get(pago.mp_payment_id)
+            if mp_info is None and pago.estado not in ESTADOS_FINALES:
+                try:
+                    mp_info = await self.consultar_pago(pago.mp_payment_id)
+                except Exception:
+                    pass  # Continuar sin la información de MP si hay error
+            if mp_info is not None:
+                resultado["mp_info"] = mp_info
         
         return resultado
+    
+    async def consultar_pago(self, payment_id: str) -> Optional[Dict[str, Any]]:
+        """Consulta un pago en MercadoPago y lo guarda en caché; una sola consulta por pago a la vez"""
+        en_curso = _consultas_en_curso.get(payment_id)
+        if en_curso is not None:
+            return await asyncio.shield(en_curso)
+        futuro = asyncio.get_running_loop().create_future()
+        _consultas_en_curso[payment_id] = futuro
+        try:
+            payment_info = await self.client.obtener_pago(payment_id)
+            mp_info = payment_info["response"] if payment_info["status"] == 200 else None
+            if mp_info is not None:
+                pagos_mp_cache.set(payment_id, mp_info)
+            futuro.set_result(mp_info)
+            return mp_info
+        except Exception as e:
+            futuro.set_exception(e)
+            futuro.exception()  # Marcada como recuperada si nadie más la esperaba
+            raise
+        finally:
+            if not futuro.done():  # Cancelada: quienes esperaban siguen sin la información de MP
+                futuro.set_result(None)
+            _consultas_en_curso.pop(payment_id, None)
+    
+    @staticmethod
+    async def seguir_estado(pago_id: UUID, session_factory=async_session):
+        """
+        Genera el estado actual del pago y luego cada cambio publicado por procesar_webhook,
+        hasta llegar a un estado final. Genera None como latido cuando pasa SEGUIMIENTO_LATIDO
+        sin cambios; en ese momento también revisa la base de datos por si se perdió un mensaje.
+        """
+        async def leer() -> Optional[Dict[str, Any]]:
+            async with session_factory() as session:
+                pago = await session.get(Pago, pago_id)
+                return estado_pago(pago) if pago else None
+
+        # Suscribirse antes de leer el estado para no perder un cambio entre ambos pasos
+        async with get_broadcast().suscribir(canal_pago(pago_id)) as cola:
+            estado = await leer()
+            if estado is None:
+                raise ValueError("Pago no encontrado")
+            enviado = None
+            finales = {e.value for e in ESTADOS_FINALES}
+            while True:
+                if estado != enviado:
+                    yield estado
+                    enviado = estado
+                if estado["estado"] in finales:
+                    return
+                try:
+                    estado = await asyncio.wait_for(cola.get(), SEGUIMIENTO_LATIDO)
+                except asyncio.TimeoutError:
+                    yield None
+                    estado = await leer() or enviado
@@ -1,91 +1,266 @@
 from services import BaseService
-from models import Propiedad, PropiedadBase
-from controllers.Media import upload_image
+from services.MediaService import MediaService
+from models import Propiedad, PropiedadBase, Valoracion
+from controllers.Media import BLOBS_DIR, DOCS_DIR, colocar_archivos, recibir_archivos, subida_directa
+from controllers.Imagenes import procesar_derivados
 from fastapi import UploadFile, File
-from app.db import SessionDep
+from sqlalchemy import Float, case, cast, func, update
+from sqlalchemy.orm import joinedload, selectinload
+from sqlmodel import select
+from app.db import AsyncSessionDep, async_session
 from uuid import UUID
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Referencias a las tareas en segundo plano para que no sean recolectadas antes de terminar
+_tareas_derivados: set[asyncio.Task] = set()
 
 class PropiedadService(BaseService):
     model = Propiedad
+    # Relaciones de PropiedadRead: la comuna (muchos a uno) va en el mismo SELECT,
+    # las colecciones en un SELECT ... IN por relación, sin importar el tamaño de la página
+    load_options = (
+        joinedload(Propiedad.comuna),
+        selectinload(Propiedad.propietarios),
+        selectinload(Propiedad.valoraciones),
+    )
+    sortable_fields = ("id", "nombre", "tipo", "precio_hora", "capacidad", "rating_avg", "rating_count")
 
     @classmethod
-    def create(cls, session: SessionDep, obj: PropiedadBase, images: list[UploadFile] = [File(None)], documento: UploadFile | None = None):
-        # Upload images and get their paths
-        image_paths = []
-        db_obj: Propiedad = super().create(session, obj=obj)
-        for image in images:
-            if image and image.filename:
-                image_path = upload_image(str(db_obj.id), file=image)
-                image_paths.append(f"media/{image_path['folder']}/{image_path['filename']}")
-        db_obj.imagenes = image_paths
+    async def create(cls, session: AsyncSessionDep, obj: PropiedadBase, images: list[UploadFile] = [File(None)], documento: UploadFile | None = None):
+        # Se reciben todos los archivos antes de tocar la base de datos: si uno falla no queda nada
+        archivos = [(BLOBS_DIR, image) for image in images if image and image.filename]
+        if documento:
+            archivos.append((DOCS_DIR, documento))
+        recibidos = await recibir_archivos(archivos)
+        imagenes = recibidos[:-1] if documento else recibidos
 
-        # Upload document if provided
+        # La propiedad y las referencias a sus archivos se confirman en una sola transacción
+        db_obj = cls.model.model_validate(obj)
+        db_obj.imagenes = [recibido.ruta for recibido in imagenes]
         if documento:
-            doc_path = upload_image(f'{db_obj.id}/docs', file=documento)
-            db_obj.documento = f"media/{doc_path['folder']}/{doc_path['filename']}"
-        # Actualizar directamente en la base de datos
-        session.add(db_obj)
-        session.commit()
-        session.refresh(db_obj)
-        return db_obj
+            db_obj.documento = recibidos[-1].ruta
+        try:
+            session.add(db_obj)
+            await MediaService.retener(session, [recibido.resultado for recibido in recibidos])
+            await session.commit()
+        except BaseException:
+            for recibido in recibidos:
+                recibido.descartar()
+            raise
+        try:
+            await colocar_archivos(recibidos)
+        except BaseException:
+            await cls.delete(session, db_obj.id)
+            raise
+        cls.programar_derivados(db_obj.id, db_obj.imagenes)
+        return await cls.reload(session, db_obj)
     
     @classmethod
-    def update_with_images(cls, session: SessionDep, propiedad_id: UUID, images: list[UploadFile]):
+    async def update_with_images(cls, session: AsyncSessionDep, propiedad_id: UUID, images: list[UploadFile]):
         """Actualiza las imágenes de una propiedad existente"""
-        db_obj: Propiedad = session.get(cls.model, propiedad_id)
+        db_obj: Propiedad = await session.get(cls.model, propiedad_id)
         if not db_obj:
             raise ValueError(f"No existe una propiedad con id {propiedad_id}")
         
-        # Upload new images and get their paths
-        image_paths = []
-        for image in images:
-            if image and image.filename:
-                image_path = upload_image(str(db_obj.id), file=image)
-                image_paths.append(f"media/{image_path['folder']}/{image_path['filename']}")
-
-        # Update images (replace existing ones)
-        db_obj.imagenes = image_paths
-        session.add(db_obj)
-        session.commit()
-        session.refresh(db_obj)
+        recibidos = await cls.recibir_y_retener(session, [(BLOBS_DIR, image) for image in images if image and image.filename])
+        return await cls.reemplazar_imagenes(session, db_obj, [recibido.resultado for recibido in recibidos], retenidas=True)
+    
+    @classmethod
+    async def recibir_y_retener(cls, session: AsyncSessionDep, archivos: list[tuple[str, UploadFile]]):
+        """
+        Recibe los archivos, registra sus referencias y después los coloca en el almacenamiento.
+        Si algo falla se liberan las referencias y no queda ningún archivo sin referencia.
+        """
+        recibidos = await recibir_archivos(archivos)
+        try:
+            await MediaService.retener(session, [recibido.resultado for recibido in recibidos])
+            await session.commit()
+        except BaseException:
+            for recibido in recibidos:
+                recibido.descartar()
+            raise
+        try:
+            await colocar_archivos(recibidos)
+        except BaseException:
+            await MediaService.descartar(session, [recibido.ruta for recibido in recibidos])
+            raise
+        return recibidos
+    
+    @classmethod
+    async def asignar_subidas(cls, session: AsyncSessionDep, propiedad_id: UUID, imagenes: list[str] | None = None, documento: str | None = None):
+        """
+        Asigna a la propiedad archivos que el cliente subió directo al almacenamiento con una URL firmada
+        (claves de preparar_subida_directa). Las imágenes reemplazan a las existentes.
+        """
+        db_obj: Propiedad = await session.get(cls.model, propiedad_id)
+        if not db_obj:
+            raise ValueError(f"No existe una propiedad con id {propiedad_id}")
+        # Se verifican todas las claves antes de modificar la propiedad
+        doc_path = await subida_directa(documento) if documento else None
+        results = await asyncio.gather(*(subida_directa(clave) for clave in imagenes or []))
+        if doc_path:
+            db_obj = await cls.reemplazar_documento(session, db_obj, doc_path)
+        if imagenes is not None:
+            db_obj = await cls.reemplazar_imagenes(session, db_obj, results)
         return db_obj
     
     @classmethod
-    def update_document(cls, session: SessionDep, propiedad_id: UUID, documento: UploadFile):
+    async def reemplazar_imagenes(cls, session: AsyncSessionDep, db_obj: Propiedad, results: list[dict], retenidas: bool = False):
+        """Reemplaza las imágenes; con retenidas=True las referencias de results ya están registradas"""
+        image_paths = [f"media/{image_path['folder']}/{image_path['filename']}" for image_path in results]
+
+        # Update images (replace existing ones); las anteriores pierden una referencia
+        anteriores = list(db_obj.imagenes or [])
+        try:
+            db_obj.imagenes = image_paths
+            db_obj.imagenes_variantes = {}
+            session.add(db_obj)
+            if not retenidas:
+                await MediaService.retener(session, results)
+            huerfanas = await MediaService.liberar(session, anteriores)
+            await session.commit()
+        except BaseException:
+            if retenidas:
+                await MediaService.descartar(session, image_paths)
+            raise
+        await MediaService.borrar_huerfanas(session, huerfanas)
+        cls.programar_derivados(db_obj.id, image_paths)
+        return await cls.reload(session, db_obj)
+    
+    @classmethod
+    async def update_document(cls, session: AsyncSessionDep, propiedad_id: UUID, documento: UploadFile):
         """Actualiza el documento de una propiedad existente"""
-        db_obj: Propiedad = session.get(cls.model, propiedad_id)
+        db_obj: Propiedad = await session.get(cls.model, propiedad_id)
         if not db_obj:
             raise ValueError(f"No existe una propiedad con id {propiedad_id}")
         
-        # Upload document
-        doc_path = upload_image(f'{db_obj.id}/docs', file=documento)
+        [recibido] = await cls.recibir_y_retener(session, [(DOCS_DIR, documento)])
+        return await cls.reemplazar_documento(session, db_obj, recibido.resultado, retenido=True)
+    
+    @classmethod
+    async def reemplazar_documento(cls, session: AsyncSessionDep, db_obj: Propiedad, doc_path: dict, retenido: bool = False):
+        anterior = db_obj.documento
         db_obj.documento = f"media/{doc_path['folder']}/{doc_path['filename']}"
         
-        session.add(db_obj)
-        session.commit()
-        session.refresh(db_obj)
-        return db_obj
+        try:
+            session.add(db_obj)
+            if not retenido:
+                await MediaService.retener(session, [doc_path])
+            huerfanas = await MediaService.liberar(session, [anterior])
+            await session.commit()
+        except BaseException:
+            if retenido:
+                await MediaService.descartar(session, [db_obj.documento])
+            raise
+        await MediaService.borrar_huerfanas(session, huerfanas)
+        return await cls.reload(session, db_obj)
     
     @classmethod
-    def validate_property(cls, session: SessionDep, propiedad_id: UUID):
-        db_obj: Propiedad = session.get(cls.model, propiedad_id)
+    async def delete(cls, session: AsyncSessionDep, obj_id: UUID) -> None:
+        """Elimina la propiedad y libera sus imágenes y documento"""
+        db_obj: Propiedad = await session.get(cls.model, obj_id)
+        if not db_obj:
+            return
+        rutas = [*(db_obj.imagenes or []), db_obj.documento]
+        await session.delete(db_obj)
+        huerfanas = await MediaService.liberar(session, rutas)
+        await session.commit()
+        await MediaService.borrar_huerfanas(session, huerfanas)
+    
+    @classmethod
+    async def validate_property(cls, session: AsyncSessionDep, propiedad_id: UUID):
+        db_obj: Propiedad = await session.get(cls.model, propiedad_id)
         if not db_obj:
             raise ValueError(f"No existe una propiedad con id {propiedad_id}")
         db_obj.validada = True
         session.add(db_obj)
-        session.commit()
-        session.refresh(db_obj)
+        await session.commit()
+        await session.refresh(db_obj)
         return {"id": str(db_obj.id), "validada": db_obj.validada}
     
     @classmethod
-    def toggle_active_status(cls, session: SessionDep, propiedad_id: UUID):
-        db_obj: Propiedad = session.get(cls.model, propiedad_id)
+    async def toggle_active_status(cls, session: AsyncSessionDep, propiedad_id: UUID):
+        db_obj: Propiedad = await session.get(cls.model, propiedad_id)
         if not db_obj:
             raise ValueError(f"No existe una propiedad con id {propiedad_id}")
         
         # Toggle active status
         db_obj.activo = not db_obj.activo
         session.add(db_obj)
-        session.commit()
-        session.refresh(db_obj)
+        await session.commit()
+        await session.refresh(db_obj)
         return {"id": str(db_obj.id), "activo": db_obj.activo}
+    
+    @classmethod
+    async def ajustar_rating(cls, session: AsyncSessionDep, propiedad_id: UUID, delta_suma: int, delta_cantidad: int):
+        """
+        Ajusta los agregados de valoraciones con un UPDATE atómico, dentro de la transacción del llamador.
+        rating_avg se asigna primero porque MySQL evalúa el SET de izquierda a derecha.
+        """
+        cantidad = Propiedad.rating_count + delta_cantidad
+        promedio = case(
+            (cantidad > 0, cast(Propiedad.rating_sum + delta_suma, Float) / cantidad),
+            else_=0,
+        )
+        await session.exec(
+            update(Propiedad)
+            .where(Propiedad.id == propiedad_id)
+            .ordered_values(
+                (Propiedad.rating_avg, promedio),
+                (Propiedad.rating_sum, Propiedad.rating_sum + delta_suma),
+                (Propiedad.rating_count, cantidad),
+            )
+        )
+    
+    @classmethod
+    async def recalcular_ratings(cls, session: AsyncSessionDep, propiedad_id: UUID | None = None):
+        """Recalcula los agregados desde la tabla de valoraciones (backfill o corrección)"""
+        def agregado(funcion):
+            return func.coalesce(
+                select(funcion(Valoracion.puntaje))
+                .where(Valoracion.propiedad_id == Propiedad.id)
+                .scalar_subquery(),
+                0,
+            )
+        query = update(Propiedad).values(
+            rating_avg=agregado(func.avg),
+            rating_sum=agregado(func.sum),
+            rating_count=agregado(func.count),
+        )
+        if propiedad_id:
+            query = query.where(Propiedad.id == propiedad_id)
+        await session.exec(query)
+        await session.commit()
+    
+    @classmethod
+    def programar_derivados(cls, propiedad_id: UUID, rutas: list[str]):
+        """Genera miniaturas y variantes WebP en segundo plano, sin demorar la respuesta"""
+        if not rutas:
+            return
+        tarea = asyncio.create_task(cls.generar_variantes(propiedad_id, list(rutas)))
+        _tareas_derivados.add(tarea)
+        tarea.add_done_callback(_tareas_derivados.discard)
+    
+    @classmethod
+    async def generar_variantes(cls, propiedad_id: UUID, rutas: list[str]):
+        """Genera las variantes en el pool de procesos y las registra en la propiedad con una sesión propia"""
+        try:
+            variantes = await procesar_derivados(rutas)
+            if not variantes:
+                return
+            async with async_session() as session:
+                db_obj: Propiedad = await session.get(cls.model, propiedad_id)
+                if not db_obj:
+                    return
+                # Solo se registran variantes de imágenes que la propiedad todavía tiene
+                imagenes = set(db_obj.imagenes or [])
+                registradas = {ruta: v for ruta, v in (db_obj.imagenes_variantes or {}).items() if ruta in imagenes}
+                registradas.update({ruta: v for ruta, v in variantes.items() if ruta in imagenes})
+                db_obj.imagenes_variantes = registradas
+                session.add(db_obj)
+                await session.commit()
+        except Exception:
+            logger.exception("Error generando variantes de imágenes de la propiedad %s", propiedad_id)
@@ -2,4 +2,5 @@ from services import BaseService
 from models import Region
 
 class RegionService(BaseService):
-    model = Region
\ No newline at end of file
+    model = Region
+    sortable_fields = ("id", "nombre")
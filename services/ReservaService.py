@@ -1,5 +1,196 @@
 from services import BaseService
-from models import Reserva
+from models import Reserva, Propiedad
+from models.types import ReservaStatus
+from app.db import AsyncSessionDep
+from sqlmodel import select
+from datetime import datetime, date, time, timedelta
+from uuid import UUID
+import base64
+
+# Ventana máxima para la consulta de horarios libres y del calendario
+MAX_DIAS_DISPONIBILIDAD = 31
+MAX_PROPIEDADES_CALENDARIO = 100
+
+class ReservaNoDisponible(ValueError):
+    """El horario solicitado choca con otra reserva o está fuera del horario de la propiedad"""
+
+def hora_local(valor: datetime) -> datetime:
+    """
+    Las fechas se guardan sin zona horaria, en la hora local del servidor (como datetime.now()
+    y el horario de atención). Una fecha con zona (p. ej. "...Z" de toISOString) se convierte a ella.
+    """
+    if valor.tzinfo is None:
+        return valor
+    return valor.astimezone().replace(tzinfo=None)
 
 class ReservaService(BaseService):
     model = Reserva
+    sortable_fields = ("id", "inicio", "fin", "fecha_creacion", "estado", "costo_total")
+
+    @classmethod
+    async def create(cls, session: AsyncSessionDep, obj: Reserva) -> Reserva:
+        db_obj = cls.model.model_validate(obj)
+        db_obj.inicio, db_obj.fin = hora_local(db_obj.inicio), hora_local(db_obj.fin)
+        await cls.verificar_disponibilidad(session, db_obj)
+        session.add(db_obj)
+        await session.commit()
+        return await cls.reload(session, db_obj)
+
+    @classmethod
+    async def update(cls, session: AsyncSessionDep, obj: Reserva) -> Reserva:
+        db_obj = await session.get(cls.model, obj.id)
+        if not db_obj:
+            raise ValueError(f"No existe un objeto con id {obj.id}")
+        for key, value in obj.model_dump(exclude_unset=True).items():
+            setattr(db_obj, key, value)
+        db_obj.inicio, db_obj.fin = hora_local(db_obj.inicio), hora_local(db_obj.fin)
+        if db_obj.estado != ReservaStatus.cancelada:
+            await cls.verificar_disponibilidad(session, db_obj, excluir_id=db_obj.id)
+        session.add(db_obj)
+        await session.commit()
+        return await cls.reload(session, db_obj)
+
+    @classmethod
+    async def verificar_disponibilidad(cls, session: AsyncSessionDep, reserva: Reserva, excluir_id: UUID | None = None) -> None:
+        """
+        Valida el rango de la reserva contra el horario de la propiedad y las demás reservas.
+        Bloquea la fila de la propiedad (SELECT ... FOR UPDATE) para que dos reservas
+        concurrentes del mismo horario se serialicen hasta el commit del llamador.
+        Las reservas solapadas también se leen con FOR UPDATE: en REPEATABLE READ (MySQL) una
+        lectura normal usaría la instantánea de la primera consulta de la sesión y no vería
+        la reserva que otra transacción confirmó mientras se esperaba el bloqueo.
+        """
+        if reserva.fin <= reserva.inicio:
+            raise ValueError("La fecha de fin debe ser posterior a la de inicio")
+        if not reserva.propiedad_id:
+            return
+        propiedad = (await session.exec(
+            select(Propiedad).where(Propiedad.id == reserva.propiedad_id).with_for_update()
+        )).first()
+        if not propiedad:
+            raise ValueError("Propiedad no encontrada")
+        
+        ventanas = cls.ventanas_apertura(propiedad, reserva.inicio - timedelta(days=1), reserva.fin)
+        if not any(inicio <= reserva.inicio and reserva.fin <= fin for inicio, fin in ventanas):
+            raise ReservaNoDisponible("La reserva está fuera del horario de atención de la propiedad")
+        
+        ocupadas = await cls.reservas_en_rango(session, reserva.propiedad_id, reserva.inicio, reserva.fin, excluir_id, bloquear=True)
+        if ocupadas:
+            raise ReservaNoDisponible("El horario solicitado ya está reservado")
+
+    @classmethod
+    async def reservas_en_rango(cls, session: AsyncSessionDep, propiedad_id: UUID, desde: datetime, hasta: datetime, excluir_id: UUID | None = None, bloquear: bool = False) -> list[Reserva]:
+        """Reservas vigentes que se solapan con [desde, hasta); usa el índice (propiedad_id, inicio, fin)"""
+        return (await session.exec(cls.consulta_en_rango(propiedad_id, desde, hasta, excluir_id, bloquear))).all()
+
+    @staticmethod
+    def consulta_en_rango(propiedad_id: UUID, desde: datetime, hasta: datetime, excluir_id: UUID | None = None, bloquear: bool = False):
+        """Consulta de reservas_en_rango; con bloquear es una lectura con bloqueo (SELECT ... FOR UPDATE)"""
+        query = select(Reserva).where(
+            Reserva.propiedad_id == propiedad_id,
+            Reserva.inicio < hasta,
+            Reserva.fin > desde,
+            Reserva.estado != ReservaStatus.cancelada,
+        ).order_by(Reserva.inicio)
+        if excluir_id:
+            query = query.where(Reserva.id != excluir_id)
+        if bloquear:
+            query = query.with_for_update()
+        return query
+
+    @staticmethod
+    def ventanas_apertura(propiedad: Propiedad, desde: datetime, hasta: datetime) -> list[tuple[datetime, datetime]]:
+        """
+        Intervalos de atención de la propiedad por día entre desde y hasta.
+        Sin horario definido se considera abierta todo el día; si el cierre es anterior
+        a la apertura el horario termina al día siguiente.
+        """
+        apertura = propiedad.hora_apertura or time.min
+        ventanas = []
+        dia: date = desde.date()
+        while dia <= hasta.date():
+            inicio = datetime.combine(dia, apertura)
+            if propiedad.hora_cierre is None:
+                fin = datetime.combine(dia + timedelta(days=1), apertura)
+            else:
+                fin = datetime.combine(dia, propiedad.hora_cierre)
+                if fin <= inicio:
+                    fin += timedelta(days=1)
+            ventanas.append((inicio, fin))
+            dia += timedelta(days=1)
+        # Días contiguos sin horario forman un único intervalo continuo
+        fusionadas = []
+        for inicio, fin in ventanas:
+            if fusionadas and fusionadas[-1][1] >= inicio:
+                fusionadas[-1] = (fusionadas[-1][0], max(fusionadas[-1][1], fin))
+            else:
+                fusionadas.append((inicio, fin))
+        return fusionadas
+
+    @classmethod
+    async def horarios_libres(cls, session: AsyncSessionDep, propiedad_id: UUID, desde: datetime, hasta: datetime) -> list[dict]:
+        """Intervalos libres de la propiedad entre desde y hasta, con una sola consulta de reservas"""
+        desde, hasta = hora_local(desde), hora_local(hasta)
+        if hasta <= desde:
+            raise ValueError("La fecha de fin debe ser posterior a la de inicio")
+        if hasta - desde > timedelta(days=MAX_DIAS_DISPONIBILIDAD):
+            raise ValueError(f"El rango no puede superar {MAX_DIAS_DISPONIBILIDAD} días")
+        propiedad = await session.get(Propiedad, propiedad_id)
+        if not propiedad:
+            raise ValueError("Propiedad no encontrada")
+        
+        ocupadas = await cls.reservas_en_rango(session, propiedad_id, desde, hasta)
+        libres = []
+        for inicio, fin in cls.ventanas_apertura(propiedad, desde - timedelta(days=1), hasta):
+            inicio, fin = max(inicio, desde), min(fin, hasta)
+            for reserva in ocupadas:
+                if reserva.fin <= inicio or reserva.inicio >= fin:
+                    continue
+                if reserva.inicio > inicio:
+                    libres.append({"inicio": inicio, "fin": reserva.inicio})
+                inicio = max(inicio, reserva.fin)
+            if inicio < fin:
+                libres.append({"inicio": inicio, "fin": fin})
+        return libres
+
+    @classmethod
+    async def calendario_ocupacion(cls, session: AsyncSessionDep, propiedad_ids: list[UUID], desde: datetime, hasta: datetime) -> dict:
+        """
+        Ocupación por hora de varias propiedades entre desde y hasta.
+        Las reservas de todas las propiedades se leen en una sola consulta y se agrupan por propiedad.
+        Cada mapa de bits va en base64: el bit i (el más significativo primero) es la hora desde + i.
+        """
+        desde, hasta = hora_local(desde), hora_local(hasta)
+        desde = desde.replace(minute=0, second=0, microsecond=0)
+        if hasta <= desde:
+            raise ValueError("La fecha de fin debe ser posterior a la de inicio")
+        if hasta - desde > timedelta(days=MAX_DIAS_DISPONIBILIDAD):
+            raise ValueError(f"El rango no puede superar {MAX_DIAS_DISPONIBILIDAD} días")
+        if not propiedad_ids or len(propiedad_ids) > MAX_PROPIEDADES_CALENDARIO:
+            raise ValueError(f"Se deben indicar entre 1 y {MAX_PROPIEDADES_CALENDARIO} propiedades")
+        
+        hora = timedelta(hours=1)
+        horas = -(-(hasta - desde) // hora)
+        bitmaps = {propiedad_id: bytearray((horas + 7) // 8) for propiedad_id in propiedad_ids}
+        reservas = (await session.exec(
+            select(Reserva.propiedad_id, Reserva.inicio, Reserva.fin).where(
+                Reserva.propiedad_id.in_(propiedad_ids),
+                Reserva.inicio < hasta,
+                Reserva.fin > desde,
+                Reserva.estado != ReservaStatus.cancelada,
+            ).order_by(Reserva.propiedad_id, Reserva.inicio)
+        )).all()
+        for propiedad_id, inicio, fin in reservas:
+            bitmap = bitmaps[propiedad_id]
+            primera = max(inicio - desde, timedelta(0)) // hora
+            ultima = min(-(-(fin - desde) // hora), horas)
+            for i in range(primera, ultima):
+                bitmap[i // 8] |= 0x80 >> (i % 8)
+        return {
+            "desde": desde,
+            "horas": horas,
+            "ocupacion": {
+                str(propiedad_id): base64.b64encode(bytes(bitmap)).decode()
+                for propiedad_id, bitmap in bitmaps.items()
+            },
+        }
@@ -0,0 +1,130 @@
+from typing import List, Optional, Dict, Any
+from uuid import UUID
+from datetime import datetime
+from sqlmodel import select, update, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from models import Comision, SaldoPropietario
+from models.types import ComisionStatus
+
+
+class SaldoService:
+
+    # El saldo de cada propietario guarda el monto de sus comisiones en cada estado.
+    # mover no hace commit: corre dentro de la transacción que crea o cambia las comisiones.
+
+    @staticmethod
+    async def mover(
+        session: AsyncSession,
+        montos: Dict[UUID, int],
+        destino: ComisionStatus,
+        origen: Optional[ComisionStatus] = None
+    ):
+        """
+        Suma a cada propietario el monto indicado en el estado destino y lo resta del estado origen
+        (sin origen, son comisiones nuevas). Crea el saldo del propietario si no existe.
+
+        Args:
+            session: Sesión de base de datos
+            montos: Monto por propietario
+            destino: Estado al que pasan las comisiones
+            origen: Estado en el que estaban
+        """
+        montos = {propietario_id: monto for propietario_id, monto in montos.items() if monto}
+        if not montos:
+            return
+        ahora = datetime.now()
+        filas = []
+        for propietario_id, monto in montos.items():
+            fila = {"propietario_id": propietario_id, destino.value: monto, "fecha_actualizacion": ahora}
+            if origen:
+                fila[origen.value] = -monto
+            filas.append(fila)
+        columnas = [destino.value] + ([origen.value] if origen else [])
+        dialecto = session.get_bind().dialect.name
+        if dialecto == "mysql":
+            from sqlalchemy.dialects.mysql import insert
+            query = insert(SaldoPropietario).values(filas)
+            await session.exec(query.on_duplicate_key_update(
+                fecha_actualizacion=ahora,
+                **{c: getattr(SaldoPropietario, c) + getattr(query.inserted, c) for c in columnas}
+            ))
+        elif dialecto == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+            query = insert(SaldoPropietario).values(filas)
+            await session.exec(query.on_conflict_do_update(
+                index_elements=[SaldoPropietario.propietario_id],
+                set_={"fecha_actualizacion": ahora, **{c: getattr(SaldoPropietario, c) + getattr(query.excluded, c) for c in columnas}},
+            ))
+        else:
+            for fila in filas:
+                resultado = await session.exec(
+                    update(SaldoPropietario)
+                    .where(SaldoPropietario.propietario_id == fila["propietario_id"])
+                    .values(fecha_actualizacion=ahora, **{c: getattr(SaldoPropietario, c) + fila[c] for c in columnas})
+                )
+                if resultado.rowcount == 0:
+                    session.add(SaldoPropietario(**fila))
+
+    @staticmethod
+    async def obtener_saldo(propietario_id: UUID, session: AsyncSession) -> Dict[str, Any]:
+        """
+        Saldo de un propietario (una lectura por clave primaria)
+
+        Args:
+            propietario_id: ID del propietario
+            session: Sesión de base de datos
+
+        Returns:
+            Diccionario con el monto de sus comisiones en cada estado
+        """
+        saldo = await session.get(SaldoPropietario, propietario_id)
+        return {
+            "propietario_id": str(propietario_id),
+            **{estado.value: getattr(saldo, estado.value) if saldo else 0 for estado in ComisionStatus},
+            "fecha_actualizacion": saldo.fecha_actualizacion.isoformat() if saldo else None
+        }
+
+    @staticmethod
+    async def reconciliar(session: AsyncSession, corregir: bool = False) -> List[Dict[str, Any]]:
+        """
+        Compara los saldos con la suma de las comisiones de cada propietario por estado.
+        Conviene ejecutarlo con poca actividad: un cambio de estado simultáneo puede verse como diferencia.
+
+        Args:
+            session: Sesión de base de datos
+            corregir: Si es True, reemplaza los saldos distintos por los calculados (y crea los que falten)
+
+        Returns:
+            Lista de diferencias: propietario, saldo guardado y saldo calculado
+        """
+        calculados: Dict[UUID, Dict[str, int]] = {}
+        filas = (await session.exec(
+            select(Comision.propietario_id, Comision.estado, func.sum(Comision.monto))
+            .group_by(Comision.propietario_id, Comision.estado)
+        )).all()
+        for propietario_id, estado, monto in filas:
+            calculados.setdefault(propietario_id, {e.value: 0 for e in ComisionStatus})[estado.value] = int(monto)
+
+        guardados = {saldo.propietario_id: saldo for saldo in (await session.exec(
+            select(SaldoPropietario).execution_options(populate_existing=True)
+        )).all()}
+        vacio = {e.value: 0 for e in ComisionStatus}
+        diferencias = []
+        for propietario_id in calculados.keys() | guardados.keys():
+            saldo = guardados.get(propietario_id)
+            guardado = {e.value: getattr(saldo, e.value) for e in ComisionStatus} if saldo else None
+            calculado = calculados.get(propietario_id, vacio)
+            if guardado == calculado or (guardado is None and not any(calculado.values())):
+                continue
+            diferencias.append({"propietario_id": str(propietario_id), "guardado": guardado, "calculado": calculado})
+            if corregir:
+                if saldo is None:
+                    saldo = SaldoPropietario(propietario_id=propietario_id)
+                    session.add(saldo)
+                for estado, monto in calculado.items():
+                    setattr(saldo, estado, monto)
+                saldo.fecha_actualizacion = datetime.now()
+        if corregir and diferencias:
+            await session.commit()
+        return diferencias
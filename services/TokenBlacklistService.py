@@ -0,0 +1,168 @@
+from services import BaseService
+from models import TokenBlacklist
+from app.db import AsyncSessionDep, async_session
+from app.cache import BloomFilter, TTLCache
+from controllers.Broadcast import get_broadcast
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Filtro de Bloom con los JTI revocados y aún vigentes: un "no está" evita consultar la base de datos
+TOKEN_BLOOM_CAPACIDAD = int(os.getenv("TOKEN_BLOOM_CAPACIDAD", "100000"))
+TOKEN_BLOOM_ERROR = float(os.getenv("TOKEN_BLOOM_ERROR", "0.001"))
+# JTI cuya revocación ya se confirmó en la base de datos (hasta que expira el token)
+TOKEN_REVOCADOS_CACHE_SIZE = int(os.getenv("TOKEN_REVOCADOS_CACHE_SIZE", "10000"))
+TOKEN_SINCRONIZACION = float(os.getenv("TOKEN_SINCRONIZACION", "30"))      # Segundos entre lecturas de revocaciones nuevas
+TOKEN_PURGA_INTERVALO = float(os.getenv("TOKEN_PURGA_INTERVALO", "3600"))  # Segundos entre purgas de filas expiradas
+
+# Canal por el que cada worker avisa a los demás de una revocación
+CANAL_REVOCADOS = "tokens:revocados"
+
+_filtro = BloomFilter(TOKEN_BLOOM_CAPACIDAD, TOKEN_BLOOM_ERROR)
+_revocados = TTLCache(maxsize=TOKEN_REVOCADOS_CACHE_SIZE, ttl=3600)
+_cargado = False  # Sin cargar el filtro desde la base de datos, cada consulta va a la base de datos
+_ultima_sincronizacion: datetime | None = None
+_tareas: set[asyncio.Task] = set()
+
+
+class TokenBlacklistService(BaseService):
+    """
+    Tokens revocados (logout y rotación de refresh tokens) en la tabla token_blacklist.
+    Cada worker mantiene un filtro de Bloom de los JTI revocados: los tokens que no están en
+    el filtro (casi todos) se aceptan sin consultar la base de datos. Los positivos se confirman
+    en la base de datos y los confirmados quedan en una caché LRU hasta que el token expira.
+    Las revocaciones llegan a los demás workers por broadcast y, como respaldo, en la
+    sincronización periódica.
+    """
+    model = TokenBlacklist
+
+    @classmethod
+    async def revocar(cls, session: AsyncSessionDep, payload: dict) -> bool:
+        """
+        Registra el JTI del token como revocado. Devuelve False si ya lo estaba
+        (por ejemplo, un refresh token usado dos veces) o si el token no tiene JTI.
+        """
+        jti = payload.get("jti")
+        if not jti:
+            return False
+        session.add(TokenBlacklist(
+            token_jti=jti,
+            token_type=payload.get("type", "access"),
+            user_email=payload.get("sub", ""),
+            expires_at=datetime.fromtimestamp(payload["exp"]),
+        ))
+        try:
+            await session.commit()
+        except IntegrityError:
+            await session.rollback()
+            return False
+        cls.registrar_local(jti, payload["exp"])
+        await get_broadcast().publicar(CANAL_REVOCADOS, {"jti": jti, "exp": payload["exp"]})
+        return True
+
+    @classmethod
+    async def esta_revocado(cls, session: AsyncSessionDep, payload: dict) -> bool:
+        """Indica si el token fue revocado; solo consulta la base de datos si el filtro no lo descarta"""
+        jti = payload.get("jti")
+        if not jti:
+            return False
+        if _revocados.get(jti):
+            return True
+        if _cargado and jti not in _filtro:
+            return False
+        revocado = (await session.exec(
+            select(TokenBlacklist.id).where(TokenBlacklist.token_jti == jti)
+        )).first() is not None
+        if revocado:
+            cls.registrar_local(jti, payload.get("exp", time.time()))
+        return revocado
+
+    @classmethod
+    def registrar_local(cls, jti: str, exp: float):
+        _filtro.add(jti)
+        _revocados.set(jti, True, ttl=max(exp - time.time(), 1))
+
+    @classmethod
+    async def cargar_filtro(cls, session: AsyncSessionDep):
+        """Reconstruye el filtro con los JTI revocados que aún no expiran"""
+        global _filtro, _cargado, _ultima_sincronizacion
+        ahora = datetime.now()
+        jtis = (await session.exec(
+            select(TokenBlacklist.token_jti).where(TokenBlacklist.expires_at > ahora)
+        )).all()
+        filtro = BloomFilter(max(TOKEN_BLOOM_CAPACIDAD, 2 * len(jtis)), TOKEN_BLOOM_ERROR)
+        for jti in jtis:
+            filtro.add(jti)
+        _filtro, _cargado, _ultima_sincronizacion = filtro, True, ahora
+
+    @classmethod
+    async def sincronizar(cls, session: AsyncSessionDep):
+        """Agrega al filtro las revocaciones registradas desde la última sincronización (por otros workers)"""
+        global _ultima_sincronizacion
+        if not _cargado:
+            return await cls.cargar_filtro(session)
+        ahora = datetime.now()
+        # Margen por los commits que estaban en curso durante la sincronización anterior
+        desde = _ultima_sincronizacion - timedelta(seconds=5)
+        for jti in (await session.exec(
+            select(TokenBlacklist.token_jti).where(TokenBlacklist.blacklisted_at >= desde)
+        )).all():
+            _filtro.add(jti)
+        _ultima_sincronizacion = ahora
+
+    @classmethod
+    async def purgar(cls, session: AsyncSessionDep) -> int:
+        """Elimina las filas de tokens ya expirados; devuelve cuántas se eliminaron"""
+        resultado = await session.exec(delete(TokenBlacklist).where(TokenBlacklist.expires_at <= datetime.now()))
+        await session.commit()
+        return resultado.rowcount
+
+    @classmethod
+    async def mantenimiento(cls, session_factory=async_session):
+        """Sincroniza el filtro cada TOKEN_SINCRONIZACION; purga y lo reconstruye cada TOKEN_PURGA_INTERVALO"""
+        proxima_purga = time.monotonic() + TOKEN_PURGA_INTERVALO
+        while True:
+            await asyncio.sleep(TOKEN_SINCRONIZACION)
+            try:
+                async with session_factory() as session:
+                    if time.monotonic() >= proxima_purga:
+                        purgados = await cls.purgar(session)
+                        await cls.cargar_filtro(session)
+                        proxima_purga = time.monotonic() + TOKEN_PURGA_INTERVALO
+                        logger.info("Tokens revocados purgados: %s", purgados)
+                    else:
+                        await cls.sincronizar(session)
+            except Exception:
+                logger.exception("Error en el mantenimiento de tokens revocados")
+
+    @classmethod
+    async def escuchar(cls):
+        """Agrega al filtro las revocaciones que publican los demás workers"""
+        async with get_broadcast().suscribir(CANAL_REVOCADOS) as cola:
+            while True:
+                mensaje = await cola.get()
+                cls.registrar_local(mensaje["jti"], mensaje["exp"])
+
+    @classmethod
+    async def iniciar(cls, session_factory=async_session):
+        async with session_factory() as session:
+            await cls.cargar_filtro(session)
+        for tarea in (asyncio.create_task(cls.escuchar()), asyncio.create_task(cls.mantenimiento(session_factory))):
+            _tareas.add(tarea)
+            tarea.add_done_callback(_tareas.discard)
+
+    @classmethod
+    async def detener(cls):
+        global _cargado
+        tareas = list(_tareas)
+        for tarea in tareas:
+            tarea.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
+        _cargado = False
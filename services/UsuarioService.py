@@ -1,27 +1,33 @@
-from app.db import SessionDep
+from app.db import AsyncSessionDep
 from models.types import UserType
 from services import BaseService
 from models import Usuario, UsuarioBase, BloqueoUsuario
-from app.Auth import get_password_hash
+from app.Auth import get_password_hash_async, invalidate_principal
 from sqlmodel import select
+from sqlalchemy.orm import selectinload
 from uuid import UUID
 from datetime import datetime
 
 class UsuarioService(BaseService):
     model = Usuario
+    load_options = (
+        selectinload(Usuario.propiedades),
+        selectinload(Usuario.bloqueos),
+    )
+    sortable_fields = ("id", "email", "nombres", "appaterno", "tipo", "fecha_creacion")
 
     @classmethod
-    def create(cls, session, obj: UsuarioBase) -> Usuario:
+    async def create(cls, session, obj: UsuarioBase) -> Usuario:
         new_user = obj
-        new_user.password = get_password_hash(obj.password)
-        return super().create(session, new_user)
+        new_user.password = await get_password_hash_async(obj.password)
+        return await super().create(session, new_user)
     
     @classmethod
-    def get_by_email(cls, session: SessionDep, email: str):
-        return session.exec(select(Usuario).where(Usuario.email == email)).first()
+    async def get_by_email(cls, session: AsyncSessionDep, email: str):
+        return (await session.exec(select(Usuario).where(Usuario.email == email))).first()
     
     @classmethod
-    def isActive(cls, session: SessionDep, user_id: UUID) -> bool:
+    async def isActive(cls, session: AsyncSessionDep, user_id: UUID) -> bool:
         """
         Verifica si un usuario está activo (no bloqueado).
         Un usuario está bloqueado si:
@@ -31,7 +37,7 @@ class UsuarioService(BaseService):
         now = datetime.now()
         
         # Buscar bloqueos activos para el usuario
-        bloqueo_activo = session.exec(
+        bloqueo_activo = (await session.exec(
             select(BloqueoUsuario).where(
                 BloqueoUsuario.usuario_id == user_id,
                 # El bloqueo está activo si:
@@ -40,20 +46,20 @@ class UsuarioService(BaseService):
                 (BloqueoUsuario.fecha_desbloqueo.is_(None)) | 
                 (BloqueoUsuario.fecha_desbloqueo > now)
             )
-        ).first()
+        )).first()
         
         # El usuario está activo si NO hay bloqueos activos
         return bloqueo_activo is None
     
     @classmethod
-    def get_active_block(cls, session: SessionDep, user_id: UUID) -> BloqueoUsuario | None:
+    async def get_active_block(cls, session: AsyncSessionDep, user_id: UUID) -> BloqueoUsuario | None:
         """
         Obtiene el bloqueo activo de un usuario, si existe.
         Útil para obtener detalles del bloqueo como motivo y fechas.
         """
         now = datetime.now()
         
-        return session.exec(
+        return (await session.exec(
             select(BloqueoUsuario).where(
                 BloqueoUsuario.usuario_id == user_id,
                 # El bloqueo está activo si:
@@ -62,44 +68,58 @@ class UsuarioService(BaseService):
                 (BloqueoUsuario.fecha_desbloqueo.is_(None)) | 
                 (BloqueoUsuario.fecha_desbloqueo > now)
             ).order_by(BloqueoUsuario.fecha_bloqueo.desc())  # El más reciente primero
-        ).first()
+        )).first()
         
     @classmethod
-    def block_user(cls, session: SessionDep, user_id: UUID, administrador_id: UUID, motivo: str, fecha_desbloqueo: datetime | None = None) -> BloqueoUsuario:
+    async def block_user(cls, session: AsyncSessionDep, user_id: UUID, administrador_id: UUID, motivo: str, fecha_desbloqueo: datetime | None = None) -> BloqueoUsuario:
         bloqueo = BloqueoUsuario(usuario_id=user_id, motivo=motivo, 
                                 administrador_id=administrador_id,
                                 fecha_desbloqueo=fecha_desbloqueo
                                 )
         session.add(bloqueo)
-        session.commit()
-        session.refresh(bloqueo)
+        await session.commit()
+        await session.refresh(bloqueo)
+        invalidate_principal(user_id)
         return bloqueo
     
     @classmethod
-    def unblock_user(cls, session: SessionDep, user_id: UUID):
+    async def unblock_user(cls, session: AsyncSessionDep, user_id: UUID):
         # Buscar el bloqueo activo más reciente
-        bloqueo_activo = cls.get_active_block(session, user_id)
+        bloqueo_activo = await cls.get_active_block(session, user_id)
         if not bloqueo_activo:
             raise ValueError("El usuario no tiene bloqueos activos")
         
         # Actualizar la fecha de desbloqueo
         bloqueo_activo.fecha_desbloqueo = datetime.now()
         session.add(bloqueo_activo)
-        session.commit()
-        session.refresh(bloqueo_activo)
+        await session.commit()
+        await session.refresh(bloqueo_activo)
+        invalidate_principal(user_id)
         return bloqueo_activo
     
     @classmethod
-    def cambiar_tipo(cls, session: SessionDep, user_id: UUID, nuevo_tipo: UserType) -> Usuario:
+    async def cambiar_tipo(cls, session: AsyncSessionDep, user_id: UUID, nuevo_tipo: UserType) -> Usuario:
         """
         Cambia el tipo de usuario (por ejemplo, de 'cliente' a 'propietario').
         """
-        usuario: Usuario = session.get(cls.model, user_id)
+        usuario: Usuario = await session.get(cls.model, user_id)
         if not usuario:
             raise ValueError("Usuario no encontrado")
 
         usuario.tipo = nuevo_tipo
         session.add(usuario)
-        session.commit()
-        session.refresh(usuario)
-        return usuario
\ No newline at end of file
+        await session.commit()
+        await session.refresh(usuario)
+        invalidate_principal(user_id)
+        return usuario
+    
+    @classmethod
+    async def update(cls, session: AsyncSessionDep, obj: Usuario) -> Usuario:
+        usuario = await super().update(session, obj)
+        invalidate_principal(usuario.id)
+        return usuario
+
+    @classmethod
+    async def delete(cls, session: AsyncSessionDep, obj_id: UUID) -> None:
+        await super().delete(session, obj_id)
+        invalidate_principal(obj_id)
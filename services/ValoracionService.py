@@ -1,5 +1,48 @@
 from services import BaseService
+from services.PropiedadService import PropiedadService
 from models import Valoracion
+from app.db import AsyncSessionDep
+from uuid import UUID
 
 class ValoracionService(BaseService):
     model = Valoracion
+    sortable_fields = ("id", "fecha", "puntaje")
+
+    # Cada operación ajusta rating_avg/rating_count de la propiedad en la misma transacción
+
+    @classmethod
+    async def create(cls, session: AsyncSessionDep, obj: Valoracion) -> Valoracion:
+        db_obj = cls.model.model_validate(obj)
+        session.add(db_obj)
+        if db_obj.propiedad_id:
+            await PropiedadService.ajustar_rating(session, db_obj.propiedad_id, db_obj.puntaje, 1)
+        await session.commit()
+        return await cls.reload(session, db_obj)
+
+    @classmethod
+    async def update(cls, session: AsyncSessionDep, obj: Valoracion) -> Valoracion:
+        db_obj = await session.get(cls.model, obj.id)
+        if not db_obj:
+            raise ValueError(f"No existe un objeto con id {obj.id}")
+        propiedad_anterior, puntaje_anterior = db_obj.propiedad_id, db_obj.puntaje
+        for key, value in obj.model_dump(exclude_unset=True).items():
+            setattr(db_obj, key, value)
+        session.add(db_obj)
+        if propiedad_anterior != db_obj.propiedad_id:
+            if propiedad_anterior:
+                await PropiedadService.ajustar_rating(session, propiedad_anterior, -puntaje_anterior, -1)
+            if db_obj.propiedad_id:
+                await PropiedadService.ajustar_rating(session, db_obj.propiedad_id, db_obj.puntaje, 1)
+        elif db_obj.propiedad_id and puntaje_anterior != db_obj.puntaje:
+            await PropiedadService.ajustar_rating(session, db_obj.propiedad_id, db_obj.puntaje - puntaje_anterior, 0)
+        await session.commit()
+        return await cls.reload(session, db_obj)
+
+    @classmethod
+    async def delete(cls, session: AsyncSessionDep, obj_id: UUID) -> None:
+        obj = await session.get(cls.model, obj_id)
+        if obj:
+            if obj.propiedad_id:
+                await PropiedadService.ajustar_rating(session, obj.propiedad_id, -obj.puntaje, -1)
+            await session.delete(obj)
+            await session.commit()
@@ -0,0 +1,195 @@
+from typing import Any, Dict, Optional
+from datetime import datetime, timedelta
+from sqlalchemy import case, or_, update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+import asyncio
+import logging
+import os
+
+from app.db import async_session
+from controllers.MercadoPago import get_mp_client
+from models import WebhookEvento
+from models.types import WebhookStatus
+from services.PagoService import MercadoPagoService
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+WEBHOOK_POLL_INTERVAL = float(os.getenv("WEBHOOK_POLL_INTERVAL", "5"))    # Segundos entre revisiones de la cola
+WEBHOOK_LEASE = int(os.getenv("WEBHOOK_LEASE", "120"))                    # Segundos antes de retomar un evento de un worker caído
+WEBHOOK_MAX_INTENTOS = int(os.getenv("WEBHOOK_MAX_INTENTOS", "8"))
+WEBHOOK_BACKOFF_BASE = float(os.getenv("WEBHOOK_BACKOFF_BASE", "5"))      # Segundos; se duplica en cada intento
+WEBHOOK_BACKOFF_MAX = float(os.getenv("WEBHOOK_BACKOFF_MAX", "3600"))
+
+# Tareas de los workers y evento para despertarlos cuando llega una notificación
+_workers: set[asyncio.Task] = set()
+_despertar: asyncio.Event | None = None
+
+
+class WebhookService:
+    """
+    Cola de notificaciones de MercadoPago guardada en la tabla webhook_evento.
+    El endpoint solo registra la notificación; los workers consultan el pago y actualizan
+    Pago/Comision fuera de la petición, con reintentos y backoff exponencial.
+    """
+
+    @staticmethod
+    async def registrar(session: AsyncSession, mp_payment_id: str, payload: Dict[str, Any], tipo: str = "payment") -> None:
+        """
+        Registra la notificación en la cola (una fila por pago). Si el pago ya tenía una fila,
+        vuelve a quedar pendiente; si un worker lo está procesando, lo volverá a procesar al terminar.
+        """
+        ahora = datetime.now()
+        procesando = WebhookEvento.estado == WebhookStatus.procesando
+        fila = WebhookEvento(mp_payment_id=mp_payment_id, tipo=tipo, payload=payload, proximo_intento=ahora, fecha_recepcion=ahora)
+        valores = fila.model_dump()
+        valores["estado"] = WebhookStatus.pendiente
+        al_repetir = {
+            "payload": payload,
+            "recibidos": WebhookEvento.recibidos + 1,
+            "intentos": case((procesando, WebhookEvento.intentos), else_=0),
+            "proximo_intento": case((procesando, WebhookEvento.proximo_intento), else_=ahora),
+            "estado": case((procesando, WebhookEvento.estado), else_=WebhookStatus.pendiente.name),
+        }
+        dialecto = session.get_bind().dialect.name
+        if dialecto == "mysql":
+            from sqlalchemy.dialects.mysql import insert
+            await session.exec(insert(WebhookEvento).values(valores).on_duplicate_key_update(**al_repetir))
+        elif dialecto == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+            await session.exec(insert(WebhookEvento).values(valores).on_conflict_do_update(
+                index_elements=[WebhookEvento.mp_payment_id], set_=al_repetir
+            ))
+        else:
+            existente = (await session.exec(
+                select(WebhookEvento).where(WebhookEvento.mp_payment_id == mp_payment_id).with_for_update()
+            )).first()
+            if existente:
+                await session.exec(update(WebhookEvento).where(WebhookEvento.id == existente.id).values(**al_repetir))
+            else:
+                session.add(fila)
+        await session.commit()
+        if _despertar is not None:
+            _despertar.set()
+
+    @staticmethod
+    async def tomar_siguiente(session: AsyncSession) -> Optional[WebhookEvento]:
+        """
+        Reserva el próximo evento vencido con un UPDATE condicional: si otro worker (o proceso)
+        lo tomó primero, el UPDATE no afecta filas y se prueba con el siguiente.
+        """
+        ahora = datetime.now()
+        vencidos = or_(WebhookEvento.estado == WebhookStatus.pendiente, WebhookEvento.estado == WebhookStatus.procesando)
+        candidatos = (await session.exec(
+            select(WebhookEvento.id, WebhookEvento.recibidos)
+            .where(vencidos, WebhookEvento.proximo_intento <= ahora)
+            .order_by(WebhookEvento.proximo_intento)
+            .limit(WEBHOOK_WORKERS * 2)
+        )).all()
+        for evento_id, recibidos in candidatos:
+            resultado = await session.exec(
+                update(WebhookEvento)
+                .where(
+                    WebhookEvento.id == evento_id,
+                    WebhookEvento.recibidos == recibidos,
+                    WebhookEvento.proximo_intento <= ahora,
+                    vencidos,
+                )
+                .values(estado=WebhookStatus.procesando, proximo_intento=ahora + timedelta(seconds=WEBHOOK_LEASE))
+            )
+            await session.commit()
+            if resultado.rowcount == 1:
+                return await session.get(WebhookEvento, evento_id, populate_existing=True)
+        return None
+
+    @staticmethod
+    async def procesar_siguiente(session_factory=async_session, mp_service: Optional[MercadoPagoService] = None) -> bool:
+        """Procesa un evento de la cola; devuelve False si no había eventos vencidos"""
+        async with session_factory() as session:
+            evento = await WebhookService.tomar_siguiente(session)
+            if not evento:
+                return False
+            try:
+                mp_service = mp_service or MercadoPagoService(get_mp_client())
+                await mp_service.procesar_webhook(evento.mp_payment_id, session)
+            except Exception as e:
+                await session.rollback()
+                await session.refresh(evento)
+                await WebhookService.reprogramar(session, evento, e)
+            else:
+                await WebhookService.completar(session, evento)
+            return True
+
+    @staticmethod
+    async def completar(session: AsyncSession, evento: WebhookEvento) -> None:
+        resultado = await session.exec(
+            update(WebhookEvento)
+            .where(WebhookEvento.id == evento.id, WebhookEvento.recibidos == evento.recibidos)
+            .values(estado=WebhookStatus.procesado, fecha_procesamiento=datetime.now(), ultimo_error=None)
+        )
+        if resultado.rowcount == 0:
+            # Llegó otra notificación del mismo pago mientras se procesaba: se vuelve a procesar
+            await session.exec(
+                update(WebhookEvento)
+                .where(WebhookEvento.id == evento.id)
+                .values(estado=WebhookStatus.pendiente, proximo_intento=datetime.now(), intentos=0)
+            )
+        await session.commit()
+
+    @staticmethod
+    async def reprogramar(session: AsyncSession, evento: WebhookEvento, error: Exception) -> None:
+        intentos = evento.intentos + 1
+        espera = min(WEBHOOK_BACKOFF_BASE * 2 ** (intentos - 1), WEBHOOK_BACKOFF_MAX)
+        agotado = intentos >= WEBHOOK_MAX_INTENTOS
+        if agotado:
+            logger.error("Notificación del pago %s descartada tras %s intentos: %s", evento.mp_payment_id, intentos, error)
+        else:
+            logger.warning("Error procesando el pago %s (intento %s), se reintenta en %ss: %s", evento.mp_payment_id, intentos, espera, error)
+        await session.exec(
+            update(WebhookEvento)
+            .where(WebhookEvento.id == evento.id)
+            .values(
+                estado=WebhookStatus.error if agotado else WebhookStatus.pendiente,
+                intentos=intentos,
+                proximo_intento=datetime.now() + timedelta(seconds=espera),
+                ultimo_error=str(error)[:2000],
+            )
+        )
+        await session.commit()
+
+    @staticmethod
+    async def worker(despertar: asyncio.Event):
+        while True:
+            try:
+                if await WebhookService.procesar_siguiente():
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Error en el worker de notificaciones de MercadoPago")
+            try:
+                await asyncio.wait_for(despertar.wait(), WEBHOOK_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            despertar.clear()
+
+    @staticmethod
+    def iniciar_workers():
+        global _despertar
+        if _despertar is None:
+            _despertar = asyncio.Event()
+        for _ in range(WEBHOOK_WORKERS - len(_workers)):
+            tarea = asyncio.create_task(WebhookService.worker(_despertar))
+            _workers.add(tarea)
+            tarea.add_done_callback(_workers.discard)
+
+    @staticmethod
+    async def detener_workers():
+        """Cancela los workers; un evento a medio procesar se retoma cuando vence su lease"""
+        global _despertar
+        tareas = list(_workers)
+        for tarea in tareas:
+            tarea.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
+        _despertar = None
@@ -1,53 +1,166 @@
-from app.db import SessionDep
-from sqlmodel import SQLModel, select
+from app.db import AsyncSessionDep
+from sqlmodel import SQLModel, select, or_, and_
+from pydantic import TypeAdapter
+from pydantic_core import to_jsonable_python
 from uuid import UUID
+import base64
+import json
+
+def encode_cursor(campo: str, valor, obj_id: UUID) -> str:
+    """Codifica la clave de orden y el id del último elemento en un token opaco"""
+    data = json.dumps([campo, to_jsonable_python(valor), str(obj_id)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[str, object, UUID]:
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        campo, valor, obj_id = json.loads(base64.urlsafe_b64decode(cursor + padding))
+        return campo, valor, UUID(obj_id)
+    except (ValueError, TypeError):
+        raise ValueError("Cursor inválido")
+
+# Operadores admitidos en los filtros con la sintaxis "campo__operador"
+FILTER_OPERATORS = {
+    "eq": lambda columna, valor: columna == valor,
+    "gt": lambda columna, valor: columna > valor,
+    "gte": lambda columna, valor: columna >= valor,
+    "lt": lambda columna, valor: columna < valor,
+    "lte": lambda columna, valor: columna <= valor,
+    "in": lambda columna, valor: columna.in_(valor),
+    "contains": lambda columna, valor: columna.contains(valor, autoescape=True),
+}
 
 class BaseService:
     model: type[SQLModel]
+    # Opciones de carga (selectinload, joinedload) para las relaciones que se serializan en las respuestas.
+    # La sesión asíncrona no permite cargas perezosas, por lo que deben cargarse junto al objeto.
+    # Cada endpoint puede pasar sus propias opciones a read/read_all/read_page (() = sin relaciones).
+    load_options: tuple = ()
+    # Columnas por las que se permite ordenar; cada servicio declara las suyas (por defecto solo el id)
+    sortable_fields: tuple[str, ...] = ("id",)
 
     @classmethod
-    def create(cls, session: SessionDep, obj: SQLModel) -> SQLModel:
+    async def create(cls, session: AsyncSessionDep, obj: SQLModel) -> SQLModel:
         db_obj = cls.model.model_validate(obj)
         session.add(db_obj)
-        session.commit()
-        session.refresh(db_obj)
-        return db_obj
+        await session.commit()
+        return await cls.reload(session, db_obj)
 
     @classmethod
-    def read(cls, session: SessionDep, obj_id: UUID) -> SQLModel | None:
-        return session.get(cls.model, obj_id)
+    async def read(cls, session: AsyncSessionDep, obj_id: UUID, options: tuple | None = None) -> SQLModel | None:
+        options = cls.load_options if options is None else options
+        if options:
+            return await session.get(cls.model, obj_id, options=options, populate_existing=True)
+        return await session.get(cls.model, obj_id)
 
     @classmethod
-    def read_all(cls, session: SessionDep, offset: int, limit: int, order_by: str | None = None, filtros: dict = None) -> list[SQLModel]:
-        query = select(cls.model)
+    async def read_all(cls, session: AsyncSessionDep, offset: int, limit: int, order_by: str | None = None, filtros: dict = None, options: tuple | None = None) -> list[SQLModel]:
+        query = select(cls.model).options(*(cls.load_options if options is None else options))
         if order_by:
-            query = query.order_by(order_by)
+            _, columna, descendente = cls.resolve_order(order_by)
+            query = query.order_by(columna.desc() if descendente else columna)
+        query = cls.apply_filters(query, filtros)
+        query = query.offset(offset).limit(limit)
+        return (await session.exec(query)).all()
+
+    @classmethod
+    async def read_page(cls, session: AsyncSessionDep, limit: int, cursor: str | None = None, order_by: str | None = None, filtros: dict = None, options: tuple | None = None) -> tuple[list[SQLModel], str | None]:
+        """
+        Paginación por cursor (keyset): en vez de descartar filas con OFFSET, continúa
+        desde la clave de orden + id del último elemento de la página anterior.
+        order_by debe ser una columna no nula de sortable_fields.
+        Devuelve la página y el cursor de la siguiente (None si no hay más).
+        """
+        campo, columna, descendente = cls.resolve_order(order_by or "id")
+        field = cls.model.model_fields[campo]
+        if campo != "id" and columna.nullable:
+            raise ValueError(f"El campo '{campo}' admite nulos y no sirve como cursor")
+        id_columna = cls.model.id
+
+        query = select(cls.model).options(*(cls.load_options if options is None else options))
+        query = cls.apply_filters(query, filtros)
+        if cursor:
+            campo_cursor, valor, ultimo_id = decode_cursor(cursor)
+            if campo_cursor != campo:
+                raise ValueError("El cursor no corresponde al orden solicitado")
+            if descendente:
+                despues_id = id_columna < ultimo_id
+            else:
+                despues_id = id_columna > ultimo_id
+            if campo == "id":
+                query = query.where(despues_id)
+            else:
+                valor = TypeAdapter(field.annotation).validate_python(valor)
+                despues_valor = columna < valor if descendente else columna > valor
+                query = query.where(or_(despues_valor, and_(columna == valor, despues_id)))
+        orden = [columna] if campo == "id" else [columna, id_columna]
+        query = query.order_by(*(c.desc() if descendente else c for c in orden))
+        # Se pide un elemento extra para saber si existe una página siguiente
+        resultados = (await session.exec(query.limit(limit + 1))).all()
+        pagina = resultados[:limit]
+        next_cursor = None
+        if len(resultados) > limit:
+            ultimo = pagina[-1]
+            next_cursor = encode_cursor(campo, getattr(ultimo, campo), ultimo.id)
+        return pagina, next_cursor
+
+    @classmethod
+    def resolve_order(cls, order_by: str):
+        """
+        Traduce "campo" o "-campo" (descendente) a la columna del modelo.
+        Solo se aceptan columnas de sortable_fields para no ordenar por expresiones arbitrarias.
+        """
+        campo = order_by.strip()
+        descendente = campo.startswith("-")
+        campo = campo.lstrip("-")
+        if campo not in cls.sortable_fields:
+            raise ValueError(f"No se puede ordenar por '{campo}'. Campos permitidos: {', '.join(cls.sortable_fields)}")
+        return campo, getattr(cls.model, campo), descendente
+
+    @classmethod
+    def apply_filters(cls, query, filtros: dict | None):
+        """
+        Aplica filtros con la sintaxis "campo__operador" (gt, gte, lt, lte, in, contains);
+        sin operador se compara por igualdad. Campos u operadores desconocidos son un error.
+        """
         if filtros:
             condiciones = []
-            for campo, valor in filtros.items():
-                if hasattr(cls.model, campo):
-                    condiciones.append(getattr(cls.model, campo) == valor)
+            columnas = cls.model.__table__.columns.keys()
+            for clave, valor in filtros.items():
+                campo, _, operador = clave.partition("__")
+                operador = operador or "eq"
+                if campo not in columnas:
+                    raise ValueError(f"No se puede filtrar por '{campo}'")
+                if operador not in FILTER_OPERATORS:
+                    raise ValueError(f"Operador de filtro desconocido '{operador}'")
+                condiciones.append(FILTER_OPERATORS[operador](getattr(cls.model, campo), valor))
             query = query.where(*condiciones)
-        query = query.offset(offset).limit(limit)
-        return session.exec(query).all()
+        return query
 
     @classmethod
-    def update(cls, session: SessionDep, obj: SQLModel) -> SQLModel:
+    async def update(cls, session: AsyncSessionDep, obj: SQLModel) -> SQLModel:
         # Obtener el objeto existente
-        db_obj = session.get(cls.model, obj.id)
+        db_obj = await session.get(cls.model, obj.id)
         if not db_obj:
             raise ValueError(f"No existe un objeto con id {obj.id}")
         # Actualizar solo los campos presentes en obj
         for key, value in obj.model_dump(exclude_unset=True).items():
             setattr(db_obj, key, value)
         session.add(db_obj)
-        session.commit()
-        session.refresh(db_obj)
-        return db_obj
+        await session.commit()
+        return await cls.reload(session, db_obj)
 
     @classmethod
-    def delete(cls, session: SessionDep, obj_id: UUID) -> None:
-        obj = session.get(cls.model, obj_id)
+    async def delete(cls, session: AsyncSessionDep, obj_id: UUID) -> None:
+        obj = await session.get(cls.model, obj_id)
         if obj:
-            session.delete(obj)
-            session.commit()
\ No newline at end of file
+            await session.delete(obj)
+            await session.commit()
+
+    @classmethod
+    async def reload(cls, session: AsyncSessionDep, db_obj: SQLModel) -> SQLModel:
+        """Recarga un objeto tras un commit, incluyendo las relaciones de load_options"""
+        if cls.load_options:
+            return await cls.read(session, db_obj.id)
+        await session.refresh(db_obj)
+        return db_obj
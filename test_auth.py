@@ -0,0 +1,200 @@
+"""
+Test de autenticación: revocación de tokens (logout y rotación de refresh tokens), caché de usuarios
+autenticados y pool de bcrypt (429 al saturarse, rehash al cambiar el costo)
+Verifica que los tokens llevan JTI, que los revocados se rechazan, que el filtro en memoria
+evita consultar la base de datos para los tokens vigentes, la purga de filas expiradas y que
+la caché de get_current_user se invalida al cambiar el usuario.
+Ejecutar con: python -m pytest test_auth.py
+"""
+
+from datetime import datetime, timedelta
+from uuid import UUID
+
+import jwt
+import pytest
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from sqlmodel import select
+
+from app import Auth
+from app.Auth import ALGORITHM, SECRET_KEY, Principal, get_current_user, principal_cache
+from app.cache import BloomFilter
+from models import TokenBlacklist, Usuario
+from models.types import UserType
+from services import TokenBlacklistService as blacklist
+from services.TokenBlacklistService import TokenBlacklistService
+from services.UsuarioService import UsuarioService
+
+USUARIO = dict(
+    email="cliente@reservio.cl", rut="1-9", nombres="Nombre", appaterno="Paterno",
+    apmaterno="Materno", fecha_nacimiento="1990-01-01", password="clave-segura"
+)
+
+@pytest.fixture
+def tokens(cliente):
+    """Registra un usuario y devuelve los tokens de su login"""
+    principal_cache.clear()  # La caché es del proceso y cada test usa una base nueva
+    assert cliente.post("/auth/register", json=USUARIO).status_code == 200
+    response = cliente.post("/auth/login", data={"username": USUARIO["email"], "password": USUARIO["password"]})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+@pytest.fixture
+def filtro_aislado(monkeypatch):
+    """Restaura el filtro y el estado de carga del módulo al terminar el test"""
+    monkeypatch.setattr(blacklist, "_filtro", blacklist._filtro)
+    monkeypatch.setattr(blacklist, "_cargado", False)
+    monkeypatch.setattr(blacklist, "_ultima_sincronizacion", None)
+
+def cabecera(token):
+    return {"Authorization": f"Bearer {token}"}
+
+def test_tokens_con_jti(tokens):
+    access = jwt.decode(tokens["access_token"], SECRET_KEY, algorithms=[ALGORITHM])
+    refresh = jwt.decode(tokens["refresh_token"], SECRET_KEY, algorithms=[ALGORITHM])
+    assert access["jti"] and refresh["jti"] and access["jti"] != refresh["jti"]
+
+def test_logout_revoca_tokens(cliente, base_datos, tokens, filtro_aislado):
+    assert cliente.get("/auth/me", headers=cabecera(tokens["access_token"])).status_code == 200
+
+    response = cliente.post(
+        "/auth/logout", headers=cabecera(tokens["access_token"]),
+        json={"refresh_token": tokens["refresh_token"]}
+    )
+    assert response.status_code == 200, response.text
+    response = cliente.get("/auth/me", headers=cabecera(tokens["access_token"]))
+    assert response.status_code == 401 and response.json()["detail"] == "Token revocado"
+    response = cliente.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 401
+
+    async def filas(session_maker):
+        async with session_maker() as session:
+            return (await session.exec(select(TokenBlacklist.token_type))).all()
+    assert sorted(base_datos.ejecutar(filas)) == ["access", "refresh"]
+
+def test_logout_con_refresh_de_otro_usuario(cliente, tokens):
+    otro = {**USUARIO, "email": "otro@reservio.cl", "rut": "2-7"}
+    cliente.post("/auth/register", json=otro)
+    ajeno = cliente.post("/auth/login", data={"username": otro["email"], "password": otro["password"]}).json()
+    response = cliente.post(
+        "/auth/logout", headers=cabecera(tokens["access_token"]),
+        json={"refresh_token": ajeno["refresh_token"]}
+    )
+    assert response.status_code == 400
+
+def test_rotacion_de_refresh_token(cliente, tokens, filtro_aislado):
+    response = cliente.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200, response.text
+    nuevos = response.json()
+    # El refresh token ya usado no sirve una segunda vez; el nuevo sí
+    response = cliente.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 401 and response.json()["detail"] == "Refresh token revocado"
+    assert cliente.post("/auth/refresh", json={"refresh_token": nuevos["refresh_token"]}).status_code == 200
+
+def test_filtro_evita_consultas(base_datos, filtro_aislado):
+    expira = (datetime.now() + timedelta(hours=1)).timestamp()
+    revocado = {"jti": "revocado", "sub": USUARIO["email"], "type": "access", "exp": expira}
+    vigente = {"jti": "vigente", "sub": USUARIO["email"], "type": "access", "exp": expira}
+
+    async def prueba(session_maker):
+        async with session_maker() as session:
+            # Sin el filtro cargado cada comprobación consulta la base de datos
+            base_datos.consultas.clear()
+            assert not await TokenBlacklistService.esta_revocado(session, vigente)
+            assert len(base_datos.consultas) == 1
+
+            assert await TokenBlacklistService.revocar(session, revocado)
+            assert not await TokenBlacklistService.revocar(session, revocado)
+            await TokenBlacklistService.cargar_filtro(session)
+
+            base_datos.consultas.clear()
+            assert not await TokenBlacklistService.esta_revocado(session, vigente)
+            assert await TokenBlacklistService.esta_revocado(session, revocado)
+            assert base_datos.consultas == []
+    base_datos.ejecutar(prueba)
+
+def test_purga_de_expirados(base_datos, filtro_aislado):
+    async def prueba(session_maker):
+        async with session_maker() as session:
+            for jti, horas in (("expirado", -1), ("vigente", 1)):
+                session.add(TokenBlacklist(
+                    token_jti=jti, token_type="refresh", user_email=USUARIO["email"],
+                    expires_at=datetime.now() + timedelta(hours=horas)
+                ))
+            await session.commit()
+            assert await TokenBlacklistService.purgar(session) == 1
+            assert (await session.exec(select(TokenBlacklist.token_jti))).all() == ["vigente"]
+            await TokenBlacklistService.cargar_filtro(session)
+        assert "vigente" in blacklist._filtro
+    base_datos.ejecutar(prueba)
+
+def test_bloom_filter_sin_falsos_negativos():
+    filtro = BloomFilter(1000, 0.01)
+    claves = [f"jti-{i}" for i in range(1000)]
+    for clave in claves:
+        filtro.add(clave)
+    assert all(clave in filtro for clave in claves)
+    falsos_positivos = sum(f"otro-{i}" in filtro for i in range(10000))
+    assert falsos_positivos < 300
+    assert len(filtro) == 1000
+
+def test_cache_de_principal(cliente, base_datos, tokens, filtro_aislado):
+    """El usuario autenticado se cachea como copia y se invalida al bloquear, desbloquear, cambiar tipo o eliminar"""
+    usuario_id = UUID(cliente.get("/auth/me", headers=cabecera(tokens["access_token"])).json()["id"])
+    token = tokens["access_token"]
+    otro = {**USUARIO, "email": "otro@reservio.cl", "rut": "2-7"}
+    otro_id = UUID(cliente.post("/auth/register", json=otro).json()["id"])
+    token_otro = cliente.post("/auth/login", data={"username": otro["email"], "password": otro["password"]}).json()["access_token"]
+
+    async def prueba(session_maker):
+        async with session_maker() as session:
+            await TokenBlacklistService.cargar_filtro(session)
+            principal = await get_current_user(session, token)
+            assert isinstance(principal, Principal) and principal.tipo == UserType.cliente
+            # Segundo request: ni el usuario ni sus bloqueos se consultan
+            base_datos.consultas.clear()
+            assert await get_current_user(session, token) == principal
+            assert base_datos.consultas == []
+
+            await UsuarioService.block_user(session, usuario_id, usuario_id, "prueba")
+            with pytest.raises(HTTPException) as error:
+                await get_current_user(session, token)
+            assert error.value.status_code == 403
+            await UsuarioService.unblock_user(session, usuario_id)
+            assert not (await get_current_user(session, token)).bloqueado
+
+            await UsuarioService.cambiar_tipo(session, usuario_id, UserType.propietario)
+            assert (await get_current_user(session, token)).tipo == UserType.propietario
+
+            assert (await get_current_user(session, token_otro)).id == otro_id
+            await UsuarioService.delete(session, otro_id)
+            with pytest.raises(HTTPException) as error:
+                await get_current_user(session, token_otro)
+            assert error.value.status_code == 401
+    base_datos.ejecutar(prueba)
+
+def login(cliente):
+    return cliente.post("/auth/login", data={"username": USUARIO["email"], "password": USUARIO["password"]})
+
+def test_pool_de_hash_saturado(cliente, tokens, monkeypatch):
+    monkeypatch.setattr(Auth, "_hash_pending", Auth.HASH_MAX_PENDING)
+    response = login(cliente)
+    assert response.status_code == 429 and response.headers["Retry-After"] == "1"
+    monkeypatch.setattr(Auth, "_hash_pending", Auth.HASH_MAX_PENDING - 1)
+    assert login(cliente).status_code == 200
+    assert Auth._hash_pending == Auth.HASH_MAX_PENDING - 1
+
+def test_rehash_al_cambiar_costo(cliente, base_datos, tokens, monkeypatch):
+    async def hash_guardado(session_maker):
+        async with session_maker() as session:
+            return (await session.exec(select(Usuario.password).where(Usuario.email == USUARIO["email"]))).one()
+
+    anterior = base_datos.ejecutar(hash_guardado)
+    costo = int(anterior.split("$")[2])
+    monkeypatch.setattr(Auth, "pwd_context", CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=costo + 1))
+    assert login(cliente).status_code == 200
+    nuevo = base_datos.ejecutar(hash_guardado)
+    assert nuevo != anterior and int(nuevo.split("$")[2]) == costo + 1
+    # Con el costo ya actualizado el login no vuelve a escribir el hash
+    assert login(cliente).status_code == 200
+    assert base_datos.ejecutar(hash_guardado) == nuevo
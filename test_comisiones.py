@@ -0,0 +1,245 @@
+"""
+Test de las consultas de comisiones (resumen por período, comisiones a pagar, cambios de estado
+por lote, exportación y saldo de propietarios)
+Verifica que los totales, el desglose por día/semana/mes y los totales por propietario
+se calculan en SQL, y que el detalle por propietario se pagina por cursor.
+Ejecutar con: python -m pytest test_comisiones.py
+"""
+
+import csv
+import io
+import json
+import uuid
+from datetime import date, datetime
+
+import pytest
+from sqlmodel import select
+
+from models import Comision, Pago, Reserva, Usuario
+from models.types import ComisionStatus
+from services.ComisionService import ComisionService
+from services import ExportacionService as exportacion
+from services.ExportacionService import ExportacionService
+from services.SaldoService import SaldoService
+
+# (fecha de creación, monto, estado)
+COMISIONES = [
+    (datetime(2030, 3, 4, 9), 1000, ComisionStatus.pendiente),     # lunes
+    (datetime(2030, 3, 5, 18), 2000, ComisionStatus.pendiente),    # martes
+    (datetime(2030, 3, 10, 23), 3000, ComisionStatus.procesada),   # domingo, misma semana
+    (datetime(2030, 3, 11, 12), 4000, ComisionStatus.completada),  # lunes siguiente
+    (datetime(2030, 4, 1, 12), 5000, ComisionStatus.pendiente),    # otro mes
+    (datetime(2030, 5, 1, 12), 9000, ComisionStatus.pendiente),    # fuera del período
+]
+
+@pytest.fixture
+def propietario(base_datos):
+    """Propietario con las comisiones de COMISIONES (sin saldo registrado)"""
+    async def poblar(session_maker):
+        async with session_maker() as session:
+            propietario = Usuario(
+                email="propietario@reservio.cl", rut="1-9", nombres="Nombre", appaterno="Paterno",
+                apmaterno="Materno", fecha_nacimiento=date(1990, 1, 1), password="hash"
+            )
+            reserva = Reserva(
+                inicio=datetime(2030, 1, 1, 10), fin=datetime(2030, 1, 1, 12), cant_horas=2,
+                costo_total=20000, cliente_id=propietario.id
+            )
+            pago = Pago(monto_total=20000, monto_propietario=19000, monto_comision=1000, reserva_id=reserva.id)
+            session.add_all([propietario, reserva, pago])
+            for fecha, monto, estado in COMISIONES:
+                session.add(Comision(
+                    monto=monto, estado=estado, fecha_creacion=fecha,
+                    pago_id=pago.id, propietario_id=propietario.id
+                ))
+            await session.commit()
+            return propietario
+
+    propietario = base_datos.ejecutar(poblar)
+    base_datos.consultas.clear()
+    return propietario
+
+def test_resumen_por_periodo(base_datos, propietario):
+    consultas = base_datos.consultas
+
+    async def prueba(session_maker):
+        inicio, fin = datetime(2030, 3, 1), datetime(2030, 4, 30)
+        async with session_maker() as session:
+            resumen = await ComisionService.obtener_resumen_comisiones_periodo(inicio, fin, session)
+        assert resumen["cantidad_total"] == 5
+        assert resumen["total_comisiones"] == 15000
+        assert resumen["por_estado"] == {
+            "pendiente": {"cantidad": 3, "monto_total": 8000},
+            "procesada": {"cantidad": 1, "monto_total": 3000},
+            "completada": {"cantidad": 1, "monto_total": 4000},
+        }
+        assert len(consultas) == 1 and "GROUP BY" in consultas[0]
+
+        async with session_maker() as session:
+            semanas = await ComisionService.obtener_resumen_comisiones_periodo(inicio, fin, session, "semana")
+            meses = await ComisionService.obtener_resumen_comisiones_periodo(inicio, fin, session, "mes")
+            dias = await ComisionService.obtener_resumen_comisiones_periodo(inicio, fin, session, "dia")
+        assert semanas["por_estado"] == resumen["por_estado"]
+        assert [(p["periodo"], p["cantidad"], p["monto_total"]) for p in semanas["por_periodo"]] == [
+            ("2030-03-04", 3, 6000), ("2030-03-11", 1, 4000), ("2030-04-01", 1, 5000)
+        ]
+        assert [(p["periodo"], p["monto_total"]) for p in meses["por_periodo"]] == [("2030-03", 10000), ("2030-04", 5000)]
+        assert [p["periodo"] for p in dias["por_periodo"]] == ["2030-03-04", "2030-03-05", "2030-03-10", "2030-03-11", "2030-04-01"]
+        assert meses["por_periodo"][0]["por_estado"]["procesada"] == {"cantidad": 1, "monto_total": 3000}
+        assert len(consultas) == 4
+
+        async with session_maker() as session:
+            with pytest.raises(ValueError):
+                await ComisionService.obtener_resumen_comisiones_periodo(inicio, fin, session, "hora")
+    base_datos.ejecutar(prueba)
+
+def test_comisiones_a_pagar(base_datos, propietario):
+    consultas = base_datos.consultas
+
+    async def prueba(session_maker):
+        async with session_maker() as session:
+            otro = Usuario(
+                email="otro@reservio.cl", rut="2-7", nombres="Otro", appaterno="Dueño",
+                apmaterno="Materno", fecha_nacimiento=date(1990, 1, 1), password="hash"
+            )
+            session.add(otro)
+            pago_id = (await session.exec(select(Pago.id))).first()
+            for dia in (1, 2, 3):
+                session.add(Comision(monto=500, estado=ComisionStatus.procesada, fecha_creacion=datetime(2030, 6, dia),
+                                     pago_id=pago_id, propietario_id=propietario.id))
+            session.add(Comision(monto=7000, estado=ComisionStatus.procesada, pago_id=pago_id, propietario_id=otro.id))
+            await session.commit()
+        consultas.clear()
+
+        async with session_maker() as session:
+            totales = await ComisionService.obtener_comisiones_a_pagar(session)
+        assert len(consultas) == 1
+        assert [(t["propietario"]["email"], t["cantidad"], t["monto_total"]) for t in totales] == [
+            ("otro@reservio.cl", 1, 7000), ("propietario@reservio.cl", 4, 4500)
+        ]
+        assert totales[0]["propietario"]["nombre"] == "Otro Dueño"
+
+        # El detalle se recorre por páginas con el cursor
+        vistos, cursor = [], None
+        async with session_maker() as session:
+            while True:
+                pagina, cursor = await ComisionService.obtener_detalle_a_pagar(propietario.id, session, limit=3, cursor=cursor)
+                vistos.extend(pagina)
+                if not cursor:
+                    break
+        assert [c["monto"] for c in vistos] == [3000, 500, 500, 500]
+        assert len({c["id"] for c in vistos}) == 4
+    base_datos.ejecutar(prueba)
+
+def test_transiciones_por_lote(base_datos, propietario):
+    async def prueba(session_maker):
+        async with session_maker() as session:
+            comisiones = (await session.exec(select(Comision).order_by(Comision.fecha_creacion))).all()
+        pendientes = [c.id for c in comisiones if c.estado == ComisionStatus.pendiente]
+        procesada = next(c.id for c in comisiones if c.estado == ComisionStatus.procesada)
+        inexistente = uuid.uuid4()
+
+        async with session_maker() as session:
+            resultado = await ComisionService.transicionar_comisiones(
+                session, ComisionStatus.pendiente, ComisionStatus.procesada,
+                comision_ids=[*pendientes[:2], procesada, inexistente]
+            )
+        assert resultado["actualizadas"] == [str(c) for c in pendientes[:2]]
+        assert set(resultado["fallidas"]) == {str(procesada), str(inexistente)}
+
+        # Todas las pendientes restantes del propietario
+        async with session_maker() as session:
+            resultado = await ComisionService.transicionar_comisiones(
+                session, ComisionStatus.pendiente, ComisionStatus.procesada, propietario_id=propietario.id
+            )
+        assert sorted(resultado["actualizadas"]) == sorted(str(c) for c in pendientes[2:])
+        async with session_maker() as session:
+            estados = (await session.exec(
+                select(Comision.estado, Comision.fecha_procesamiento).where(Comision.id.in_(pendientes))
+            )).all()
+        assert all(estado == ComisionStatus.procesada and fecha for estado, fecha in estados)
+
+        async with session_maker() as session:
+            with pytest.raises(ValueError):
+                await ComisionService.transicionar_comisiones(session, ComisionStatus.procesada, ComisionStatus.completada)
+    base_datos.ejecutar(prueba)
+
+def test_exportacion_por_bloques(monkeypatch, base_datos, propietario):
+    monkeypatch.setattr(exportacion, "FILAS_POR_BLOQUE", 2)
+
+    async def prueba(session_maker):
+        async def leer(query, formato):
+            return [b async for b in ExportacionService.exportar(query, formato, session_factory=session_maker)]
+
+        query = ExportacionService.consulta_comisiones(desde=datetime(2030, 3, 1), hasta=datetime(2030, 4, 30))
+        bloques = await leer(query, "csv")
+        # Encabezado y luego un bloque por cada 2 filas
+        assert len(bloques) == 1 + 3
+        filas = list(csv.DictReader(io.StringIO(b"".join(bloques).decode())))
+        assert [int(f["monto"]) for f in filas] == [1000, 2000, 3000, 4000, 5000]
+        assert filas[2]["estado"] == "procesada"
+
+        query = ExportacionService.consulta_comisiones(estado=ComisionStatus.pendiente, propietario_id=propietario.id)
+        lineas = b"".join(await leer(query, "ndjson")).decode().splitlines()
+        assert [json.loads(l)["monto"] for l in lineas] == [1000, 2000, 5000, 9000]
+
+        pagos = b"".join(await leer(ExportacionService.consulta_pagos(), "csv")).decode().splitlines()
+        assert len(pagos) == 2 and pagos[0].startswith("id,fecha_creacion")
+
+        with pytest.raises(ValueError):
+            ExportacionService.exportar(query, "xlsx")
+    base_datos.ejecutar(prueba)
+
+def test_saldo_y_reconciliacion(base_datos, propietario):
+    consultas = base_datos.consultas
+
+    async def prueba(session_maker):
+        # Las comisiones de la base se insertaron sin saldo: la reconciliación lo crea
+        async with session_maker() as session:
+            diferencias = await SaldoService.reconciliar(session)
+            assert [d["guardado"] for d in diferencias] == [None]
+            await SaldoService.reconciliar(session, corregir=True)
+        async with session_maker() as session:
+            saldo = await SaldoService.obtener_saldo(propietario.id, session)
+        assert (saldo["pendiente"], saldo["procesada"], saldo["completada"]) == (17000, 3000, 4000)
+
+        # Los cambios de estado (uno a uno y por lote) mueven el saldo en la misma transacción
+        async with session_maker() as session:
+            pendiente = (await session.exec(select(Comision).where(Comision.monto == 1000))).one()
+            await ComisionService.procesar_comision(pendiente.id, session)
+            await ComisionService.completar_comision(pendiente.id, session)
+            await ComisionService.transicionar_comisiones(
+                session, ComisionStatus.pendiente, ComisionStatus.procesada, propietario_id=propietario.id
+            )
+        consultas.clear()
+        async with session_maker() as session:
+            saldo = await SaldoService.obtener_saldo(propietario.id, session)
+        assert len(consultas) == 1
+        assert (saldo["pendiente"], saldo["procesada"], saldo["completada"]) == (0, 19000, 5000)
+        async with session_maker() as session:
+            assert await SaldoService.reconciliar(session) == []
+    base_datos.ejecutar(prueba)
+
+def test_cambio_de_estado_con_lectura_desactualizada(base_datos, propietario):
+    """Una comisión leída antes de que otra petición la procese no se procesa dos veces"""
+    async def prueba(session_maker):
+        async with session_maker() as session:
+            await SaldoService.reconciliar(session, corregir=True)
+        async with session_maker() as primera, session_maker() as segunda:
+            pendiente = (await primera.exec(select(Comision).where(Comision.monto == 1000))).one()
+            await primera.commit()
+            await ComisionService.procesar_comision(pendiente.id, segunda)
+            # La primera sesión todavía tiene la comisión en estado pendiente en su mapa de identidad
+            assert pendiente.estado == ComisionStatus.pendiente
+            with pytest.raises(ValueError, match="no está en estado pendiente"):
+                await ComisionService.procesar_comision(pendiente.id, primera)
+            with pytest.raises(ValueError, match="no encontrada"):
+                await ComisionService.completar_comision(uuid.uuid4(), primera)
+            await ComisionService.completar_comision(pendiente.id, primera)
+            with pytest.raises(ValueError, match="procesada primero"):
+                await ComisionService.completar_comision(pendiente.id, segunda)
+        async with session_maker() as session:
+            saldo = await SaldoService.obtener_saldo(propietario.id, session)
+            assert (saldo["pendiente"], saldo["procesada"], saldo["completada"]) == (16000, 3000, 5000)
+            assert await SaldoService.reconciliar(session) == []
+    base_datos.ejecutar(prueba)
@@ -0,0 +1,61 @@
+"""
+Test de cantidad de consultas SQL en el listado y detalle de propiedades
+Verifica que las relaciones de PropiedadRead se cargan en un número acotado de
+consultas (sin N+1), sin importar cuántas propiedades tenga la página.
+Ejecutar con: python -m pytest test_consultas.py
+"""
+
+from datetime import date
+
+import pytest
+
+from models import Usuario, Region, Comuna, Propiedad, Valoracion
+from models.manyToMany import UsuarioPropiedad
+
+CANTIDAD_PROPIEDADES = 20
+# 1 SELECT con JOIN a comuna + 1 SELECT ... IN por propietarios + 1 por valoraciones
+MAX_CONSULTAS = 3
+
+@pytest.fixture
+def propiedades(base_datos):
+    """Propiedades con comuna, propietario y una valoración cada una"""
+    async def poblar(session_maker):
+        async with session_maker() as session:
+            region = Region(nombre="Metropolitana")
+            comuna = Comuna(nombre="Santiago", region_id=region.id)
+            session.add_all([region, comuna])
+            for i in range(CANTIDAD_PROPIEDADES):
+                usuario = Usuario(
+                    email=f"propietario{i}@reservio.cl", rut=f"{i}-K", nombres="Nombre",
+                    appaterno="Paterno", apmaterno="Materno", fecha_nacimiento=date(1990, 1, 1),
+                    password="hash"
+                )
+                propiedad = Propiedad(
+                    descripcion="Propiedad de prueba", direccion="Calle 123", tipo="sala",
+                    cod_postal="8320000", precio_hora=1000 * (i + 1), comuna_id=comuna.id
+                )
+                session.add_all([usuario, propiedad])
+                session.add(UsuarioPropiedad(usuario_id=usuario.id, propiedad_id=propiedad.id))
+                session.add(Valoracion(puntaje=5, cliente_id=usuario.id, propiedad_id=propiedad.id))
+            await session.commit()
+
+    base_datos.ejecutar(poblar)
+
+def test_listado_propiedades_consultas_acotadas(cliente, base_datos, propiedades):
+    """El listado no debe ejecutar consultas adicionales por cada propiedad"""
+    base_datos.consultas.clear()
+    response = cliente.get("/api/v1/propiedades/", params={"limit": CANTIDAD_PROPIEDADES})
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert len(data) == CANTIDAD_PROPIEDADES
+    assert all(p["comuna"] and p["propietarios"] and p["valoraciones"] for p in data)
+    assert len(base_datos.consultas) <= MAX_CONSULTAS, base_datos.consultas
+
+def test_detalle_propiedad_consultas_acotadas(cliente, base_datos, propiedades):
+    """El detalle carga comuna, propietarios y valoraciones en un número fijo de consultas"""
+    propiedad_id = cliente.get("/api/v1/propiedades/", params={"limit": 1}).json()[0]["id"]
+    base_datos.consultas.clear()
+    response = cliente.get(f"/api/v1/propiedades/{propiedad_id}")
+    assert response.status_code == 200, response.text
+    assert response.json()["propietarios"]
+    assert len(base_datos.consultas) <= MAX_CONSULTAS, base_datos.consultas
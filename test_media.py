@@ -0,0 +1,307 @@
+"""
+Test de cabeceras de caché, peticiones condicionales y Range en /media, y de la subida de archivos
+Ejecutar con: python -m pytest test_media.py
+"""
+
+import sys
+from pathlib import Path
+
+# Agregar el directorio del proyecto al path
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+import asyncio
+import hashlib
+import io
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.datastructures import UploadFile
+
+import controllers.Imagenes as imagenes
+import controllers.Media as media
+from controllers.Media import BLOBS_DIR, DOCS_DIR, CACHE_POLICIES, CACHE_DEFAULT, ArchivoDemasiadoGrande, MediaStaticFiles, precomprimir, upload_image
+from controllers.Storage import MEDIA_DIR, FileSystemStorage, StorageBackend, set_storage
+from models import Comuna, MediaBlob, Propiedad, PropiedadBase, Region
+from services.PropiedadService import PropiedadService
+from sqlmodel import select
+
+HASH = "ab" + "0" * 62
+
+def crear_cliente(directorio: Path) -> TestClient:
+    (directorio / BLOBS_DIR / "ab").mkdir(parents=True)
+    (directorio / DOCS_DIR / "ab").mkdir(parents=True)
+    (directorio / "antigua").mkdir()
+    (directorio / BLOBS_DIR / "ab" / f"{HASH}.jpg").write_bytes(b"foto" * 100)
+    (directorio / DOCS_DIR / "ab" / f"{HASH}.pdf").write_bytes(bytes(range(256)) * 4)
+    (directorio / DOCS_DIR / "ab" / f"{HASH}.csv").write_text("a,b\n1,2\n" * 200)
+    precomprimir(str(directorio / DOCS_DIR / "ab" / f"{HASH}.csv"))
+    (directorio / "antigua" / "foto.jpg").write_bytes(b"vieja")
+    app = FastAPI()
+    app.mount("/media", MediaStaticFiles(directory=directorio), name="media")
+    return TestClient(app)
+
+def test_cache_y_etag(tmp_path):
+    c = crear_cliente(tmp_path)
+    r = c.get(f"/media/{BLOBS_DIR}/ab/{HASH}.jpg")
+    assert r.status_code == 200
+    assert r.headers["cache-control"] == CACHE_POLICIES[BLOBS_DIR]
+    assert r.headers["etag"] == f'"{HASH}"'
+    r = c.get(f"/media/{BLOBS_DIR}/ab/{HASH}.jpg", headers={"If-None-Match": f'"{HASH}"'})
+    assert r.status_code == 304
+    assert r.headers["cache-control"] == CACHE_POLICIES[BLOBS_DIR]
+    r = c.get(f"/media/{DOCS_DIR}/ab/{HASH}.pdf")
+    assert r.headers["cache-control"] == CACHE_POLICIES[DOCS_DIR]
+    r = c.get("/media/antigua/foto.jpg")
+    assert r.headers["cache-control"] == CACHE_DEFAULT
+    assert c.get("/media/antigua/foto.jpg", headers={"If-None-Match": r.headers["etag"]}).status_code == 304
+
+def test_range_documentos(tmp_path):
+    c = crear_cliente(tmp_path)
+    contenido = bytes(range(256)) * 4
+    r = c.get(f"/media/{DOCS_DIR}/ab/{HASH}.pdf", headers={"Range": "bytes=10-19"})
+    assert r.status_code == 206
+    assert r.content == contenido[10:20]
+    assert r.headers["content-range"] == f"bytes 10-19/{len(contenido)}"
+    # If-Range con un ETag distinto devuelve el archivo completo
+    r = c.get(f"/media/{DOCS_DIR}/ab/{HASH}.pdf", headers={"Range": "bytes=10-19", "If-Range": '"otro"'})
+    assert r.status_code == 200
+    assert r.content == contenido
+
+def test_precomprimidos(tmp_path):
+    c = crear_cliente(tmp_path)
+    ruta = f"/media/{DOCS_DIR}/ab/{HASH}.csv"
+    r = c.get(ruta, headers={"Accept-Encoding": "gzip"})
+    assert r.status_code == 200
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.headers["content-type"].startswith("text/csv")
+    assert r.headers["vary"] == "Accept-Encoding"
+    assert int(r.headers["content-length"]) < len("a,b\n1,2\n" * 200)
+    assert r.text == "a,b\n1,2\n" * 200
+    r = c.get(ruta, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in r.headers
+    assert r.headers["etag"] == f'"{HASH}"'
+    r = c.get(ruta, headers={"Accept-Encoding": "gzip", "Range": "bytes=0-3"})
+    assert r.status_code == 206 and r.content == b"a,b\n"
+
+def test_almacenamiento_s3():
+    """Backend S3 contra moto: subida por la API, URL firmada de subida directa y redirección de /media"""
+    pytest.importorskip("boto3")
+    moto = pytest.importorskip("moto")
+    import requests
+    from controllers.Media import delete_blobs, media_app, preparar_subida_directa, subida_directa, upload_image
+    from controllers.Storage import S3Storage, set_storage
+
+    with moto.mock_aws():
+        storage = S3Storage("reservio-test", region="us-east-1")
+        storage.client.create_bucket(Bucket="reservio-test")
+        set_storage(storage)
+        try:
+            contenido = b"foto" * 1000
+            digest = hashlib.sha256(contenido).hexdigest()
+            subida = asyncio.run(upload_image(file=UploadFile(io.BytesIO(contenido), filename="casa.JPG")))
+            clave = f"{BLOBS_DIR}/{digest[:2]}/{digest}.jpg"
+            assert f"{subida['folder']}/{subida['filename']}" == clave
+            assert asyncio.run(storage.tamano(clave)) == len(contenido)
+
+            # El mismo contenido ya existe: no hace falta subirlo de nuevo
+            assert asyncio.run(preparar_subida_directa(BLOBS_DIR, digest, len(contenido), "image/jpeg", ".jpg"))["existe"]
+
+            documento = b"%PDF-1.4 documento"
+            digest_doc = hashlib.sha256(documento).hexdigest()
+            firmada = asyncio.run(preparar_subida_directa(DOCS_DIR, digest_doc, len(documento), "application/pdf", ".pdf"))
+            assert not firmada["existe"] and firmada["method"] == "PUT"
+            with pytest.raises(ValueError):
+                asyncio.run(subida_directa(firmada["clave"]))
+            assert requests.put(firmada["url"], data=documento, headers=firmada["headers"]).status_code == 200
+            assert asyncio.run(subida_directa(firmada["clave"]))["size"] == len(documento)
+
+            app = FastAPI()
+            app.mount("/media", media_app(), name="media")
+            r = TestClient(app).get(f"/media/{clave}", follow_redirects=False)
+            assert r.status_code == 307 and "reservio-test" in r.headers["location"]
+
+            asyncio.run(delete_blobs([f"media/{clave}"]))
+            assert asyncio.run(storage.tamano(clave)) is None
+        finally:
+            set_storage(None)
+
+def test_backend_incompleto():
+    class SinDescargas(StorageBackend):
+        async def guardar(self, clave, origen, content_type=None, content_encoding=None): ...
+        async def tamano(self, clave): ...
+        async def eliminar(self, claves): ...
+        def archivo_local(self, clave): ...
+
+    for backend in (StorageBackend, SinDescargas):
+        with pytest.raises(TypeError):
+            backend()
+    assert isinstance(FileSystemStorage(MEDIA_DIR), StorageBackend)
+
+@pytest.fixture
+def almacenamiento(tmp_path, monkeypatch):
+    """media/ vacío en un directorio temporal, con bloques pequeños para que la copia use varios"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(media, "CHUNK_SIZE", 64)
+    (tmp_path / MEDIA_DIR).mkdir()
+    set_storage(FileSystemStorage(MEDIA_DIR))
+    yield tmp_path / MEDIA_DIR
+    set_storage(None)
+
+def archivos(directorio: Path) -> list[str]:
+    return sorted(str(p.relative_to(directorio)) for p in directorio.rglob("*") if p.is_file())
+
+def subir(contenido: bytes, filename: str = "foto.JPG", folder: str = BLOBS_DIR) -> dict:
+    return asyncio.run(upload_image(folder, file=UploadFile(io.BytesIO(contenido), filename=filename)))
+
+def test_subida(almacenamiento):
+    contenido = bytes(range(256)) * 4
+    digest = hashlib.sha256(contenido).hexdigest()
+    subida = subir(contenido)
+    assert subida == {"filename": f"{digest}.jpg", "folder": f"{BLOBS_DIR}/{digest[:2]}", "hash": digest, "size": len(contenido)}
+    # Sin temporales: solo queda el archivo con su nombre por contenido
+    assert archivos(almacenamiento) == [f"{BLOBS_DIR}/{digest[:2]}/{digest}.jpg"]
+    assert (almacenamiento / BLOBS_DIR / digest[:2] / f"{digest}.jpg").read_bytes() == contenido
+    # El mismo contenido con otro nombre va a la misma clave
+    assert subir(contenido, "copia.jpg")["filename"] == subida["filename"]
+    assert len(archivos(almacenamiento)) == 1
+
+def test_subida_demasiado_grande(almacenamiento, monkeypatch):
+    monkeypatch.setattr(media, "MAX_UPLOAD_SIZE", 500)
+    with pytest.raises(ArchivoDemasiadoGrande):
+        subir(b"x" * 501)
+    with pytest.raises(ArchivoDemasiadoGrande):
+        subir(b"x" * 501, "informe.csv", DOCS_DIR)
+    assert archivos(almacenamiento) == []
+    assert subir(b"x" * 500)["size"] == 500
+
+async def crear_comuna(session_maker):
+    async with session_maker() as session:
+        region = Region(nombre="Metropolitana")
+        comuna = Comuna(nombre="Santiago", region_id=region.id)
+        session.add_all([region, comuna])
+        await session.commit()
+        return str(comuna.id)
+
+async def registros(session_maker) -> tuple[list, dict]:
+    """Ids de las propiedades y referencias de cada archivo"""
+    async with session_maker() as session:
+        propiedades = (await session.exec(select(Propiedad.id))).all()
+        blobs = dict((await session.exec(select(MediaBlob.ruta, MediaBlob.referencias))).all())
+        return propiedades, blobs
+
+def test_subida_demasiado_grande_api(almacenamiento, monkeypatch, cliente, autenticado, base_datos):
+    monkeypatch.setattr(media, "MAX_UPLOAD_SIZE", 500)
+    datos = dict(
+        descripcion="Sala", direccion="Calle 123", tipo="sala", cod_postal="1", precio_hora="1000",
+        comuna_id=base_datos.ejecutar(crear_comuna), usuario_id=cliente.get("/auth/me", headers=autenticado).json()["id"]
+    )
+    response = cliente.post(
+        "/api/v1/propiedades/", data=datos, headers=autenticado,
+        files=[("images", ("grande.jpg", b"b" * 501, "image/jpeg"))]
+    )
+    assert response.status_code == 413, response.text
+    assert archivos(almacenamiento) == []
+
+    # Con una imagen válida y otra demasiado grande no queda ni la propiedad ni la imagen válida
+    response = cliente.post(
+        "/api/v1/propiedades/", data=datos, headers=autenticado,
+        files=[("images", ("chica.jpg", b"a" * 100, "image/jpeg")), ("images", ("grande.jpg", b"b" * 501, "image/jpeg"))]
+    )
+    assert response.status_code == 413, response.text
+    assert archivos(almacenamiento) == []
+    assert base_datos.ejecutar(registros) == ([], {})
+
+    response = cliente.post("/api/v1/propiedades/", data=datos, headers=autenticado, files=[("images", ("chica.jpg", b"a" * 100, "image/jpeg"))])
+    assert response.status_code == 201, response.text
+    assert len(response.json()["imagenes"]) == 1
+    assert [a.split("/")[0] for a in archivos(almacenamiento)] == [BLOBS_DIR]
+
+def test_derivados_sin_archivos_parciales(tmp_path, monkeypatch):
+    Image = pytest.importorskip("PIL.Image")
+    ruta = tmp_path / "foto.jpg"
+    Image.new("RGB", (2000, 1000), "red").save(ruta, "JPEG")
+    derivados = imagenes.generar_derivados(str(ruta))
+    assert sorted(archivos(tmp_path)) == sorted(["foto.jpg", *(Path(d).name for d in derivados.values())])
+    with Image.open(derivados["thumb"]) as thumb:
+        assert thumb.size == (320, 160) and thumb.format == "JPEG"
+
+    # Una escritura que falla a medias no deja el temporal ni reemplaza la variante publicada
+    publicada = Path(derivados["thumb"]).read_bytes()
+    guardar = Image.Image.save
+    def falla(self, destino, formato=None, **opciones):
+        if formato == "JPEG":
+            Path(destino).write_bytes(b"parcial")
+            raise OSError("disco lleno")
+        return guardar(self, destino, formato, **opciones)
+    monkeypatch.setattr(Image.Image, "save", falla)
+    with pytest.raises(OSError):
+        imagenes.generar_derivados(str(ruta))
+    assert not any(nombre.endswith(".tmp") for nombre in archivos(tmp_path))
+    assert Path(derivados["thumb"]).read_bytes() == publicada
+
+def imagen(contenido: bytes, filename: str = "foto.jpg") -> UploadFile:
+    return UploadFile(io.BytesIO(contenido), filename=filename)
+
+def propiedad(comuna_id: str) -> PropiedadBase:
+    return PropiedadBase(descripcion="Sala", direccion="Calle 123", tipo="sala", cod_postal="1", precio_hora=1000, comuna_id=comuna_id)
+
+def test_referencias_y_huerfanas(almacenamiento, base_datos):
+    """Dos propiedades con la misma foto comparten el archivo, que se borra al eliminar la última"""
+    contenido = b"foto" * 50
+    digest = hashlib.sha256(contenido).hexdigest()
+    ruta = f"media/{BLOBS_DIR}/{digest[:2]}/{digest}.jpg"
+
+    async def prueba(session_maker):
+        comuna_id = await crear_comuna(session_maker)
+        async with session_maker() as session:
+            primera = await PropiedadService.create(session, propiedad(comuna_id), images=[imagen(contenido)])
+            segunda = await PropiedadService.create(session, propiedad(comuna_id), images=[imagen(contenido, "copia.JPG")])
+            assert primera.imagenes == segunda.imagenes == [ruta]
+            assert (await registros(session_maker))[1] == {ruta: 2}
+            assert archivos(almacenamiento) == [ruta.removeprefix("media/")]
+
+            await PropiedadService.delete(session, primera.id)
+            assert (await registros(session_maker))[1] == {ruta: 1}
+            assert archivos(almacenamiento) == [ruta.removeprefix("media/")]
+
+            # Reemplazar las imágenes de la segunda deja la foto original huérfana
+            otra = await PropiedadService.update_with_images(session, segunda.id, [imagen(b"otra")])
+            assert (await registros(session_maker))[1] == {otra.imagenes[0]: 1}
+            assert archivos(almacenamiento) == [otra.imagenes[0].removeprefix("media/")]
+
+            await PropiedadService.delete(session, segunda.id)
+            assert await registros(session_maker) == ([], {})
+            assert archivos(almacenamiento) == []
+    base_datos.ejecutar(prueba)
+
+def test_referencia_antes_de_colocar(almacenamiento, base_datos, monkeypatch):
+    """El archivo se coloca después de confirmar su referencia, y si falla no queda nada"""
+    storage = media.get_storage()
+    guardar = storage.guardar
+
+    async def prueba(session_maker):
+        comuna_id = await crear_comuna(session_maker)
+
+        async def guardar_verificando(clave, origen, *args):
+            # Otra sesión ya ve la referencia: borrar_huerfanas no eliminaría el archivo
+            assert f"media/{clave}" in (await registros(session_maker))[1]
+            await guardar(clave, origen, *args)
+        monkeypatch.setattr(storage, "guardar", guardar_verificando)
+        async with session_maker() as session:
+            creada = await PropiedadService.create(session, propiedad(comuna_id), images=[imagen(b"foto")], documento=imagen(b"doc", "informe.pdf"))
+            assert len(archivos(almacenamiento)) == 2
+
+        async def guardar_con_error(clave, origen, *args):
+            raise OSError("almacenamiento no disponible")
+        monkeypatch.setattr(storage, "guardar", guardar_con_error)
+        async with session_maker() as session:
+            with pytest.raises(OSError):
+                await PropiedadService.create(session, propiedad(comuna_id), images=[imagen(b"nueva")])
+            with pytest.raises(OSError):
+                await PropiedadService.update_with_images(session, creada.id, [imagen(b"nueva")])
+        propiedades, blobs = await registros(session_maker)
+        assert propiedades == [creada.id] and sorted(blobs) == sorted([*creada.imagenes, creada.documento])
+        assert len(archivos(almacenamiento)) == 2
+    base_datos.ejecutar(prueba)
@@ -0,0 +1,248 @@
+"""
+Test del cliente de MercadoPago contra el servidor falso (fake_mercadopago.py)
+Verifica timeouts, reintentos idempotentes, circuit breaker, el flujo preferencia → webhook
+la cola de notificaciones, la caché de consultas de pagos y el seguimiento por broadcast.
+Ejecutar con: python -m pytest test_mercadopago.py
+"""
+
+import asyncio
+import socket
+import threading
+import time
+from datetime import date, datetime
+from uuid import UUID
+
+import pytest
+import uvicorn
+from sqlmodel import select
+
+import fake_mercadopago
+from broker_local import iniciar_broker
+from controllers.Broadcast import BrokerBroadcast, cerrar_broadcast
+from controllers.MercadoPago import CircuitBreaker, MercadoPagoClient, PasarelaNoDisponible
+from models import Comision, Comuna, Pago, Propiedad, Region, Reserva, SaldoPropietario, Usuario, WebhookEvento
+from models.manyToMany import UsuarioPropiedad
+from models.types import PagoStatus, WebhookStatus
+from services.PagoService import MercadoPagoService, pagos_mp_cache
+from services.WebhookService import WebhookService
+
+@pytest.fixture(scope="module")
+def servidor():
+    """Levanta el servidor falso en un puerto libre de localhost"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        puerto = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(fake_mercadopago.app, host="127.0.0.1", port=puerto, log_level="warning"))
+    hilo = threading.Thread(target=server.run, daemon=True)
+    hilo.start()
+    while not server.started:
+        time.sleep(0.01)
+    yield f"http://127.0.0.1:{puerto}"
+    server.should_exit = True
+    hilo.join()
+
+@pytest.fixture(autouse=True)
+def reiniciar_fake():
+    fake_mercadopago.reiniciar()
+
+def test_reintentos_idempotentes(servidor):
+    async def probar():
+        client = MercadoPagoClient("TEST-token", base_url=servidor)
+        try:
+            fake_mercadopago.config["fallas"] = 1
+            respuesta = await client.crear_preferencia({"items": []}, idempotency_key="pago-1")
+            assert respuesta["status"] == 201
+            # El reintento con la misma llave devuelve la misma preferencia
+            repetida = await client.crear_preferencia({"items": []}, idempotency_key="pago-1")
+            assert repetida["response"]["id"] == respuesta["response"]["id"]
+            assert len(fake_mercadopago.preferencias) == 1
+            assert (await client.obtener_pago("999"))["status"] == 404
+        finally:
+            await client.close()
+    asyncio.run(probar())
+
+def test_timeout_y_circuit_breaker(servidor):
+    async def probar():
+        client = MercadoPagoClient("TEST-token", base_url=servidor, timeout=0.2)
+        client.circuito = CircuitBreaker(umbral=2, espera=0.5)
+        try:
+            fake_mercadopago.config["demora"] = 1
+            with pytest.raises(PasarelaNoDisponible):
+                await client.crear_preferencia({"items": []})
+            with pytest.raises(PasarelaNoDisponible):
+                await client.crear_preferencia({"items": []})
+            assert client.circuito.estado == "abierto"
+            # Con el circuito abierto no se llama a la pasarela
+            fake_mercadopago.config["demora"] = 0
+            llamadas = len(fake_mercadopago.peticiones)
+            inicio = time.monotonic()
+            with pytest.raises(PasarelaNoDisponible):
+                await client.crear_preferencia({"items": []})
+            assert time.monotonic() - inicio < 0.1
+            assert len(fake_mercadopago.peticiones) == llamadas
+            # Pasada la espera, una petición exitosa cierra el circuito
+            await asyncio.sleep(0.5)
+            assert (await client.crear_preferencia({"items": []}))["status"] == 201
+            assert client.circuito.estado == "cerrado"
+        finally:
+            await client.close()
+    asyncio.run(probar())
+
+async def crear_reserva(session) -> Reserva:
+    """Región, comuna, propietario, propiedad y una reserva de 20.000 CLP"""
+    region = Region(nombre="Metropolitana")
+    comuna = Comuna(nombre="Santiago", region_id=region.id)
+    propietario = Usuario(
+        email="propietario@reservio.cl", rut="1-9", nombres="Nombre", appaterno="Paterno",
+        apmaterno="Materno", fecha_nacimiento=date(1990, 1, 1), password="hash"
+    )
+    propiedad = Propiedad(descripcion="Sala", direccion="Calle 123", tipo="sala", cod_postal="1", precio_hora=10000, comuna_id=comuna.id)
+    reserva = Reserva(
+        inicio=datetime(2030, 1, 1, 10), fin=datetime(2030, 1, 1, 12), cant_horas=2,
+        costo_total=20000, propiedad_id=propiedad.id, cliente_id=propietario.id
+    )
+    session.add_all([region, comuna, propietario, propiedad, reserva])
+    session.add(UsuarioPropiedad(usuario_id=propietario.id, propiedad_id=propiedad.id))
+    await session.commit()
+    return reserva
+
+def probar_con_base(base_datos, servidor, prueba):
+    """Ejecuta prueba(session_maker, servicio) con la base de pruebas y el cliente del servidor falso"""
+    async def ejecutar(session_maker):
+        client = MercadoPagoClient("TEST-token", base_url=servidor)
+        try:
+            await prueba(session_maker, MercadoPagoService(client))
+        finally:
+            await client.close()
+    base_datos.ejecutar(ejecutar)
+
+def test_preferencia_y_webhook(servidor, base_datos):
+    async def prueba(session_maker, servicio):
+        async with session_maker() as session:
+            reserva = await crear_reserva(session)
+            preferencia = await servicio.crear_preferencia_pago(reserva.id, session)
+            assert preferencia["preference_id"] in fake_mercadopago.preferencias
+
+            payment_id = fake_mercadopago.registrar_pago(preferencia["pago_id"])
+            assert await servicio.procesar_webhook(payment_id, session)
+            pago = (await session.exec(select(Pago))).one()
+            assert pago.estado == PagoStatus.aprobado
+            comision = (await session.exec(select(Comision))).one()
+            assert comision.monto == pago.monto_propietario == 19000
+            assert comision.propietario_id == reserva.cliente_id
+    probar_con_base(base_datos, servidor, prueba)
+
+def test_cola_de_notificaciones(servidor, base_datos):
+    async def prueba(session_maker, servicio):
+        async with session_maker() as session:
+            reserva = await crear_reserva(session)
+            preferencia = await servicio.crear_preferencia_pago(reserva.id, session)
+            payment_id = fake_mercadopago.registrar_pago(preferencia["pago_id"])
+            # Notificaciones repetidas del mismo pago quedan en una sola fila
+            await WebhookService.registrar(session, payment_id, {"type": "payment", "data": {"id": payment_id}})
+            await WebhookService.registrar(session, payment_id, {"type": "payment", "data": {"id": payment_id}})
+            evento = (await session.exec(select(WebhookEvento))).one()
+            assert evento.recibidos == 2 and evento.estado == WebhookStatus.pendiente
+
+        assert await WebhookService.procesar_siguiente(session_maker, servicio)
+        assert not await WebhookService.procesar_siguiente(session_maker, servicio)
+        async with session_maker() as session:
+            assert (await session.exec(select(WebhookEvento))).one().estado == WebhookStatus.procesado
+            assert (await session.exec(select(Pago))).one().estado == PagoStatus.aprobado
+            # Una entrega repetida se vuelve a procesar sin duplicar la comisión
+            await WebhookService.registrar(session, payment_id, {"type": "payment", "data": {"id": payment_id}})
+        assert await WebhookService.procesar_siguiente(session_maker, servicio)
+        async with session_maker() as session:
+            assert len((await session.exec(select(Comision))).all()) == 1
+            # ...ni sumarla dos veces al saldo del propietario
+            saldo = await session.get(SaldoPropietario, reserva.cliente_id)
+            assert saldo.pendiente == 19000
+
+            # Un pago que MercadoPago no encuentra se reintenta más tarde
+            await WebhookService.registrar(session, "404", {"type": "payment", "data": {"id": "404"}})
+        assert await WebhookService.procesar_siguiente(session_maker, servicio)
+        assert not await WebhookService.procesar_siguiente(session_maker, servicio)
+        async with session_maker() as session:
+            evento = (await session.exec(select(WebhookEvento).where(WebhookEvento.mp_payment_id == "404"))).one()
+            assert evento.estado == WebhookStatus.pendiente and evento.intentos == 1
+            assert evento.proximo_intento > datetime.now() and evento.ultimo_error
+    probar_con_base(base_datos, servidor, prueba)
+
+def test_cache_estado_pago(servidor, base_datos):
+    async def prueba(session_maker, servicio):
+        async with session_maker() as session:
+            reserva = await crear_reserva(session)
+            preferencia = await servicio.crear_preferencia_pago(reserva.id, session)
+            pago = await session.get(Pago, UUID(preferencia["pago_id"]))
+            payment_id = fake_mercadopago.registrar_pago(preferencia["pago_id"], status="in_process")
+            pago.mp_payment_id = payment_id
+            await session.commit()
+            pagos_mp_cache.clear()
+
+            def consultas():
+                return fake_mercadopago.peticiones.count(f"GET /v1/payments/{payment_id}")
+
+            # Polls simultáneos y repetidos dentro del TTL hacen una sola consulta a MercadoPago
+            resultados = await asyncio.gather(*(servicio.obtener_estado_pago(pago.id, session) for _ in range(5)))
+            assert all(r["mp_info"]["status"] == "in_process" for r in resultados)
+            await servicio.obtener_estado_pago(pago.id, session)
+            assert consultas() == 1
+
+            # El procesador de notificaciones deja en caché la información nueva
+            fake_mercadopago.pagos[payment_id]["status"] = "approved"
+            await servicio.procesar_webhook(payment_id, session)
+            assert (await servicio.obtener_estado_pago(pago.id, session))["mp_info"]["status"] == "approved"
+            assert consultas() == 2
+
+            # En un estado final no se vuelve a consultar aunque la caché expire
+            pagos_mp_cache.clear()
+            resultado = await servicio.obtener_estado_pago(pago.id, session)
+            assert resultado["estado"] == "aprobado" and "mp_info" not in resultado
+            assert consultas() == 2
+    probar_con_base(base_datos, servidor, prueba)
+
+def test_broadcast_entre_procesos():
+    """Dos instancias conectadas al broker local (como dos workers) comparten los mensajes"""
+    async def probar():
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            puerto = s.getsockname()[1]
+        broker = await iniciar_broker(puerto=puerto)
+        worker_a, worker_b = BrokerBroadcast("127.0.0.1", puerto), BrokerBroadcast("127.0.0.1", puerto)
+        try:
+            await worker_a.conectar()
+            await worker_b.conectar()
+            async with worker_a.suscribir("pago:1") as cola:
+                await asyncio.sleep(0.05)  # Que el broker registre la suscripción
+                await worker_b.publicar("pago:1", {"estado": "aprobado"})
+                await worker_b.publicar("pago:2", {"estado": "rechazado"})
+                assert await asyncio.wait_for(cola.get(), 2) == {"estado": "aprobado"}
+                await asyncio.sleep(0.05)
+                assert cola.empty()
+        finally:
+            await worker_a.desconectar()
+            await worker_b.desconectar()
+            broker.close()
+            await broker.wait_closed()
+    asyncio.run(probar())
+
+def test_seguimiento_estado_pago(servidor, base_datos):
+    async def prueba(session_maker, servicio):
+        async with session_maker() as session:
+            reserva = await crear_reserva(session)
+            preferencia = await servicio.crear_preferencia_pago(reserva.id, session)
+        pago_id = UUID(preferencia["pago_id"])
+        payment_id = fake_mercadopago.registrar_pago(preferencia["pago_id"])
+        try:
+            eventos = MercadoPagoService.seguir_estado(pago_id, session_factory=session_maker)
+            assert (await anext(eventos))["estado"] == "pendiente"
+            siguiente = asyncio.ensure_future(anext(eventos))
+            async with session_maker() as session:
+                await servicio.procesar_webhook(payment_id, session)
+            assert (await asyncio.wait_for(siguiente, 2))["estado"] == "aprobado"
+            # Estado final: el seguimiento termina
+            with pytest.raises(StopAsyncIteration):
+                await anext(eventos)
+        finally:
+            await cerrar_broadcast()
+    probar_con_base(base_datos, servidor, prueba)
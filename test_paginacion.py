@@ -0,0 +1,136 @@
+"""
+Test de la paginación por cursor (keyset), los filtros y el orden de los listados
+Verifica que el cursor se codifica y decodifica sin pérdida, que un cursor inválido o manipulado
+responde 400, que las páginas no repiten ni saltan filas aunque la clave de orden se repita,
+los operadores de filtro y que solo se puede ordenar por los campos declarados de cada servicio.
+Ejecutar con: python -m pytest test_paginacion.py
+"""
+
+import base64
+import json
+from datetime import datetime
+from uuid import uuid4
+
+import pytest
+
+from models import Comuna, Propiedad, Region
+from services import BaseService, decode_cursor, encode_cursor
+from services.MediaService import MediaService
+from services.PropiedadService import PropiedadService
+from services.RegionService import RegionService
+from services.UsuarioService import UsuarioService
+
+# Precios repetidos para que el orden dependa del desempate por id
+PRECIOS = [1000, 1000, 1000, 2000, 2000, 3000, 3000, 3000, 3000]
+
+@pytest.fixture
+def propiedades(base_datos):
+    """Propiedades de una comuna con los precios de PRECIOS; devuelve [(precio, id)]"""
+    async def poblar(session_maker):
+        async with session_maker() as session:
+            region = Region(nombre="Metropolitana")
+            comuna = Comuna(nombre="Santiago", region_id=region.id)
+            session.add_all([region, comuna])
+            creadas = []
+            for i, precio in enumerate(PRECIOS):
+                propiedad = Propiedad(
+                    descripcion=f"Propiedad {i}", direccion="Calle 123", tipo="sala" if i % 2 else "casa",
+                    cod_postal="8320000", precio_hora=precio, capacidad=i, comuna_id=comuna.id
+                )
+                session.add(propiedad)
+                creadas.append((precio, str(propiedad.id)))
+            await session.commit()
+            return creadas
+
+    return base_datos.ejecutar(poblar)
+
+def recorrer(cliente, **params):
+    """Recorre todas las páginas siguiendo X-Next-Cursor; devuelve las páginas como listas de (precio, id)"""
+    paginas, cursor = [], ""
+    while cursor is not None:
+        response = cliente.get("/api/v1/propiedades/", params={**params, "cursor": cursor})
+        assert response.status_code == 200, response.text
+        paginas.append([(p["precio_hora"], p["id"]) for p in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+    return paginas
+
+def test_cursor_ida_y_vuelta():
+    obj_id = uuid4()
+    fecha = datetime(2030, 1, 2, 3, 4, 5)
+    cursor = encode_cursor("fecha_creacion", fecha, obj_id)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == ("fecha_creacion", fecha.isoformat(), obj_id)
+    assert decode_cursor(encode_cursor("precio_hora", 1000, obj_id)) == ("precio_hora", 1000, obj_id)
+
+@pytest.mark.parametrize("cursor", ["no-es-base64!", "e30", base64.urlsafe_b64encode(b'["id", 1, "x"]').decode()])
+def test_cursor_invalido(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+def test_paginas_con_claves_repetidas(cliente, propiedades):
+    # 9 filas en páginas de 3: la última página completa no debe dejar un cursor a una página vacía
+    paginas = recorrer(cliente, limit=3, order_by="precio_hora")
+    assert [len(p) for p in paginas] == [3, 3, 3]
+    assert sum(paginas, []) == sorted(propiedades)
+
+    paginas = recorrer(cliente, limit=2, order_by="-precio_hora")
+    assert [len(p) for p in paginas] == [2, 2, 2, 2, 1]
+    assert sum(paginas, []) == sorted(propiedades, reverse=True)
+
+    # Orden por id y con filtros: el cursor respeta el filtro
+    assert sum(recorrer(cliente, limit=4), []) == sorted(propiedades, key=lambda p: p[1])
+    filtradas = sum(recorrer(cliente, limit=2, order_by="precio_hora", precio_min=2000), [])
+    assert filtradas == sorted(p for p in propiedades if p[0] >= 2000)
+
+def test_cursor_manipulado(cliente, propiedades):
+    response = cliente.get("/api/v1/propiedades/", params={"limit": 3, "order_by": "precio_hora", "cursor": ""})
+    cursor = response.headers["X-Next-Cursor"]
+    campo, valor, obj_id = decode_cursor(cursor)
+
+    manipulados = [
+        cursor[:-2],                                                     # Truncado
+        "%%%",                                                           # No es base64
+        encode_cursor("capacidad", valor, obj_id),                       # Otro orden
+        encode_cursor(campo, "mil", obj_id),                             # Valor de otro tipo
+        base64.urlsafe_b64encode(json.dumps([campo, valor, "no-uuid"]).encode()).decode(),
+    ]
+    for manipulado in manipulados:
+        response = cliente.get("/api/v1/propiedades/", params={"limit": 3, "order_by": "precio_hora", "cursor": manipulado})
+        assert response.status_code == 400, (manipulado, response.text)
+
+    # Columna que admite nulos: no sirve como cursor
+    response = cliente.get("/api/v1/propiedades/", params={"order_by": "nombre", "cursor": ""})
+    assert response.status_code == 400
+
+@pytest.mark.parametrize("filtros, esperados", [
+    ({"precio_hora": 2000}, [2000, 2000]),
+    ({"precio_hora__gt": 2000}, [3000] * 4),
+    ({"precio_hora__gte": 2000}, [2000] * 2 + [3000] * 4),
+    ({"precio_hora__lt": 2000}, [1000] * 3),
+    ({"precio_hora__lte": 1000, "tipo": "casa"}, [1000, 1000]),
+    ({"capacidad__in": [0, 4, 8]}, [1000, 2000, 3000]),
+    ({"descripcion__contains": "Propiedad 1"}, [1000]),
+    ({"descripcion__contains": "%"}, []),  # Los comodines de LIKE se escapan
+])
+def test_operadores_de_filtro(base_datos, propiedades, filtros, esperados):
+    async def prueba(session_maker):
+        async with session_maker() as session:
+            return await PropiedadService.read_all(session, offset=0, limit=100, order_by="precio_hora", filtros=filtros, options=())
+    assert [p.precio_hora for p in base_datos.ejecutar(prueba)] == esperados
+
+@pytest.mark.parametrize("filtros", [{"no_existe": 1}, {"precio_hora__ne": 1}, {"descripcion__like": "%"}])
+def test_filtros_desconocidos(filtros):
+    with pytest.raises(ValueError):
+        PropiedadService.apply_filters(None, filtros)
+
+def test_orden_solo_por_campos_declarados(cliente, propiedades):
+    assert PropiedadService.resolve_order("-precio_hora")[::2] == ("precio_hora", True)
+    # Sin declaración solo se ordena por id
+    assert BaseService.sortable_fields == MediaService.sortable_fields == ("id",)
+    for servicio, campo in ((UsuarioService, "password"), (UsuarioService, "rut"), (RegionService, "id; DROP"), (MediaService, "sha256")):
+        with pytest.raises(ValueError):
+            servicio.resolve_order(campo)
+    response = cliente.get("/api/v1/propiedades/", params={"order_by": "descripcion"})
+    assert response.status_code == 400 and "Campos permitidos" in response.json()["detail"]
+    response = cliente.get("/api/v1/propiedades/", params={"precio_min": 2000, "order_by": "-capacidad"})
+    assert [p["capacidad"] for p in response.json()] == [8, 7, 6, 5, 4, 3]
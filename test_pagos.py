@@ -70,22 +70,28 @@ def test_base_datos():
     print("\n🗄️  Verificando base de datos...")
     
     try:
-        from app.db import get_session
-        from sqlmodel import Session
+        import asyncio
+        from app.db import async_session, engine
         
-        # Test de conexión básica
-        with next(get_session()) as session:
-            print("✅ Conexión a base de datos exitosa")
-            
-            # Verificar que las tablas existen
-            from models import Pago, Comision
-            from sqlmodel import text
-            
-            # Esto no debería generar error si las tablas fueron creadas
-            session.exec(text("SELECT COUNT(*) FROM pago")).first()
-            session.exec(text("SELECT COUNT(*) FROM comision")).first()
-            print("✅ Tablas de pagos y comisiones existen")
-            
+        async def verificar():
+            try:
+                # Test de conexión básica
+                async with async_session() as session:
+                    print("✅ Conexión a base de datos exitosa")
+                    
+                    # Verificar que las tablas existen
+                    from models import Pago, Comision
+                    from sqlmodel import text
+                    
+                    # Esto no debería generar error si las tablas fueron creadas
+                    (await session.exec(text("SELECT COUNT(*) FROM pago"))).first()
+                    (await session.exec(text("SELECT COUNT(*) FROM comision"))).first()
+                    print("✅ Tablas de pagos y comisiones existen")
+            finally:
+                # Cerrar las conexiones del pool antes de salir del event loop
+                await engine.dispose()
+        
+        asyncio.run(verificar())
         return True
         
     except Exception as e:
@@ -0,0 +1,171 @@
+"""
+Test de la disponibilidad de reservas y del calendario de ocupación
+Verifica que una reserva solapada o fuera del horario de atención se rechaza con 409, tanto al
+crearla como al editarla, que la consulta de solapamientos es una lectura con bloqueo y que el
+calendario marca las horas ocupadas y responde 304 si no cambió.
+Ejecutar con: python -m pytest test_reservas.py
+"""
+
+import base64
+import time as reloj
+from datetime import datetime, time
+
+import pytest
+from sqlalchemy.dialects import mysql
+
+from models import Comuna, Propiedad, Region
+from services.ReservaService import ReservaService
+
+@pytest.fixture
+def propiedad(base_datos):
+    """Propiedad abierta de 08:00 a 20:00; devuelve su id"""
+    async def poblar(session_maker):
+        async with session_maker() as session:
+            region = Region(nombre="Metropolitana")
+            comuna = Comuna(nombre="Santiago", region_id=region.id)
+            propiedad = Propiedad(
+                descripcion="Sala", direccion="Calle 123", tipo="sala", cod_postal="1", precio_hora=1000,
+                comuna_id=comuna.id, hora_apertura=time(8), hora_cierre=time(20)
+            )
+            session.add_all([region, comuna, propiedad])
+            await session.commit()
+            return str(propiedad.id)
+    return base_datos.ejecutar(poblar)
+
+@pytest.fixture
+def zona_horaria(monkeypatch):
+    """Hora local del servidor en Santiago (UTC-3 en enero)"""
+    monkeypatch.setenv("TZ", "America/Santiago")
+    reloj.tzset()
+    yield
+    monkeypatch.undo()
+    reloj.tzset()
+
+def reservar(cliente, autenticado, propiedad, inicio, fin, reserva_id=None, **extra):
+    datos = {"inicio": f"2030-01-01T{inicio}", "fin": f"2030-01-01T{fin}", "propiedad_id": propiedad, "cant_horas": 1, **extra}
+    if reserva_id:
+        return cliente.put(f"/api/v1/reservas/{reserva_id}", json=datos, headers=autenticado)
+    return cliente.post("/api/v1/reservas/", json=datos, headers=autenticado)
+
+def test_reserva_solapada(cliente, autenticado, propiedad):
+    assert reservar(cliente, autenticado, propiedad, "10:00", "12:00").status_code == 200
+    for inicio, fin in (("11:00", "13:00"), ("09:00", "10:30"), ("10:00", "12:00"), ("10:30", "11:00")):
+        response = reservar(cliente, autenticado, propiedad, inicio, fin)
+        assert response.status_code == 409 and "ya está reservado" in response.json()["detail"], (inicio, fin)
+    # Los extremos se pueden tocar
+    assert reservar(cliente, autenticado, propiedad, "12:00", "13:00").status_code == 200
+    assert reservar(cliente, autenticado, propiedad, "09:00", "10:00").status_code == 200
+
+def test_reserva_fuera_de_horario(cliente, autenticado, propiedad):
+    for inicio, fin in (("07:00", "09:00"), ("19:00", "21:00"), ("06:00", "07:00")):
+        response = reservar(cliente, autenticado, propiedad, inicio, fin)
+        assert response.status_code == 409 and "horario de atención" in response.json()["detail"], (inicio, fin)
+    assert reservar(cliente, autenticado, propiedad, "12:00", "11:00").status_code == 400
+    assert reservar(cliente, autenticado, propiedad, "08:00", "20:00").status_code == 200
+
+def test_editar_reserva(cliente, autenticado, propiedad):
+    primera = reservar(cliente, autenticado, propiedad, "10:00", "12:00").json()["id"]
+    segunda = reservar(cliente, autenticado, propiedad, "14:00", "16:00").json()["id"]
+    # Moverla sobre su propio horario no choca consigo misma
+    response = reservar(cliente, autenticado, propiedad, "11:00", "13:00", reserva_id=primera)
+    assert response.status_code == 200 and response.json()["fin"] == "2030-01-01T13:00:00"
+    # Moverla sobre otra reserva o fuera del horario se rechaza y no se guarda
+    assert reservar(cliente, autenticado, propiedad, "12:00", "15:00", reserva_id=primera).status_code == 409
+    assert reservar(cliente, autenticado, propiedad, "19:00", "21:00", reserva_id=primera).status_code == 409
+    assert cliente.get(f"/api/v1/reservas/{primera}", headers=autenticado).json()["inicio"] == "2030-01-01T11:00:00"
+    # Una reserva cancelada libera su horario
+    assert reservar(cliente, autenticado, propiedad, "14:00", "16:00", reserva_id=segunda, estado="cancelada").status_code == 200
+    assert reservar(cliente, autenticado, propiedad, "13:00", "15:00").status_code == 200
+
+def test_fechas_con_zona_horaria(cliente, autenticado, propiedad, zona_horaria):
+    # 13:00Z son las 10:00 en Santiago: dentro del horario, y se guarda en hora local
+    response = reservar(cliente, autenticado, propiedad, "13:00:00Z", "15:00:00Z")
+    assert response.status_code == 200, response.text
+    assert (response.json()["inicio"], response.json()["fin"]) == ("2030-01-01T10:00:00", "2030-01-01T12:00:00")
+    # Choca con la misma reserva expresada en hora local o con otro desfase
+    assert reservar(cliente, autenticado, propiedad, "11:00", "13:00").status_code == 409
+    assert reservar(cliente, autenticado, propiedad, "09:00:00-05:00", "10:00:00-05:00").status_code == 409
+    # 22:00Z son las 19:00 locales y 00:00Z del día siguiente las 21:00: fuera del horario
+    response = cliente.post("/api/v1/reservas/", headers=autenticado, json={
+        "inicio": "2030-01-01T22:00:00Z", "fin": "2030-01-02T00:00:00Z", "propiedad_id": propiedad, "cant_horas": 2
+    })
+    assert response.status_code == 409, response.text
+    # Al editarla también se convierte
+    reserva_id = reservar(cliente, autenticado, propiedad, "14:00", "15:00").json()["id"]
+    response = reservar(cliente, autenticado, propiedad, "18:00:00Z", "19:00:00Z", reserva_id=reserva_id)
+    assert response.status_code == 200 and response.json()["inicio"] == "2030-01-01T15:00:00"
+
+    response = cliente.get(f"/api/v1/propiedades/{propiedad}/disponibilidad", params={
+        "desde": "2030-01-01T11:00:00Z", "hasta": "2030-01-01T18:00:00-03:00"
+    })
+    assert response.status_code == 200, response.text
+    assert response.json() == [
+        {"inicio": "2030-01-01T08:00:00", "fin": "2030-01-01T10:00:00"},
+        {"inicio": "2030-01-01T12:00:00", "fin": "2030-01-01T15:00:00"},
+        {"inicio": "2030-01-01T16:00:00", "fin": "2030-01-01T18:00:00"},
+    ]
+
+def test_consulta_de_solapamientos_con_bloqueo(propiedad):
+    def sql(bloquear):
+        query = ReservaService.consulta_en_rango(propiedad, datetime(2030, 1, 1), datetime(2030, 1, 2), bloquear=bloquear)
+        return str(query.compile(dialect=mysql.dialect()))
+    assert sql(True).endswith("FOR UPDATE")
+    assert "FOR UPDATE" not in sql(False)
+
+def horas_ocupadas(calendario, propiedad):
+    """Índices de las horas marcadas en el mapa de bits (bit más significativo primero)"""
+    bitmap = base64.b64decode(calendario["ocupacion"][propiedad])
+    return [i for i in range(calendario["horas"]) if bitmap[i // 8] & (0x80 >> (i % 8))]
+
+def test_calendario_de_ocupacion(cliente, autenticado, base_datos, propiedad):
+    async def otra_propiedad(session_maker):
+        async with session_maker() as session:
+            otra = Propiedad(descripcion="Casa", direccion="Calle 456", tipo="casa", cod_postal="1", precio_hora=1000)
+            session.add(otra)
+            await session.commit()
+            return str(otra.id)
+    otra = base_datos.ejecutar(otra_propiedad)
+
+    reservar(cliente, autenticado, propiedad, "09:00", "12:00")
+    reservar(cliente, autenticado, propiedad, "13:30", "14:15")  # Horas parciales: se marcan completas
+    cancelada = reservar(cliente, autenticado, propiedad, "16:00", "17:00").json()["id"]
+    reservar(cliente, autenticado, propiedad, "16:00", "17:00", reserva_id=cancelada, estado="cancelada")
+    reservar(cliente, autenticado, otra, "19:00", "23:00")
+
+    # desde se trunca a las 10:00; la reserva de las 09:00 se recorta al inicio del rango
+    params = {"ids": [propiedad, otra], "desde": "2030-01-01T10:20:00", "hasta": "2030-01-01T21:30:00"}
+    response = cliente.get("/api/v1/propiedades/calendario", params=params)
+    assert response.status_code == 200, response.text
+    calendario = response.json()
+    assert calendario["desde"] == "2030-01-01T10:00:00" and calendario["horas"] == 12
+    assert horas_ocupadas(calendario, propiedad) == [0, 1, 3, 4]
+    assert horas_ocupadas(calendario, otra) == [9, 10, 11]
+    assert len(base64.b64decode(calendario["ocupacion"][otra])) == 2
+
+    # Mismo calendario: 304 sin cuerpo con el mismo ETag
+    etag = response.headers["ETag"]
+    response = cliente.get("/api/v1/propiedades/calendario", params=params, headers={"If-None-Match": etag})
+    assert response.status_code == 304 and response.content == b"" and response.headers["ETag"] == etag
+    # Una reserva nueva cambia el ETag
+    reservar(cliente, autenticado, propiedad, "18:00", "19:00")
+    response = cliente.get("/api/v1/propiedades/calendario", params=params, headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["ETag"] != etag
+    assert horas_ocupadas(response.json(), propiedad) == [0, 1, 3, 4, 8]
+
+    params["hasta"] = "2030-03-01T00:00:00"
+    assert cliente.get("/api/v1/propiedades/calendario", params=params).status_code == 400
+
+def test_calendario_con_zona_horaria(cliente, autenticado, propiedad, zona_horaria):
+    reservar(cliente, autenticado, propiedad, "10:00", "12:00")
+    # desde con zona y hasta sin ella: ambos en hora local (13:00Z son las 10:00)
+    response = cliente.get("/api/v1/propiedades/calendario", params={
+        "ids": [propiedad], "desde": "2030-01-01T12:00:00Z", "hasta": "2030-01-01T14:00:00"
+    })
+    assert response.status_code == 200, response.text
+    calendario = response.json()
+    assert calendario["desde"] == "2030-01-01T09:00:00" and calendario["horas"] == 5
+    assert horas_ocupadas(calendario, propiedad) == [1, 2]
+    response = cliente.get("/api/v1/propiedades/calendario", params={
+        "ids": [propiedad], "desde": "2030-01-01T10:00:00", "hasta": "2030-01-01T12:00:00Z"
+    })
+    assert response.status_code == 400
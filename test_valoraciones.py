@@ -0,0 +1,61 @@
+"""
+Test de los agregados de valoraciones de las propiedades (rating_avg, rating_sum, rating_count)
+Verifica que los ajustes incrementales al crear, editar y eliminar valoraciones coinciden
+con un recálculo completo desde la tabla de valoraciones.
+Ejecutar con: python -m pytest test_valoraciones.py
+"""
+
+import pytest
+from sqlmodel import select
+
+from models import Comuna, Propiedad, Region, Valoracion, ValoracionBase
+from services.PropiedadService import PropiedadService
+from services.ValoracionService import ValoracionService
+
+async def agregados(session) -> dict:
+    filas = (await session.exec(
+        select(Propiedad.id, Propiedad.rating_avg, Propiedad.rating_sum, Propiedad.rating_count)
+    )).all()
+    return {id: (pytest.approx(avg), suma, cantidad) for id, avg, suma, cantidad in filas}
+
+async def verificar(session, esperados: dict):
+    """Compara los agregados incrementales con los esperados y con un recálculo completo"""
+    incrementales = await agregados(session)
+    assert incrementales == {id: (pytest.approx(avg), suma, cantidad) for id, (avg, suma, cantidad) in esperados.items()}
+    await PropiedadService.recalcular_ratings(session)
+    assert await agregados(session) == incrementales
+
+def test_agregados_coinciden_con_recalculo(base_datos):
+    async def prueba(session_maker):
+        async with session_maker() as session:
+            region = Region(nombre="Metropolitana")
+            comuna = Comuna(nombre="Santiago", region_id=region.id)
+            sala, casa = (
+                Propiedad(descripcion=tipo, direccion="Calle 123", tipo=tipo, cod_postal="1", precio_hora=1000, comuna_id=comuna.id)
+                for tipo in ("sala", "casa")
+            )
+            session.add_all([region, comuna, sala, casa])
+            await session.commit()
+
+        async with session_maker() as session:
+            valoraciones = [
+                await ValoracionService.create(session, ValoracionBase(puntaje=puntaje, propiedad_id=sala.id))
+                for puntaje in (5, 4, 2)
+            ]
+            await verificar(session, {sala.id: (11 / 3, 11, 3), casa.id: (0, 0, 0)})
+
+            # Cambio de puntaje
+            await ValoracionService.update(session, Valoracion(id=valoraciones[2].id, puntaje=5))
+            await verificar(session, {sala.id: (14 / 3, 14, 3), casa.id: (0, 0, 0)})
+
+            # Cambio de propiedad y de puntaje a la vez
+            await ValoracionService.update(session, Valoracion(id=valoraciones[1].id, puntaje=3, propiedad_id=casa.id))
+            await verificar(session, {sala.id: (5, 10, 2), casa.id: (3, 3, 1)})
+
+            # Eliminar hasta dejar una propiedad sin valoraciones
+            await ValoracionService.delete(session, valoraciones[1].id)
+            await verificar(session, {sala.id: (5, 10, 2), casa.id: (0, 0, 0)})
+            for valoracion in (valoraciones[0], valoraciones[2]):
+                await ValoracionService.delete(session, valoracion.id)
+            await verificar(session, {sala.id: (0, 0, 0), casa.id: (0, 0, 0)})
+    base_datos.ejecutar(prueba)
@@ -1,35 +1,46 @@
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
-from app.db import SessionDep
+from app.db import AsyncSessionDep
 from models import UsuarioRead
 from models.UsuarioModel import Token, UsuarioBase, RefreshTokenRequest
-from app.Auth import create_access_token, create_refresh_token, verify_password, get_current_user, decode_refresh_token
+from app.Auth import create_access_token, create_refresh_token, verify_and_update_password, get_current_user, decode_refresh_token, decode_token, oauth2_scheme, Principal
 from datetime import timedelta
+from typing import Annotated, Optional
 from services.UsuarioService import UsuarioService
+from services.TokenBlacklistService import TokenBlacklistService
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 @router.post("/register", response_model=UsuarioRead)
 async def register(
-    session: SessionDep,
+    session: AsyncSessionDep,
     user: UsuarioBase
 ):
-    existing_user = UsuarioService.get_by_email(session, user.email)
+    existing_user = await UsuarioService.get_by_email(session, user.email)
     if existing_user:
         raise HTTPException(status_code=400, detail="Email ya registrado")
-    return UsuarioService.create(session, user)
+    return await UsuarioService.create(session, user)
 
 @router.post("/login", response_model=Token)
 async def login(
-    session: SessionDep,
+    session: AsyncSessionDep,
     form_data: OAuth2PasswordRequestForm = Depends()
 ):
-    user = UsuarioService.get_by_email(session, form_data.username)
-    if not user or not verify_password(form_data.password, user.password):
+    user = await UsuarioService.get_by_email(session, form_data.username)
+    if not user:
+        raise HTTPException(status_code=401, detail="Credenciales inválidas")
+    valid, new_hash = await verify_and_update_password(form_data.password, user.password)
+    if not valid:
         raise HTTPException(status_code=401, detail="Credenciales inválidas")
     
+    # Rehash transparente si cambió el costo configurado de bcrypt
+    if new_hash:
+        user.password = new_hash
+        session.add(user)
+        await session.commit()
+    
     # Validar que el usuario no esté bloqueado
-    if not UsuarioService.isActive(session, user.id):
+    if not await UsuarioService.isActive(session, user.id):
         raise HTTPException(
             status_code=403, 
             detail="Usuario bloqueado. Contacte al administrador para más información."
@@ -42,13 +53,14 @@ async def login(
 
 @router.get("/me", response_model=UsuarioRead)
 async def read_current_user(
-    current_user: UsuarioRead = Depends(get_current_user)
+    session: AsyncSessionDep,
+    current_user: Principal = Depends(get_current_user)
 ):
-    return current_user
+    return await UsuarioService.read(session, current_user.id)
 
 @router.post("/refresh", response_model=Token)
 async def refresh_token(
-    session: SessionDep,
+    session: AsyncSessionDep,
     refresh_request: RefreshTokenRequest
 ):
     """
@@ -64,7 +76,7 @@ async def refresh_token(
         )
     
     # Verificar que el usuario aún existe
-    user = UsuarioService.get_by_email(session, email)
+    user = await UsuarioService.get_by_email(session, email)
     if not user:
         raise HTTPException(
             status_code=401,
@@ -72,12 +84,19 @@ async def refresh_token(
         )
     
     # Validar que el usuario no esté bloqueado
-    if not UsuarioService.isActive(session, user.id):
+    if not await UsuarioService.isActive(session, user.id):
         raise HTTPException(
             status_code=403,
             detail="Usuario bloqueado. Contacte al administrador para más información."
         )
     
+    # Rotación: el refresh token usado queda revocado; si ya lo estaba, se rechaza
+    if payload.get("jti") and not await TokenBlacklistService.revocar(session, payload):
+        raise HTTPException(
+            status_code=401,
+            detail="Refresh token revocado"
+        )
+    
     # Crear nuevos tokens
     new_access_token = create_access_token(data={"sub": user.email})
     new_refresh_token = create_refresh_token(data={"sub": user.email})
@@ -89,23 +108,35 @@ async def refresh_token(
     )
 
 @router.post("/logout")
-async def logout():
+async def logout(
+    session: AsyncSessionDep,
+    token: Annotated[str, Depends(oauth2_scheme)],
+    refresh_request: Optional[RefreshTokenRequest] = None
+):
     """
-    Endpoint para logout (en el frontend se debe eliminar los tokens del almacenamiento)
+    Endpoint para logout: revoca el access token y, si se envía, el refresh token
+    (en el frontend se deben eliminar igualmente los tokens del almacenamiento)
     """
+    payload = decode_token(token)
+    await TokenBlacklistService.revocar(session, payload)
+    if refresh_request:
+        refresh_payload = decode_refresh_token(refresh_request.refresh_token)
+        if refresh_payload.get("sub") != payload.get("sub"):
+            raise HTTPException(status_code=400, detail="El refresh token no corresponde al usuario")
+        await TokenBlacklistService.revocar(session, refresh_payload)
     return {"message": "Logout exitoso"}
 
 @router.get("/status")
 async def get_user_status(
-    session: SessionDep,
-    current_user: UsuarioRead = Depends(get_current_user)
+    session: AsyncSessionDep,
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     Endpoint para obtener el estado de bloqueo del usuario actual.
     Solo accessible si el usuario está activo (no bloqueado).
     """
-    is_active = UsuarioService.isActive(session, current_user.id)
-    active_block = UsuarioService.get_active_block(session, current_user.id)
+    is_active = await UsuarioService.isActive(session, current_user.id)
+    active_block = await UsuarioService.get_active_block(session, current_user.id)
     
     response = {
         "user_id": current_user.id,
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from fastapi.responses import JSONResponse
 from app.Auth import get_current_user
-from app.db import SessionDep
+from app.db import AsyncSessionDep
 from models import BoletaBase, Boleta
 from services.BoletaService import BoletaService
 from typing import Annotated, Optional, List
@@ -12,22 +12,24 @@ router = APIRouter(prefix="/api/v1/boletas", tags=["Boletas"], dependencies=[Dep
 ## Obtener todas las boletas
 @router.get("/", response_model=List[Boleta])
 async def get_boletas(
-    session: SessionDep,
+    session: AsyncSessionDep,
     offset: int = 0,
     limit: Annotated[int, Query(le=100)] = 50,
     order_by: Optional[str] = None,
 ):
     try:
-        boletas = BoletaService.read_all(session, offset=offset, limit=limit, order_by=order_by)
+        boletas = await BoletaService.read_all(session, offset=offset, limit=limit, order_by=order_by)
         return boletas
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 ## Obtener una boleta por ID
 @router.get("/{boleta_id}", response_model=Boleta)
-async def get_boleta(boleta_id: UUID, session: SessionDep):
+async def get_boleta(boleta_id: UUID, session: AsyncSessionDep):
     try:
-        boleta = BoletaService.read(session, obj_id=boleta_id)
+        boleta = await BoletaService.read(session, obj_id=boleta_id)
         if not boleta:
             raise HTTPException(status_code=404, detail="Boleta no encontrada")
         return boleta
@@ -36,33 +38,33 @@ async def get_boleta(boleta_id: UUID, session: SessionDep):
 
 ## Crear una boleta
 @router.post("/", response_model=Boleta)
-async def create_boleta(session: SessionDep, obj: BoletaBase):
+async def create_boleta(session: AsyncSessionDep, obj: BoletaBase):
     try:
-        boleta = BoletaService.create(session, obj=obj)
+        boleta = await BoletaService.create(session, obj=obj)
         return boleta
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 ## Actualizar una boleta
 @router.put("/{boleta_id}", response_model=Boleta)
-async def update_boleta(boleta_id: UUID, session: SessionDep, obj: BoletaBase):
+async def update_boleta(boleta_id: UUID, session: AsyncSessionDep, obj: BoletaBase):
     try:
-        boleta = BoletaService.read(session, obj_id=boleta_id)
+        boleta = await BoletaService.read(session, obj_id=boleta_id)
         if not boleta:
             raise HTTPException(status_code=404, detail="Boleta no encontrada")
-        boleta = BoletaService.update(session, obj=obj)
+        boleta = await BoletaService.update(session, obj=obj)
         return boleta
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 ## Eliminar una boleta
 @router.delete("/{boleta_id}", response_model=dict)
-async def delete_boleta(boleta_id: UUID, session: SessionDep):
+async def delete_boleta(boleta_id: UUID, session: AsyncSessionDep):
     try:
-        boleta = BoletaService.read(session, obj_id=boleta_id)
+        boleta = await BoletaService.read(session, obj_id=boleta_id)
         if not boleta:
             raise HTTPException(status_code=404, detail="Boleta no encontrada")
-        BoletaService.delete(session, obj_id=boleta_id)
+        await BoletaService.delete(session, obj_id=boleta_id)
         return {"ok": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
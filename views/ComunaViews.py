@@ -1,6 +1,6 @@
 from fastapi import APIRouter, HTTPException, Query, status, Depends
 from fastapi.responses import JSONResponse
-from app.db import SessionDep
+from app.db import AsyncSessionDep
 from models import ComunaBase, Comuna
 from services.ComunaService import ComunaService
 from typing import Annotated, Optional
@@ -12,7 +12,7 @@ router = APIRouter(prefix="/api/v1/comunas", tags=["Comunas"])
 ## Obtener todas las comunas
 @router.get("/", response_model=list[Comuna])
 async def get_comunas(
-    session: SessionDep,
+    session: AsyncSessionDep,
     offset: int = 0,
     limit: Annotated[int, Query(le=100)] = 50,
     order_by: Optional[str] = None,
@@ -24,16 +24,18 @@ async def get_comunas(
         if region_id:
             filtros["region_id"] = region_id
         ##########################################
-        comunas = ComunaService.read_all(session, offset=offset, limit=limit, order_by=order_by, filtros=filtros)
+        comunas = await ComunaService.read_all(session, offset=offset, limit=limit, order_by=order_by, filtros=filtros)
         return comunas
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 ## Obtener una comuna por ID
 @router.get("/{comuna_id}", response_model=Comuna)
-async def get_comuna(comuna_id: UUID, session: SessionDep):
+async def get_comuna(comuna_id: UUID, session: AsyncSessionDep):
     try:
-        comuna = ComunaService.read(session, obj_id=comuna_id)
+        comuna = await ComunaService.read(session, obj_id=comuna_id)
         if not comuna:
             raise HTTPException(status_code=404, detail="Comuna no encontrada")
         return comuna
@@ -42,18 +44,18 @@ async def get_comuna(comuna_id: UUID, session: SessionDep):
     
 ## Crear una nueva comuna
 @router.post("/", response_model=Comuna, status_code=status.HTTP_201_CREATED, dependencies=[Depends(get_current_user)])
-async def create_comuna(comuna: ComunaBase, session: SessionDep):
+async def create_comuna(comuna: ComunaBase, session: AsyncSessionDep):
     try:
-        new_comuna = ComunaService.create(session, obj=comuna)
+        new_comuna = await ComunaService.create(session, obj=comuna)
         return new_comuna
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 ## Actualizar una comuna existente
 @router.put("/{comuna_id}", response_model=Comuna, dependencies=[Depends(get_current_user)])
-async def update_comuna(comuna_id: UUID, comuna_data: ComunaBase, session: SessionDep):
+async def update_comuna(comuna_id: UUID, comuna_data: ComunaBase, session: AsyncSessionDep):
     try:
-        comuna = ComunaService.read(session, obj_id=comuna_id)
+        comuna = await ComunaService.read(session, obj_id=comuna_id)
         if not comuna:
             raise HTTPException(status_code=404, detail="Comuna no encontrada")
 
@@ -61,20 +63,20 @@ async def update_comuna(comuna_id: UUID, comuna_data: ComunaBase, session: Sessi
         for key, value in comuna_data.model_dump(exclude_unset=True).items():
             setattr(comuna, key, value)
 
-        updated_comuna = ComunaService.update(session, obj=comuna)
+        updated_comuna = await ComunaService.update(session, obj=comuna)
         return updated_comuna
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 ## Eliminar una comuna
 @router.delete("/{comuna_id}", dependencies=[Depends(get_current_user)])
-async def delete_comuna(comuna_id: UUID, session: SessionDep):
+async def delete_comuna(comuna_id: UUID, session: AsyncSessionDep):
     try:
-        comuna = ComunaService.read(session, obj_id=comuna_id)
+        comuna = await ComunaService.read(session, obj_id=comuna_id)
         if not comuna:
             raise HTTPException(status_code=404, detail="Comuna no encontrada")
 
-        ComunaService.delete(session, obj_id=comuna_id)
+        await ComunaService.delete(session, obj_id=comuna_id)
         return JSONResponse(status_code=status.HTTP_204_NO_CONTENT, content={"message": "Comuna eliminada exitosamente"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends, HTTPException
+from typing import Dict, Any
+from app.Auth import get_current_user
+from controllers.Media import ArchivoDemasiadoGrande, preparar_subida_directa
+from controllers.Storage import SubidaDirectaNoDisponible
+from models.MediaModel import SubidaDirectaRequest
+
+router = APIRouter(prefix="/api/v1/media", tags=["Media"])
+
+## URL firmada para subir un archivo directo al almacenamiento
+@router.post("/subidas", dependencies=[Depends(get_current_user)])
+async def crear_subida(obj: SubidaDirectaRequest) -> Dict[str, Any]:
+    """
+    Devuelve la clave por contenido del archivo y una URL firmada (PUT) para subirlo sin pasar
+    por la API. Después se asigna a la propiedad con POST /api/v1/propiedades/{id}/media.
+    """
+    try:
+        return await preparar_subida_directa(obj.coleccion, obj.sha256, obj.tamano, obj.content_type, obj.extension)
+    except ArchivoDemasiadoGrande as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SubidaDirectaNoDisponible as e:
+        raise HTTPException(status_code=501, detail=str(e))
@@ -0,0 +1,21 @@
+from fastapi import APIRouter, Depends, HTTPException
+from typing import Dict, Any
+from app.Auth import get_current_user, Principal
+from app.db import get_pool_status
+
+router = APIRouter(prefix="/api/v1/monitoreo", tags=["Monitoreo"])
+
+## Estado del pool de conexiones a la base de datos
+@router.get("/db-pool")
+async def estado_pool(
+    current_user: Principal = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """
+    Devuelve conexiones en uso, overflow y tiempos de espera del pool (solo para administradores)
+    """
+    if current_user.tipo.value != "admin":
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+    return {
+        "success": True,
+        "data": get_pool_status()
+    }
@@ -1,47 +1,52 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
-from typing import Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from typing import Annotated, Dict, Any, Optional
 from uuid import UUID
-import os
+from datetime import datetime
+import json
 
-from app.db import SessionDep
-from app.Auth import get_current_user
-from models import Usuario
+from app.db import AsyncSessionDep, async_session
+from app.Auth import get_current_user, Principal
+from models.types import ComisionStatus, PagoStatus
 from services.PagoService import MercadoPagoService
+from services.WebhookService import WebhookService
+from controllers.MercadoPago import PasarelaNoDisponible, get_mp_client
 from services.ComisionService import ComisionService
-from schemas.PagoSchemas import ApiResponse, PreferenciaPagoResponse
+from services.ExportacionService import FORMATOS, ExportacionService
+from services.SaldoService import SaldoService
+from schemas.PagoSchemas import ApiResponse, LoteComisionesRequest, PreferenciaPagoResponse
 
 router = APIRouter(prefix="/pagos", tags=["Pagos"])
 
-# Configurar MercadoPago (obtener del .env)
-MP_ACCESS_TOKEN = os.getenv("MERCADOPAGO_ACCESS_TOKEN", "")
-
 def get_mp_service():
-    """Factory function para obtener el servicio de MercadoPago"""
-    if not MP_ACCESS_TOKEN:
-        raise HTTPException(
-            status_code=500, 
-            detail="MercadoPago no está configurado. Verificar MERCADOPAGO_ACCESS_TOKEN en .env"
-        )
-    return MercadoPagoService(MP_ACCESS_TOKEN)
+    """Factory function para obtener el servicio de MercadoPago (usa el cliente HTTP compartido)"""
+    try:
+        return MercadoPagoService(get_mp_client())
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/crear-preferencia/{reserva_id}")
 async def crear_preferencia_pago(
     reserva_id: UUID,
-    session: SessionDep,
-    current_user: Usuario = Depends(get_current_user)
+    session: AsyncSessionDep,
+    current_user: Principal = Depends(get_current_user)
 ) -> Dict[str, Any]:
     """
     Crea una preferencia de pago en MercadoPago para una reserva
     """
     try:
         mp_service = get_mp_service()
-        resultado = mp_service.crear_preferencia_pago(reserva_id, session)
+        resultado = await mp_service.crear_preferencia_pago(reserva_id, session)
         return {
             "success": True,
             "data": resultado,
             "message": "Preferencia de pago creada exitosamente"
         }
+    except HTTPException:
+        raise
+    except PasarelaNoDisponible as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -49,10 +54,11 @@ async def crear_preferencia_pago(
 @router.post("/webhook")
 async def webhook_mercadopago(
     request: Request,
-    session: SessionDep,
+    session: AsyncSessionDep,
 ):
     """
-    Webhook para recibir notificaciones de MercadoPago
+    Webhook para recibir notificaciones de MercadoPago.
+    Solo registra la notificación en la cola; los workers de WebhookService la procesan.
     """
     try:
         # Obtener los datos del webhook
@@ -63,8 +69,7 @@ async def webhook_mercadopago(
             payment_id = body.get("data", {}).get("id")
             
             if payment_id:
-                mp_service = get_mp_service()
-                mp_service.procesar_webhook(str(payment_id), session)
+                await WebhookService.registrar(session, str(payment_id), body)
                 return {"status": "ok"}
         
         return {"status": "ignored"}
@@ -76,33 +81,98 @@ async def webhook_mercadopago(
 @router.get("/estado/{pago_id}")
 async def obtener_estado_pago(
     pago_id: UUID,
-    session: SessionDep,
-    current_user: Usuario = Depends(get_current_user)
+    session: AsyncSessionDep,
+    current_user: Principal = Depends(get_current_user)
 ) -> Dict[str, Any]:
     """
     Obtiene el estado actual de un pago
     """
     try:
         mp_service = get_mp_service()
-        resultado = mp_service.obtener_estado_pago(pago_id, session)
+        resultado = await mp_service.obtener_estado_pago(pago_id, session)
         return {
             "success": True,
             "data": resultado
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=404, detail=str(e))
 
 
+@router.get("/estado/{pago_id}/eventos")
+async def eventos_estado_pago(
+    pago_id: UUID,
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Server-Sent Events con el estado del pago: envía el estado actual y cada cambio
+    (event: estado) hasta que el pago llega a un estado final. Reemplaza el polling de /estado.
+    """
+    eventos = MercadoPagoService.seguir_estado(pago_id)
+    try:
+        primero = await anext(eventos)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    async def stream():
+        mensaje = primero
+        try:
+            while True:
+                if mensaje is None:
+                    yield ": ping\n\n"
+                else:
+                    yield f"event: estado\ndata: {json.dumps(mensaje)}\n\n"
+                mensaje = await anext(eventos)
+        except StopAsyncIteration:
+            pass
+        finally:
+            await eventos.aclose()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/estado/{pago_id}/ws")
+async def ws_estado_pago(
+    websocket: WebSocket,
+    pago_id: UUID,
+    token: str = Query(...)
+):
+    """
+    WebSocket con el estado del pago ({"tipo": "estado", ...}); el navegador no puede enviar
+    la cabecera Authorization, por lo que el token va en la query. Se cierra en un estado final.
+    """
+    async with async_session() as session:
+        try:
+            await get_current_user(session=session, token=token)
+        except HTTPException:
+            await websocket.close(code=1008)
+            return
+    await websocket.accept()
+    try:
+        async for mensaje in MercadoPagoService.seguir_estado(pago_id):
+            await websocket.send_json({"tipo": "ping"} if mensaje is None else {"tipo": "estado", **mensaje})
+        await websocket.close()
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+    except WebSocketDisconnect:
+        pass
+
+
 @router.get("/comisiones/mis-pagos")
 async def obtener_mis_comisiones(
-    session: SessionDep,
-    current_user: Usuario = Depends(get_current_user)
+    session: AsyncSessionDep,
+    current_user: Principal = Depends(get_current_user)
 ) -> Dict[str, Any]:
     """
     Obtiene las comisiones (pagos pendientes) del propietario actual
     """
     try:
-        comisiones = ComisionService.obtener_comisiones_propietario(
+        comisiones = await ComisionService.obtener_comisiones_propietario(
             current_user.id, session
         )
         
@@ -117,10 +187,29 @@ async def obtener_mis_comisiones(
                 "descripcion": comision.descripcion
             })
         
+        saldo = await SaldoService.obtener_saldo(current_user.id, session)
         return {
             "success": True,
             "data": resultado,
-            "total_pendiente": sum(c.monto for c in comisiones if c.estado.value == "pendiente")
+            "total_pendiente": saldo["pendiente"]
+        }
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/comisiones/mi-saldo")
+async def obtener_mi_saldo(
+    session: AsyncSessionDep,
+    current_user: Principal = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """
+    Obtiene el saldo del propietario actual: monto de sus comisiones pendientes, procesadas y completadas
+    """
+    try:
+        saldo = await SaldoService.obtener_saldo(current_user.id, session)
+        return {
+            "success": True,
+            "data": saldo
         }
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -128,18 +217,19 @@ async def obtener_mis_comisiones(
 
 @router.get("/admin/comisiones-a-pagar")
 async def obtener_comisiones_a_pagar(
-    session: SessionDep,
-    current_user: Usuario = Depends(get_current_user)
+    session: AsyncSessionDep,
+    current_user: Principal = Depends(get_current_user)
 ) -> Dict[str, Any]:
     """
-    Obtiene todas las comisiones que están listas para ser pagadas (solo para administradores)
+    Obtiene el total a pagar por propietario de las comisiones procesadas (solo para administradores).
+    El detalle de cada propietario está en /admin/comisiones-a-pagar/{propietario_id}
     """
     # Verificar que el usuario sea administrador
     if current_user.tipo.value != "admin":
         raise HTTPException(status_code=403, detail="Acceso denegado")
     
     try:
-        comisiones = ComisionService.obtener_comisiones_a_pagar(session)
+        comisiones = await ComisionService.obtener_comisiones_a_pagar(session)
         return {
             "success": True,
             "data": comisiones
@@ -148,11 +238,69 @@ async def obtener_comisiones_a_pagar(
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.get("/admin/comisiones-a-pagar/{propietario_id}")
+async def obtener_detalle_a_pagar(
+    propietario_id: UUID,
+    session: AsyncSessionDep,
+    response: Response,
+    limit: Annotated[int, Query(le=500)] = 100,
+    cursor: Optional[str] = Query(None, description="Paginación por cursor: vacío para la primera página, luego el valor de X-Next-Cursor"),
+    current_user: Principal = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """
+    Comisiones procesadas de un propietario, paginadas por cursor (solo para administradores)
+    """
+    # Verificar que el usuario sea administrador
+    if current_user.tipo.value != "admin":
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+    
+    try:
+        comisiones, next_cursor = await ComisionService.obtener_detalle_a_pagar(
+            propietario_id, session, limit=limit, cursor=cursor
+        )
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return {
+            "success": True,
+            "data": comisiones
+        }
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/admin/comisiones/resumen")
+async def obtener_resumen_comisiones(
+    session: AsyncSessionDep,
+    fecha_inicio: datetime,
+    fecha_fin: datetime,
+    agrupar: Optional[str] = Query(default=None, description="dia, semana o mes"),
+    current_user: Principal = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """
+    Resumen de comisiones por estado en un período, opcionalmente desglosado por día, semana o mes
+    (solo para administradores)
+    """
+    # Verificar que el usuario sea administrador
+    if current_user.tipo.value != "admin":
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+    
+    try:
+        resumen = await ComisionService.obtener_resumen_comisiones_periodo(
+            fecha_inicio, fecha_fin, session, agrupar
+        )
+        return {
+            "success": True,
+            "data": resumen
+        }
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.put("/admin/procesar-comision/{comision_id}")
 async def procesar_comision(
     comision_id: UUID,
-    session: SessionDep,
-    current_user: Usuario = Depends(get_current_user)
+    session: AsyncSessionDep,
+    current_user: Principal = Depends(get_current_user)
 ) -> Dict[str, Any]:
     """
     Marca una comisión como procesada (solo para administradores)
@@ -162,7 +310,7 @@ async def procesar_comision(
         raise HTTPException(status_code=403, detail="Acceso denegado")
     
     try:
-        ComisionService.procesar_comision(comision_id, session)
+        await ComisionService.procesar_comision(comision_id, session)
         return {
             "success": True,
             "message": "Comisión procesada exitosamente"
@@ -174,8 +322,8 @@ async def procesar_comision(
 @router.put("/admin/completar-comision/{comision_id}")
 async def completar_comision(
     comision_id: UUID,
-    session: SessionDep,
-    current_user: Usuario = Depends(get_current_user)
+    session: AsyncSessionDep,
+    current_user: Principal = Depends(get_current_user)
 ) -> Dict[str, Any]:
     """
     Marca una comisión como completada (solo para administradores)
@@ -185,10 +333,104 @@ async def completar_comision(
         raise HTTPException(status_code=403, detail="Acceso denegado")
     
     try:
-        ComisionService.completar_comision(comision_id, session)
+        await ComisionService.completar_comision(comision_id, session)
         return {
             "success": True,
             "message": "Comisión completada exitosamente"
         }
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.put("/admin/procesar-comisiones")
+async def procesar_comisiones(
+    lote: LoteComisionesRequest,
+    session: AsyncSessionDep,
+    current_user: Principal = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """
+    Marca como procesadas las comisiones pendientes indicadas, o todas las de un propietario
+    (solo para administradores). Informa las que no estaban pendientes.
+    """
+    # Verificar que el usuario sea administrador
+    if current_user.tipo.value != "admin":
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+    
+    try:
+        resultado = await ComisionService.transicionar_comisiones(
+            session, ComisionStatus.pendiente, ComisionStatus.procesada,
+            comision_ids=lote.comision_ids, propietario_id=lote.propietario_id
+        )
+        return {
+            "success": True,
+            "data": resultado
+        }
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.put("/admin/completar-comisiones")
+async def completar_comisiones(
+    lote: LoteComisionesRequest,
+    session: AsyncSessionDep,
+    current_user: Principal = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """
+    Marca como completadas las comisiones procesadas indicadas, o todas las de un propietario
+    (solo para administradores). Informa las que no estaban procesadas.
+    """
+    # Verificar que el usuario sea administrador
+    if current_user.tipo.value != "admin":
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+    
+    try:
+        resultado = await ComisionService.transicionar_comisiones(
+            session, ComisionStatus.procesada, ComisionStatus.completada,
+            comision_ids=lote.comision_ids, propietario_id=lote.propietario_id
+        )
+        return {
+            "success": True,
+            "data": resultado
+        }
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/admin/exportar/{recurso}")
+async def exportar(
+    recurso: str,
+    formato: str = Query(default="csv", description="csv o ndjson"),
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    estado: Optional[str] = None,
+    propietario_id: Optional[UUID] = None,
+    current_user: Principal = Depends(get_current_user)
+) -> StreamingResponse:
+    """
+    Exporta pagos o comisiones (recurso "pagos" o "comisiones") para contabilidad, filtrando por
+    fecha de creación, estado y propietario (solo para administradores).
+    La respuesta se envía por bloques mientras se recorren los resultados.
+    """
+    # Verificar que el usuario sea administrador
+    if current_user.tipo.value != "admin":
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+    
+    try:
+        if recurso == "pagos":
+            query = ExportacionService.consulta_pagos(desde, hasta, PagoStatus(estado) if estado else None, propietario_id)
+        elif recurso == "comisiones":
+            query = ExportacionService.consulta_comisiones(desde, hasta, ComisionStatus(estado) if estado else None, propietario_id)
+        else:
+            raise HTTPException(status_code=404, detail="Solo se pueden exportar pagos o comisiones")
+        contenido = ExportacionService.exportar(query, formato)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    archivo = f"{recurso}_{datetime.now():%Y%m%d_%H%M%S}.{formato}"
+    return StreamingResponse(
+        contenido,
+        media_type=FORMATOS[formato],
+        headers={"Content-Disposition": f'attachment; filename="{archivo}"'}
+    )
@@ -1,12 +1,18 @@
-from fastapi import APIRouter, HTTPException, Query, status, UploadFile, File, Depends, Form
-from datetime import time
-from app.db import SessionDep
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status, UploadFile, File, Depends, Form
+from fastapi.encoders import jsonable_encoder
+from datetime import time, datetime
+from app.db import AsyncSessionDep
 from models import PropiedadBase, Propiedad, PropiedadRead
 from services.PropiedadService import PropiedadService
+from services.ReservaService import ReservaService
 from services.manyToManyServices import UsuarioPropiedadService
 from typing import Annotated, Optional, List
 from uuid import UUID
+import hashlib
+import json
 from models.manyToMany import UsuarioPropiedad
+from models.MediaModel import AsignarSubidasRequest
+from controllers.Media import ArchivoDemasiadoGrande
 from app.Auth import get_current_user
 
 router = APIRouter(prefix="/api/v1/propiedades", tags=["Propiedades"])
@@ -14,18 +20,27 @@ router = APIRouter(prefix="/api/v1/propiedades", tags=["Propiedades"])
 ## Obtener todas las propiedades
 @router.get("/", response_model=List[PropiedadRead])
 async def get_propiedades(
-    session: SessionDep,
+    session: AsyncSessionDep,
+    response: Response,
     offset: int = 0,
     limit: Annotated[int, Query(le=100)] = 50,
     order_by: Optional[str] = None,
     tipo: Optional[str] = Query(None, description="Filtrar por tipo de propiedad"),
     comuna_id: Optional[UUID] = Query(None, description="Filtrar por comuna"),
     precio_min: Optional[int] = Query(None, description="Precio mínimo por hora"),
-    precio_max: Optional[int] = Query(None, description="Precio máximo por hora")
+    precio_max: Optional[int] = Query(None, description="Precio máximo por hora"),
+    capacidad_min: Optional[int] = Query(None, description="Capacidad mínima"),
+    activo: Optional[bool] = Query(None, description="Filtrar por propiedades activas"),
+    validada: Optional[bool] = Query(None, description="Filtrar por propiedades validadas"),
+    cursor: Optional[str] = Query(None, description="Paginación por cursor: vacío para la primera página, luego el valor de X-Next-Cursor"),
 ):
     try:
         ## Preparar filtros ######################
         filtros = {}
+        if activo is not None:
+            filtros["activo"] = activo
+        if validada is not None:
+            filtros["validada"] = validada
         if tipo:
             filtros["tipo"] = tipo
         if comuna_id:
@@ -34,28 +49,76 @@ async def get_propiedades(
             filtros["precio_hora__gte"] = precio_min
         if precio_max is not None:
             filtros["precio_hora__lte"] = precio_max
+        if capacidad_min is not None:
+            filtros["capacidad__gte"] = capacidad_min
         ##########################################
+        if cursor is not None:
+            propiedades, next_cursor = await PropiedadService.read_page(session, limit=limit, cursor=cursor, order_by=order_by, filtros=filtros)
+            if next_cursor:
+                response.headers["X-Next-Cursor"] = next_cursor
+            return propiedades
         # Leer todas las propiedades con los filtros y ordenamiento
-        propiedades = PropiedadService.read_all(session, offset=offset, limit=limit, order_by=order_by, filtros=filtros)
+        propiedades = await PropiedadService.read_all(session, offset=offset, limit=limit, order_by=order_by, filtros=filtros)
         return propiedades
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+## Calendario de ocupación por hora de varias propiedades
+@router.get("/calendario")
+async def get_calendario(
+    request: Request,
+    session: AsyncSessionDep,
+    ids: List[UUID] = Query(..., description="IDs de las propiedades (máximo 100)"),
+    desde: datetime = Query(..., description="Inicio del rango (se trunca a la hora)"),
+    hasta: datetime = Query(..., description="Fin del rango (máximo 31 días)"),
+):
+    try:
+        calendario = await ReservaService.calendario_ocupacion(session, ids, desde, hasta)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    # ETag fuerte a partir del contenido: si el calendario no cambió se responde 304 sin cuerpo
+    body = json.dumps(jsonable_encoder(calendario), separators=(",", ":"), sort_keys=True)
+    etag = '"%s"' % hashlib.sha256(body.encode()).hexdigest()[:32]
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 ## Obtener una propiedad por ID
 @router.get("/{propiedad_id}", response_model=PropiedadRead)
-async def get_propiedad(propiedad_id: UUID, session: SessionDep):
+async def get_propiedad(propiedad_id: UUID, session: AsyncSessionDep):
     try:
-        propiedad = PropiedadService.read(session, obj_id=propiedad_id)
+        propiedad = await PropiedadService.read(session, obj_id=propiedad_id)
         if not propiedad:
             raise HTTPException(status_code=404, detail="Propiedad no encontrada")
         return propiedad
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+## Horarios libres de una propiedad en un rango de fechas
+@router.get("/{propiedad_id}/disponibilidad", response_model=List[dict])
+async def get_disponibilidad(
+    propiedad_id: UUID,
+    session: AsyncSessionDep,
+    desde: datetime = Query(..., description="Inicio del rango"),
+    hasta: datetime = Query(..., description="Fin del rango (máximo 31 días)"),
+):
+    try:
+        return await ReservaService.horarios_libres(session, propiedad_id, desde, hasta)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 ## Crear una propiedad con imágenes
 @router.post("/", response_model=Propiedad, status_code=status.HTTP_201_CREATED, dependencies=[Depends(get_current_user)])
 async def create_propiedad(
-    session: SessionDep,
+    session: AsyncSessionDep,
     nombre: str | None = Form(None),
     descripcion: str = Form(...),
     direccion: str = Form(...),
@@ -101,11 +164,13 @@ async def create_propiedad(
             hora_apertura=hora_apertura,
             hora_cierre=hora_cierre
         )
-        propiedad = PropiedadService.create(session, obj=obj, images=images, documento=documento)
+        propiedad = await PropiedadService.create(session, obj=obj, images=images, documento=documento)
         # Crear relación usuario-propiedad correctamente
         usuario_propiedad = UsuarioPropiedad(usuario_id=usuario_id, propiedad_id=propiedad.id)
-        UsuarioPropiedadService.create(session, obj=usuario_propiedad)
+        await UsuarioPropiedadService.create(session, obj=usuario_propiedad)
         return propiedad
+    except ArchivoDemasiadoGrande as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -113,7 +178,7 @@ async def create_propiedad(
 @router.put("/{propiedad_id}", response_model=Propiedad, dependencies=[Depends(get_current_user)])
 async def update_propiedad(
     propiedad_id: UUID,
-    session: SessionDep,
+    session: AsyncSessionDep,
     nombre: str | None = Form(None),
     descripcion: str = Form(None),
     direccion: str = Form(None),
@@ -128,7 +193,7 @@ async def update_propiedad(
     documento: UploadFile | None = File(None)
 ):
     try:
-        propiedad: Propiedad = PropiedadService.read(session, obj_id=propiedad_id)
+        propiedad: Propiedad = await PropiedadService.read(session, obj_id=propiedad_id, options=())
         if not propiedad:
             raise HTTPException(status_code=404, detail="Propiedad no encontrada")
         
@@ -172,57 +237,74 @@ async def update_propiedad(
         
         # Primero actualizar los campos básicos
         session.add(propiedad)
-        session.commit()
-        session.refresh(propiedad)
+        await session.commit()
+        await session.refresh(propiedad)
         
         # Manejar las imágenes si se proporcionaron
         if images and any(img.filename for img in images if img):
-            propiedad = PropiedadService.update_with_images(session, propiedad_id=propiedad_id, images=images)
+            propiedad = await PropiedadService.update_with_images(session, propiedad_id=propiedad_id, images=images)
         
         # Manejar el documento si se proporcionó
         if documento and documento.filename:
-            propiedad = PropiedadService.update_document(session, propiedad_id=propiedad_id, documento=documento)
+            propiedad = await PropiedadService.update_document(session, propiedad_id=propiedad_id, documento=documento)
         
         return propiedad
+    except ArchivoDemasiadoGrande as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+## Asignar archivos subidos directo al almacenamiento (POST /api/v1/media/subidas)
+@router.post("/{propiedad_id}/media", response_model=Propiedad, dependencies=[Depends(get_current_user)])
+async def asignar_media(propiedad_id: UUID, obj: AsignarSubidasRequest, session: AsyncSessionDep):
+    try:
+        propiedad = await PropiedadService.read(session, obj_id=propiedad_id, options=())
+        if not propiedad:
+            raise HTTPException(status_code=404, detail="Propiedad no encontrada")
+        return await PropiedadService.asignar_subidas(session, propiedad_id, imagenes=obj.imagenes, documento=obj.documento)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 ## Eliminar una propiedad
 @router.delete("/{propiedad_id}", response_model=dict, dependencies=[Depends(get_current_user)])
-async def delete_propiedad(propiedad_id: UUID, session: SessionDep):
+async def delete_propiedad(propiedad_id: UUID, session: AsyncSessionDep):
     try:
-        propiedad = PropiedadService.read(session, obj_id=propiedad_id)
+        propiedad = await PropiedadService.read(session, obj_id=propiedad_id, options=())
         if not propiedad:
             raise HTTPException(status_code=404, detail="Propiedad no encontrada")
-        PropiedadService.delete(session, obj_id=propiedad_id)
+        await PropiedadService.delete(session, obj_id=propiedad_id)
         return {"ok": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 ## Validar una propiedad
 @router.post("/{propiedad_id}/validar", response_model=dict, dependencies=[Depends(get_current_user)])
-async def validate_propiedad(propiedad_id: UUID, session: SessionDep):
+async def validate_propiedad(propiedad_id: UUID, session: AsyncSessionDep):
     try:
-        propiedad: Propiedad = PropiedadService.read(session, obj_id=propiedad_id)
+        propiedad: Propiedad = await PropiedadService.read(session, obj_id=propiedad_id, options=())
         if not propiedad:
             raise HTTPException(status_code=404, detail="Propiedad no encontrada")
         if propiedad.validada:
             raise HTTPException(status_code=400, detail="La propiedad ya está validada")
         
-        result = PropiedadService.validate_property(session, propiedad_id)
+        result = await PropiedadService.validate_property(session, propiedad_id)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 ## Cambiar el estado activo de una propiedad
 @router.post("/{propiedad_id}/toggle-active", response_model=dict, dependencies=[Depends(get_current_user)])
-async def toggle_active_status(propiedad_id: UUID, session: SessionDep):
+async def toggle_active_status(propiedad_id: UUID, session: AsyncSessionDep):
     try:
-        propiedad: Propiedad = PropiedadService.read(session, obj_id=propiedad_id)
+        propiedad: Propiedad = await PropiedadService.read(session, obj_id=propiedad_id, options=())
         if not propiedad:
             raise HTTPException(status_code=404, detail="Propiedad no encontrada")
         
-        result = PropiedadService.toggle_active_status(session, propiedad_id)
+        result = await PropiedadService.toggle_active_status(session, propiedad_id)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -1,8 +1,8 @@
-from fastapi import APIRouter, HTTPException, Query, status, Depends
+from fastapi import APIRouter, HTTPException, Query, Response, status, Depends
 from fastapi.responses import JSONResponse
-from app.db import SessionDep
+from app.db import AsyncSessionDep
 from models import ReservaBase, Reserva
-from services.ReservaService import ReservaService
+from services.ReservaService import ReservaService, ReservaNoDisponible
 from typing import Annotated, Optional, List
 from uuid import UUID
 from app.Auth import get_current_user
@@ -12,22 +12,31 @@ router = APIRouter(prefix="/api/v1/reservas", tags=["Reservas"], dependencies=[D
 ## Obtener todas las reservas
 @router.get("/", response_model=List[Reserva])
 async def get_reservas(
-    session: SessionDep,
+    session: AsyncSessionDep,
+    response: Response,
     offset: int = 0,
     limit: Annotated[int, Query(le=100)] = 50,
     order_by: Optional[str] = None,
+    cursor: Optional[str] = Query(None, description="Paginación por cursor: vacío para la primera página, luego el valor de X-Next-Cursor"),
 ):
     try:
-        reservas = ReservaService.read_all(session, offset=offset, limit=limit, order_by=order_by)
+        if cursor is not None:
+            reservas, next_cursor = await ReservaService.read_page(session, limit=limit, cursor=cursor, order_by=order_by)
+            if next_cursor:
+                response.headers["X-Next-Cursor"] = next_cursor
+            return reservas
+        reservas = await ReservaService.read_all(session, offset=offset, limit=limit, order_by=order_by)
         return reservas
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 ## Obtener una reserva por ID
 @router.get("/{reserva_id}", response_model=Reserva)
-async def get_reserva(reserva_id: UUID, session: SessionDep):
+async def get_reserva(reserva_id: UUID, session: AsyncSessionDep):
     try:
-        reserva = ReservaService.read(session, obj_id=reserva_id)
+        reserva = await ReservaService.read(session, obj_id=reserva_id)
         if not reserva:
             raise HTTPException(status_code=404, detail="Reserva no encontrada")
         return reserva
@@ -36,33 +45,43 @@ async def get_reserva(reserva_id: UUID, session: SessionDep):
 
 ## Crear una reserva
 @router.post("/", response_model=Reserva)
-async def create_reserva(session: SessionDep, obj: ReservaBase):
+async def create_reserva(session: AsyncSessionDep, obj: ReservaBase):
     try:
-        reserva = ReservaService.create(session, obj=obj)
+        reserva = await ReservaService.create(session, obj=obj)
         return reserva
+    except ReservaNoDisponible as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 ## Actualizar una reserva
 @router.put("/{reserva_id}", response_model=Reserva)
-async def update_reserva(reserva_id: UUID, session: SessionDep, obj: ReservaBase):
+async def update_reserva(reserva_id: UUID, session: AsyncSessionDep, obj: ReservaBase):
     try:
-        reserva = ReservaService.read(session, obj_id=reserva_id)
+        reserva = await ReservaService.read(session, obj_id=reserva_id)
         if not reserva:
             raise HTTPException(status_code=404, detail="Reserva no encontrada")
-        reserva = ReservaService.update(session, obj=obj)
+        reserva = await ReservaService.update(session, obj=Reserva(id=reserva_id, **obj.model_dump(exclude_unset=True)))
         return reserva
+    except HTTPException:
+        raise
+    except ReservaNoDisponible as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 ## Eliminar una reserva
 @router.delete("/{reserva_id}", response_model=dict)
-async def delete_reserva(reserva_id: UUID, session: SessionDep):
+async def delete_reserva(reserva_id: UUID, session: AsyncSessionDep):
     try:
-        reserva = ReservaService.read(session, obj_id=reserva_id)
+        reserva = await ReservaService.read(session, obj_id=reserva_id)
         if not reserva:
             raise HTTPException(status_code=404, detail="Reserva no encontrada")
-        ReservaService.delete(session, obj_id=reserva_id)
+        await ReservaService.delete(session, obj_id=reserva_id)
         return {"ok": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,7 +1,7 @@
 from uuid import UUID
 from fastapi import APIRouter, HTTPException, Query, Depends
 from fastapi.responses import JSONResponse
-from app.db import SessionDep
+from app.db import AsyncSessionDep
 from models import UsuarioRead, Usuario
 from models.types import UserType
 from services.UsuarioService import UsuarioService
@@ -14,7 +14,7 @@ router = APIRouter(prefix="/api/v1/usuarios", tags=["Usuarios"], dependencies=[D
 ## Obtener todos los usuarios y filtrar por activo/inactivo
 @router.get("/", response_model=list[UsuarioRead])
 async def get_usuarios(
-    session: SessionDep,
+    session: AsyncSessionDep,
     offset: int = 0,
     limit: Annotated[int, Query(le=100)] = 50,
     order_by: str | None = None
@@ -23,18 +23,20 @@ async def get_usuarios(
         ## Preparar filtros ######################
         filtros = {}
         ##########################################
-        usuarios = UsuarioService.read_all(session=session, offset=offset, limit=limit, order_by=order_by, filtros=filtros)
+        usuarios = await UsuarioService.read_all(session=session, offset=offset, limit=limit, order_by=order_by, filtros=filtros)
         if not usuarios:
             raise HTTPException(status_code=404, detail="No se encontraron usuarios")
         return usuarios
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 ## Obtener un usuario por ID
 @router.get("/{usuario_id}", response_model=UsuarioRead)
-async def get_usuario(usuario_id: UUID, session: SessionDep):
+async def get_usuario(usuario_id: UUID, session: AsyncSessionDep):
     try:
-        usuario = UsuarioService.read(session, obj_id=usuario_id)
+        usuario = await UsuarioService.read(session, obj_id=usuario_id)
         if not usuario:
             raise HTTPException(status_code=404, detail="Usuario no encontrado")
         return usuario
@@ -43,40 +45,40 @@ async def get_usuario(usuario_id: UUID, session: SessionDep):
 
 ## Bloquear a un usuario
 @router.post("/{usuario_id}/bloquear")
-async def bloquear_usuario(usuario_id: UUID, administrador_id: UUID, motivo: str, session: SessionDep, fecha_desbloqueo: Optional[datetime] = Query(None, description="Fecha de desbloqueo (opcional)")):
+async def bloquear_usuario(usuario_id: UUID, administrador_id: UUID, motivo: str, session: AsyncSessionDep, fecha_desbloqueo: Optional[datetime] = Query(None, description="Fecha de desbloqueo (opcional)")):
     try:
-        usuario: Usuario = UsuarioService.read(session, obj_id=usuario_id)
-        isActive = UsuarioService.isActive(session, usuario_id)
+        usuario: Usuario = await UsuarioService.read(session, obj_id=usuario_id)
+        isActive = await UsuarioService.isActive(session, usuario_id)
         if not usuario:
             raise HTTPException(status_code=404, detail="Usuario no encontrado")
         if not isActive:
             raise HTTPException(status_code=400, detail="El usuario ya está bloqueado")
         
-        UsuarioService.block_user(session=session, user_id=usuario_id, motivo=motivo, fecha_desbloqueo=fecha_desbloqueo, administrador_id=administrador_id)
+        await UsuarioService.block_user(session=session, user_id=usuario_id, motivo=motivo, fecha_desbloqueo=fecha_desbloqueo, administrador_id=administrador_id)
         return JSONResponse(status_code=200, content={"message": "Usuario bloqueado exitosamente"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 ## Desbloquear a un usuario
 @router.post("/{usuario_id}/desbloquear")
-async def desbloquear_usuario(usuario_id: UUID, session: SessionDep):
+async def desbloquear_usuario(usuario_id: UUID, session: AsyncSessionDep):
     try:
-        usuario: Usuario = UsuarioService.read(session, obj_id=usuario_id)
+        usuario: Usuario = await UsuarioService.read(session, obj_id=usuario_id)
         if not usuario:
             raise HTTPException(status_code=404, detail="Usuario no encontrado")
-        if UsuarioService.isActive(session, usuario_id):
+        if await UsuarioService.isActive(session, usuario_id):
             raise HTTPException(status_code=400, detail="El usuario ya está activo")
 
-        UsuarioService.unblock_user(session, usuario_id)
+        await UsuarioService.unblock_user(session, usuario_id)
         return JSONResponse(status_code=200, content={"message": "Usuario desbloqueado exitosamente"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 ## Modificar datos de un usuario
 @router.put("/{usuario_id}", response_model=UsuarioRead)
-async def update_usuario(usuario_id: UUID, usuario_data: UsuarioRead, session: SessionDep):
+async def update_usuario(usuario_id: UUID, usuario_data: UsuarioRead, session: AsyncSessionDep):
     try:
-        usuario = UsuarioService.read(session, obj_id=usuario_id)
+        usuario = await UsuarioService.read(session, obj_id=usuario_id)
         if not usuario:
             raise HTTPException(status_code=404, detail="Usuario no encontrado")
         
@@ -84,21 +86,21 @@ async def update_usuario(usuario_id: UUID, usuario_data: UsuarioRead, session: S
         for key, value in usuario_data.model_dump(exclude_unset=True).items():
             setattr(usuario, key, value)
         
-        updated_usuario = UsuarioService.update(session, obj=usuario)
+        updated_usuario = await UsuarioService.update(session, obj=usuario)
         return updated_usuario
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 ## Cambiar tipo de usuario
 @router.put("/{usuario_id}/cambiar_tipo")
-async def cambiar_tipo_usuario(usuario_id: UUID, nuevo_tipo: UserType, session: SessionDep):
+async def cambiar_tipo_usuario(usuario_id: UUID, nuevo_tipo: UserType, session: AsyncSessionDep):
     try:
-        usuario: Usuario = UsuarioService.read(session, obj_id=usuario_id)
+        usuario: Usuario = await UsuarioService.read(session, obj_id=usuario_id)
         if not usuario:
             raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
         usuario.tipo = nuevo_tipo
-        UsuarioService.update(session, obj=usuario)
+        await UsuarioService.update(session, obj=usuario)
         return {"message": "Tipo de usuario actualizado exitosamente"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
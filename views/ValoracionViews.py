@@ -1,6 +1,6 @@
-from fastapi import APIRouter, HTTPException, Query, status, Depends
+from fastapi import APIRouter, HTTPException, Query, Response, status, Depends
 from fastapi.responses import JSONResponse
-from app.db import SessionDep
+from app.db import AsyncSessionDep
 from models import ValoracionBase, Valoracion
 from services.ValoracionService import ValoracionService
 from typing import Annotated, Optional, List
@@ -12,22 +12,31 @@ router = APIRouter(prefix="/api/v1/valoraciones", tags=["Valoraciones"])
 ## Obtener todas las valoraciones
 @router.get("/", response_model=List[Valoracion])
 async def get_valoraciones(
-    session: SessionDep,
+    session: AsyncSessionDep,
+    response: Response,
     offset: int = 0,
     limit: Annotated[int, Query(le=100)] = 50,
     order_by: Optional[str] = None,
+    cursor: Optional[str] = Query(None, description="Paginación por cursor: vacío para la primera página, luego el valor de X-Next-Cursor"),
 ):
     try:
-        valoraciones = ValoracionService.read_all(session, offset=offset, limit=limit, order_by=order_by)
+        if cursor is not None:
+            valoraciones, next_cursor = await ValoracionService.read_page(session, limit=limit, cursor=cursor, order_by=order_by)
+            if next_cursor:
+                response.headers["X-Next-Cursor"] = next_cursor
+            return valoraciones
+        valoraciones = await ValoracionService.read_all(session, offset=offset, limit=limit, order_by=order_by)
         return valoraciones
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 ## Obtener una valoracion por ID
 @router.get("/{valoracion_id}", response_model=Valoracion)
-async def get_valoracion(valoracion_id: UUID, session: SessionDep):
+async def get_valoracion(valoracion_id: UUID, session: AsyncSessionDep):
     try:
-        valoracion = ValoracionService.read(session, obj_id=valoracion_id)
+        valoracion = await ValoracionService.read(session, obj_id=valoracion_id)
         if not valoracion:
             raise HTTPException(status_code=404, detail="Valoración no encontrada")
         return valoracion
@@ -36,33 +45,33 @@ async def get_valoracion(valoracion_id: UUID, session: SessionDep):
 
 ## Crear una valoracion
 @router.post("/", response_model=Valoracion, status_code=status.HTTP_201_CREATED, dependencies=[Depends(get_current_user)])
-async def create_valoracion(session: SessionDep, obj: ValoracionBase):
+async def create_valoracion(session: AsyncSessionDep, obj: ValoracionBase):
     try:
-        valoracion = ValoracionService.create(session, obj=obj)
+        valoracion = await ValoracionService.create(session, obj=obj)
         return valoracion
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 ## Actualizar una valoracion
 @router.put("/{valoracion_id}", response_model=Valoracion, dependencies=[Depends(get_current_user)])
-async def update_valoracion(valoracion_id: UUID, session: SessionDep, obj: ValoracionBase):
+async def update_valoracion(valoracion_id: UUID, session: AsyncSessionDep, obj: ValoracionBase):
     try:
-        valoracion = ValoracionService.read(session, obj_id=valoracion_id)
+        valoracion = await ValoracionService.read(session, obj_id=valoracion_id)
         if not valoracion:
             raise HTTPException(status_code=404, detail="Valoración no encontrada")
-        valoracion = ValoracionService.update(session, obj=obj)
+        valoracion = await ValoracionService.update(session, obj=Valoracion(id=valoracion_id, **obj.model_dump(exclude_unset=True)))
         return valoracion
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 ## Eliminar una valoracion
 @router.delete("/{valoracion_id}", response_model=dict, dependencies=[Depends(get_current_user)])
-async def delete_valoracion(valoracion_id: UUID, session: SessionDep):
+async def delete_valoracion(valoracion_id: UUID, session: AsyncSessionDep):
     try:
-        valoracion = ValoracionService.read(session, obj_id=valoracion_id)
+        valoracion = await ValoracionService.read(session, obj_id=valoracion_id)
         if not valoracion:
             raise HTTPException(status_code=404, detail="Valoración no encontrada")
-        ValoracionService.delete(session, obj_id=valoracion_id)
+        await ValoracionService.delete(session, obj_id=valoracion_id)
         return {"ok": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
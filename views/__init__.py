@@ -7,6 +7,8 @@ from .BoletaViews import router as boleta_router
 from .ValoracionViews import router as valoracion_router
 from .AuthViews import router as auth_router
 from .PagoViews import router as pago_router
+from .MonitoreoViews import router as monitoreo_router
+from .MediaViews import router as media_router
 
 routers = [
     auth_router,
@@ -18,4 +20,6 @@ routers = [
     boleta_router,
     valoracion_router,
     pago_router,
+    monitoreo_router,
+    media_router,
 ]
\ No newline at end of file